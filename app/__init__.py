@@ -1,6 +1,33 @@
-from flask import Flask, send_from_directory, jsonify, abort
+from flask import Flask, Response, send_from_directory, jsonify, abort, request, g
 import os
+import time
+import unicodedata
+from urllib.parse import quote
 from werkzeug.exceptions import HTTPException
+from werkzeug.security import safe_join
+
+from constants import DOCX_MIMETYPE
+
+# 下载文档的浏览器缓存时间（秒），文档按内容命名，可以长期缓存
+DOWNLOAD_MAX_AGE = 365 * 24 * 3600
+
+
+def set_attachment(headers, download_name):
+    """
+    按 RFC 6266 设置附件的 Content-Disposition，与 send_file 的处理相同：
+    非 ASCII 文件名同时提供 ASCII 近似的 filename 和 UTF-8 编码的 filename*
+    """
+    try:
+        download_name.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", download_name)
+        simple = simple.encode("ascii", "ignore").decode("ascii")
+        quoted = quote(download_name, safe="!#$&+-.^_`|~")
+        names = {"filename": simple, "filename*": f"UTF-8''{quoted}"}
+    else:
+        names = {"filename": download_name}
+    headers.set("Content-Disposition", "attachment", **names)
+
 
 # 配置webargs错误处理器
 from webargs.flaskparser import parser as default_parser
@@ -18,6 +45,10 @@ def handle_error(error, req, schema, **kwargs):
         for location, location_errors in error.messages.items():
             if isinstance(location_errors, dict):
                 for field, field_errors in location_errors.items():
+                    if isinstance(field_errors, dict):
+                        # 嵌套字段（如批量接口的 items）按序号保留错误信息
+                        all_errors[field] = field_errors
+                        continue
                     if field not in all_errors:
                         all_errors[field] = []
                     all_errors[field].extend(field_errors)
@@ -40,10 +71,54 @@ def create_app():
     # 配置应用
     app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "dev_secret_key")
     app.config["DOWNLOAD_FOLDER"] = os.path.join(os.getcwd(), "downloads")
+    # 下载卸载模式：空（由 Flask 发送）、x-accel-redirect（nginx）或 x-sendfile（Apache）
+    app.config["DOWNLOAD_OFFLOAD"] = os.environ.get("DOWNLOAD_OFFLOAD", "").lower()
+    # X-Accel-Redirect 模式下 nginx 中对应下载目录的 internal location
+    app.config["DOWNLOAD_OFFLOAD_PREFIX"] = os.environ.get(
+        "DOWNLOAD_OFFLOAD_PREFIX", "/protected-downloads/"
+    )
+    # 后台文档任务的状态目录，多个 worker 共享
+    app.config["DOCUMENT_JOB_FOLDER"] = os.path.join(os.getcwd(), "document_jobs")
 
     # 确保下载文件夹存在
     os.makedirs(app.config["DOWNLOAD_FOLDER"], exist_ok=True)
 
+    # create_app 不启动后台线程：preload 模式下它在 gunicorn master 中执行，
+    # 文档清理线程由 config.py 的 post_worker_init、main.py 和 ASGI 的 lifespan 在服务进程中启动
+
+    # 每个请求的请求 ID 和耗时分段采样，请求 ID 写入日志并在响应头中返回
+    from app.services.tracing import (
+        REQUEST_ID_HEADER,
+        current_request_id,
+        start_request,
+    )
+
+    @app.before_request
+    def begin_request_trace():
+        start_request(request.headers.get(REQUEST_ID_HEADER))
+
+    @app.after_request
+    def add_request_id_header(response):
+        response.headers[REQUEST_ID_HEADER] = current_request_id()
+        return response
+
+    # 请求数和耗时指标，流式响应在最后一个数据块发送完毕、响应关闭时记录
+    from app.services.metrics import CONTENT_TYPE, record_request, render_metrics
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        endpoint = request.endpoint or "unmatched"
+        status = response.status_code
+        start = g.request_start
+        response.call_on_close(
+            lambda: record_request(endpoint, status, time.perf_counter() - start)
+        )
+        return response
+
     # 注册蓝图
     from app.api import api_bp
 
@@ -55,10 +130,104 @@ def create_app():
         """健康检查路由"""
         return "ok", 200
 
+    # 运行时统计（连接池等），便于确认优化是否生效
+    @app.route("/stats", methods=["GET"])
+    def runtime_stats():
+        """运行时统计路由"""
+        from app.services.upstream_client import get_pool_stats
+        from app.services.cache import translation_cache
+        from app.services.translation_memory import translation_memory
+        from app.services.document_jobs import get_document_job_stats
+        from app.services.document_storage import get_document_storage_stats
+        from app.services.document_generator import get_inline_document_stats
+        from app.services.batch import get_batch_stats
+        from app.services.singleflight import get_coalescing_stats
+        from app.services.resilience import get_resilience_stats
+        from app.services.translator import provider_router
+        from app.services.scheduler import get_admission_stats
+        from app.services.tokens import get_token_stats
+        from app.services.cancellation import get_cancellation_stats
+        from app.services.tracing import get_tracing_stats
+
+        return (
+            jsonify(
+                {
+                    "upstream_pool": get_pool_stats(),
+                    "translation_cache": translation_cache.get_stats(),
+                    "translation_memory": (
+                        translation_memory.get_stats() if translation_memory else None
+                    ),
+                    "document_jobs": get_document_job_stats(),
+                    "document_storage": get_document_storage_stats(),
+                    "document_inline": get_inline_document_stats(),
+                    "batch": get_batch_stats(),
+                    "coalescing": get_coalescing_stats(),
+                    "upstream_resilience": get_resilience_stats(),
+                    "upstream_providers": provider_router.get_stats(),
+                    "upstream_admission": get_admission_stats(),
+                    "output_tokens": get_token_stats(),
+                    "stream_cancellation": get_cancellation_stats(),
+                    "tracing": get_tracing_stats(),
+                }
+            ),
+            200,
+        )
+
+    # Prometheus 指标，汇总所有 worker
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        """Prometheus 指标路由"""
+        return Response(render_metrics(), content_type=CONTENT_TYPE)
+
     # 静态文件路由
     @app.route("/downloads/<path:filename>")
     def download_file(filename):
-        """提供下载文件的路由"""
-        return send_from_directory(app.config["DOWNLOAD_FOLDER"], filename)
+        """
+        提供下载文件的路由
+
+        按内容命名的文档内容不会变化，因此用文件名中的摘要作为强 ETag 并返回长期缓存头，
+        支持 If-None-Match 和 Range 请求。配置 DOWNLOAD_OFFLOAD 后由前端代理
+        （nginx 的 X-Accel-Redirect 或 Apache 的 X-Sendfile）直接发送文件，
+        worker 不再读写文件内容。
+        """
+        from app.services.document_storage import document_etag
+
+        path = safe_join(app.config["DOWNLOAD_FOLDER"], filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        etag = document_etag(os.path.basename(path))
+
+        offload = app.config["DOWNLOAD_OFFLOAD"]
+        if etag is not None and request.if_none_match.contains(etag):
+            # 客户端已有相同内容，不再打开文件
+            response = Response(status=304)
+            response.set_etag(etag)
+        elif offload:
+            response = Response(mimetype=DOCX_MIMETYPE)
+            if etag is not None:
+                response.set_etag(etag)
+            set_attachment(response.headers, os.path.basename(path))
+            if offload == "x-accel-redirect":
+                response.headers["X-Accel-Redirect"] = (
+                    app.config["DOWNLOAD_OFFLOAD_PREFIX"].rstrip("/")
+                    + "/"
+                    + quote(filename)
+                )
+            else:
+                response.headers["X-Sendfile"] = path
+            response = response.make_conditional(request)
+        else:
+            response = send_from_directory(
+                app.config["DOWNLOAD_FOLDER"],
+                filename,
+                etag=etag if etag is not None else True,
+                conditional=True,
+                max_age=DOWNLOAD_MAX_AGE if etag is not None else None,
+            )
+        if etag is not None:
+            response.cache_control.public = True
+            response.cache_control.max_age = DOWNLOAD_MAX_AGE
+            response.cache_control.immutable = True
+        return response
 
     return app
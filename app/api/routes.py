@@ -1,24 +1,82 @@
-from flask import jsonify, Response, stream_with_context
+from flask import (
+    jsonify,
+    Response,
+    stream_with_context,
+    current_app,
+    send_file,
+    request,
+)
 from app.api import api_bp
 from app.services.translator import (
     translate_with_vocabulary,
     translate_with_vocabulary_stream,
 )
-from app.services.document_generator import generate_word_document_url
+from app.services.document_generator import (
+    generate_word_document_url,
+    render_word_document,
+    DocumentTooLarge,
+)
+from app.services.document_storage import document_filename
+from app.services.document_jobs import start_document_job, get_document_job
+from app.services.batch import translate_batch, translate_ndjson, BATCH_MAX_ITEMS
+from app.services.resilience import UpstreamUnavailable
+from app.services.cancellation import record_client_disconnect
 import logging
 import json
 
 from webargs import fields, validate
 from webargs.flaskparser import use_args
 
-from constants import MAX_TEXT_LENGTH
+from constants import MAX_TEXT_LENGTH, DOCX_MIMETYPE
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
 
+def build_inline_document_response(text, translation, vocabulary):
+    """
+    在内存中生成Word文档并直接作为响应体返回
+
+    参数:
+    - text: 原始文本
+    - translation: 翻译结果
+    - vocabulary: 词汇表
+
+    返回:
+    - Word文档响应；文档超过大小上限时返回 413 错误
+    """
+    try:
+        buffer = render_word_document(text, translation, vocabulary)
+    except DocumentTooLarge as e:
+        logger.warning("内存文档超过大小上限: %s", e)
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": f"{str(e)}，请使用 output_format=word",
+                }
+            ),
+            413,
+        )
+
+    size = buffer.getbuffer().nbytes
+    response = send_file(
+        buffer,
+        mimetype=DOCX_MIMETYPE,
+        as_attachment=True,
+        download_name=document_filename(text, translation, vocabulary),
+    )
+    response.headers["X-Document-Size"] = str(size)
+    return response
+
+
 def build_translation_response(
-    translation, vocabulary, include_vocabulary, output_format, text
+    translation,
+    vocabulary,
+    include_vocabulary,
+    output_format,
+    text,
+    async_document=False,
 ):
     """
     构建翻译响应
@@ -29,6 +87,7 @@ def build_translation_response(
     - include_vocabulary: 是否包含词汇表
     - output_format: 输出格式
     - text: 原始文本
+    - async_document: 是否在后台生成Word文档
 
     返回:
     - 翻译响应字典
@@ -39,13 +98,23 @@ def build_translation_response(
     # 如果需要词汇表，且成功提取了词汇
     if include_vocabulary and vocabulary:
         response["vocabulary"] = vocabulary
-        logger.info(f"词汇提取完成，共提取 {len(vocabulary)} 个词汇")
+        logger.info("词汇提取完成，共提取 %s 个词汇", len(vocabulary))
 
     # 如果需要Word文档
     if output_format == "word":
-        response["word_document_url"] = generate_word_document_url(
-            text, translation, vocabulary
+        # 后台生成时立即返回任务句柄，队列已满时退回同步生成
+        job = (
+            start_document_job(text, translation, vocabulary)
+            if async_document
+            else None
         )
+        if job is not None:
+            response["word_document_url"] = job["word_document_url"]
+            response["word_document_job"] = job
+        else:
+            response["word_document_url"] = generate_word_document_url(
+                text, translation, vocabulary
+            )
 
     return response
 
@@ -59,17 +128,20 @@ translate_args = {
         ),
         error_messages={"required": "缺少必要参数 'text'"},
     ),
-    # 输出格式，可选值为'json'或'word'，默认为'json'
+    # 输出格式，可选值为'json'、'word'或'word_inline'，默认为'json'
     "output_format": fields.Str(
         load_default="json",
         validate=validate.OneOf(
-            ["json", "word"], error="无效的输出格式，必须是 'json' 或 'word'"
+            ["json", "word", "word_inline"],
+            error="无效的输出格式，必须是 'json'、'word' 或 'word_inline'",
         ),
     ),
     # 是否包含词汇表，默认为False
     "include_vocabulary": fields.Bool(load_default=False),
     # 是否启用流式响应，默认为False
     "streaming": fields.Bool(load_default=False),
+    # 是否在后台生成Word文档并立即返回任务句柄，默认为False
+    "async_document": fields.Bool(load_default=False),
 }
 
 
@@ -81,37 +153,169 @@ def translate(args):
 
     请求体参数:
     - text: 要翻译的英文文本
-    - output_format: 输出格式，可选值为'json'或'word'，默认为'json'
+    - output_format: 输出格式，可选值为'json'、'word'或'word_inline'，默认为'json'
     - include_vocabulary: 是否包含词汇表，默认为False
+    - async_document: 是否在后台生成Word文档，默认为False
 
     返回:
-    - 翻译结果，包括翻译文本、词汇表（如果请求）和Word文档URL（如果请求）
+    - 翻译结果，包括翻译文本、词汇表（如果请求）和Word文档URL（如果请求）；
+      output_format 为 word_inline 时直接返回Word文档
     """
     try:
         # 获取参数，设置默认值
         text = args.get("text")
         output_format = args.get("output_format", "json")
         include_vocabulary = args.get("include_vocabulary", False)
+        async_document = args.get("async_document", False)
 
-        logger.info(f"接收到翻译请求，文本长度: {len(text)} 字符")
+        logger.info("接收到翻译请求，文本长度: %s 字符", len(text))
 
         # 执行翻译，如果需要则同时提取词汇表
         translation, vocabulary = translate_with_vocabulary(text, include_vocabulary)
 
+        # 直接返回内存中生成的Word文档，省去写盘和再次下载
+        if output_format == "word_inline":
+            response = build_inline_document_response(text, translation, vocabulary)
+            logger.info("翻译请求处理完成")
+            return response
+
         # 构建响应
         response = build_translation_response(
-            translation, vocabulary, include_vocabulary, output_format, text
+            translation,
+            vocabulary,
+            include_vocabulary,
+            output_format,
+            text,
+            async_document,
         )
 
         logger.info("翻译请求处理完成")
         return jsonify(response), 200
 
+    except UpstreamUnavailable as e:
+        # 上游熔断，提示客户端稍后重试
+        logger.warning("翻译请求被熔断: %s", e)
+        return (
+            jsonify({"success": False, "error": str(e)}),
+            503,
+            {"Retry-After": str(int(e.retry_after) + 1)},
+        )
     except Exception as e:
         # 记录错误并返回错误响应
-        logger.error(f"翻译请求处理错误: {str(e)}")
+        logger.error("翻译请求处理错误: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+batch_item_args = {
+    "text": translate_args["text"],
+    # 批量接口只返回 JSON，不支持 word_inline
+    "output_format": fields.Str(
+        load_default="json",
+        validate=validate.OneOf(
+            ["json", "word"], error="无效的输出格式，必须是 'json' 或 'word'"
+        ),
+    ),
+    "include_vocabulary": translate_args["include_vocabulary"],
+    "async_document": translate_args["async_document"],
+}
+
+batch_args = {
+    "items": fields.List(
+        fields.Nested(batch_item_args),
+        required=True,
+        validate=validate.Length(
+            min=1,
+            max=BATCH_MAX_ITEMS,
+            error=f"条目数必须在 1 到 {BATCH_MAX_ITEMS} 之间",
+        ),
+        error_messages={"required": "缺少必要参数 'items'"},
+    ),
+}
+
+
+@api_bp.route("/v1/translate/batch", methods=["POST"])
+@use_args(batch_args)
+def translate_batch_api(args):
+    """
+    批量翻译API端点
+
+    请求体参数:
+    - items: 条目列表，每个条目的参数与 /v1/translate 相同（text、output_format、
+      include_vocabulary、async_document），output_format 不支持 word_inline
+
+    返回:
+    - results: 与 items 顺序一致的翻译结果，每个结果的格式与 /v1/translate 相同，
+      另外包含 latency_ms；单个条目失败时 success 为 false
+    - stats: 去重、合并请求和节省的上游请求数等统计
+    """
+    try:
+        items = args["items"]
+        logger.info("接收到批量翻译请求，条目数: %s", len(items))
+
+        results, stats = translate_batch(items)
+
+        responses = []
+        for item, result in zip(items, results):
+            if result["error"] is not None:
+                response = {"success": False, "error": result["error"]}
+            else:
+                try:
+                    response = build_translation_response(
+                        result["translation"],
+                        result["vocabulary"],
+                        item["include_vocabulary"],
+                        item["output_format"],
+                        item["text"],
+                        item["async_document"],
+                    )
+                except Exception as e:
+                    logger.error("批量翻译条目处理错误: %s", e)
+                    response = {"success": False, "error": str(e)}
+            response["latency_ms"] = result["latency_ms"]
+            responses.append(response)
+
+        logger.info("批量翻译请求处理完成")
+        return jsonify({"success": True, "results": responses, "stats": stats}), 200
+
+    except Exception as e:
+        # 记录错误并返回错误响应
+        logger.error("批量翻译请求处理错误: %s", e)
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@api_bp.route("/v1/translate/stream", methods=["POST"])
+def translate_ndjson_stream():
+    """
+    NDJSON 流式批量翻译API端点
+
+    请求体为 NDJSON，每行一个记录：{"id": ..., "text": ..., "include_vocabulary": false}。
+    服务端逐行读取请求体，上游并发请求数有上限，窗口已满时暂停读取，
+    适合翻译大规模语料而不占用与输入大小成正比的内存。
+
+    返回:
+    - NDJSON，每行一个结果，按完成顺序输出：
+      {"id", "success", "translation", "vocabulary", "latency_ms"}；
+      无法解析的输入行返回 {"id": null, "line", "success": false, "error"}
+    """
+    logger.info("接收到NDJSON流式批量翻译请求")
+    stream = request.stream
+
+    @stream_with_context
+    def generate():
+        try:
+            for result in translate_ndjson(stream, MAX_TEXT_LENGTH):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error("NDJSON流式批量翻译处理错误: %s", e)
+            yield json.dumps({"success": False, "error": str(e)}) + "\n"
+
+    return Response(
+        generate(),
+        content_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
 @api_bp.route("/v2/translate", methods=["POST"])
 @use_args(translate_args)
 def translate_stream(args):
@@ -121,6 +325,10 @@ def translate_stream(args):
     请求体参数:
     - text: 要翻译的英文文本
     - include_vocabulary: 是否包含词汇表，默认为False
+    - async_document: 是否在后台生成Word文档，默认为False
+
+    流式响应无法携带二进制文档，output_format 为 word_inline 时按 word 处理，
+    在流结束前返回文档下载地址。
 
     返回:
     - 流式翻译结果
@@ -129,25 +337,42 @@ def translate_stream(args):
         # 获取参数，设置默认值
         text = args.get("text")
         output_format = args.get("output_format", "json")
+        if output_format == "word_inline":
+            output_format = "word"
         include_vocabulary = args.get("include_vocabulary", False)
+        async_document = args.get("async_document", False)
 
-        logger.info(f"接收到流式翻译请求，文本长度: {len(text)} 字符")
+        logger.info("接收到流式翻译请求，文本长度: %s 字符", len(text))
 
         # 定义流式响应的生成器函数
         @stream_with_context
         def generate():
             error_occurred = False
+            # 调用流式翻译服务
+            stream = translate_with_vocabulary_stream(
+                text,
+                output_format,
+                include_vocabulary,
+                async_document=async_document,
+            )
             try:
-                # 调用流式翻译服务
-                for chunk in translate_with_vocabulary_stream(
-                    text, output_format, include_vocabulary
-                ):
+                for chunk in stream:
                     yield f"data: {json.dumps(chunk)}\n\n"
+            except GeneratorExit:
+                # 客户端断开（写入失败时服务器会关闭响应生成器），立即关闭上游流，
+                # 跳过后续的Word文档生成
+                record_client_disconnect()
+                logger.info("客户端已断开，取消流式翻译")
+                raise
             except Exception as e:
                 error_occurred = True
-                logger.error(f"流式翻译请求处理错误: {str(e)}")
+                logger.error("流式翻译请求处理错误: %s", e)
                 yield f"data: {json.dumps({'success': False, 'type': 'error', 'error': str(e)})}\n\n"
 
+            finally:
+                if hasattr(stream, "close"):
+                    stream.close()
+
             if not error_occurred:
                 yield "data: [DONE]\n\n"
 
@@ -160,5 +385,28 @@ def translate_stream(args):
 
     except Exception as e:
         # 记录错误并返回错误响应
-        logger.error(f"流式翻译请求处理错误: {str(e)}")
+        logger.error("流式翻译请求处理错误: %s", e)
         return jsonify({"success": False, "error": str(e)}), 500
+
+
+@api_bp.route("/v1/documents/<job_id>", methods=["GET"])
+def document_job_status(job_id):
+    """
+    查询后台Word文档任务状态
+
+    返回:
+    - 任务状态，status 为 done 时可通过 word_document_url 下载文档
+    """
+    job = get_document_job(current_app.config["DOCUMENT_JOB_FOLDER"], job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "文档任务不存在"}), 404
+
+    response = {
+        "success": True,
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "word_document_url": job["word_document_url"],
+    }
+    if job.get("error"):
+        response["error"] = job["error"]
+    return jsonify(response), 200
@@ -0,0 +1,289 @@
+import json
+import time
+import asyncio
+import logging
+
+from marshmallow import Schema, ValidationError
+
+from app.api.routes import translate_args
+from app.services.async_translator import translate_with_vocabulary_stream
+from app.services.async_upstream_client import close_client
+from app.services.cancellation import record_client_disconnect
+from app.services.document_storage import start_document_janitor
+from app.services.tracing import REQUEST_ID_HEADER, request_context
+from app.services.metrics import record_request
+from constants import MAX_TEXT_LENGTH
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:  # 未安装 asgiref 时 ASGI 入口只提供流式翻译接口
+    WsgiToAsgi = None
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 由 asyncio 实现处理的流式翻译接口，其余请求转交给 Flask 应用
+STREAM_PATH = "/api/v2/translate"
+# 请求指标中使用的端点名称，与 Flask 中同一接口的端点名称相同
+STREAM_ENDPOINT = "api.translate_stream"
+# 发送响应之前客户端已断开时记录的状态码
+CLIENT_CLOSED_STATUS = 499
+
+# 请求体大小上限（字节）：文本长度上限按每个字符最多 4 字节（UTF-8）计算，
+# 另外留出 JSON 中其他参数和转义的余量
+MAX_BODY_BYTES = MAX_TEXT_LENGTH * 4 + 16 * 1024
+
+# 与 Flask 接口使用相同的参数定义和校验规则
+TranslateSchema = Schema.from_dict(translate_args, name="TranslateSchema")
+
+
+class RequestBodyTooLarge(Exception):
+    """请求体超过大小上限"""
+
+
+async def read_body(receive, max_bytes=MAX_BODY_BYTES):
+    """
+    读取完整的请求体
+
+    参数:
+    receive: ASGI receive 函数
+    max_bytes (int): 请求体大小上限（字节）
+
+    返回:
+    bytes: 请求体；客户端断开时返回 None
+
+    异常:
+    RequestBodyTooLarge: 请求体超过大小上限，超出后不再继续读取
+    """
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > max_bytes:
+            raise RequestBodyTooLarge(f"请求体超过 {max_bytes} 字节")
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def send_json(send, status, body, headers=()):
+    """发送 JSON 响应"""
+    data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(data)).encode()),
+                *headers,
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": data})
+
+
+def parse_translate_args(body):
+    """
+    按 translate_args 校验请求体
+
+    参数:
+    body (bytes): 请求体
+
+    返回:
+    tuple: (args, errors)，校验失败时 args 为 None，errors 与 Flask 接口的错误格式相同
+    """
+    try:
+        data = json.loads(body) if body else {}
+    except ValueError:
+        return None, {"json": ["Invalid JSON body."]}
+    if not isinstance(data, dict):
+        return None, {"json": ["Invalid JSON body."]}
+    try:
+        return TranslateSchema().load(data), None
+    except ValidationError as e:
+        return None, e.messages
+
+
+def request_header(scope, name):
+    """读取请求头，不存在时返回 None"""
+    name = name.lower().encode("latin-1")
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def translate_stream(scope, receive, send, config):
+    """
+    翻译文本API端点（asyncio 流式响应版本）
+
+    请求参数、校验规则和 SSE 输出与 Flask 的 /api/v2/translate 相同。
+    客户端断开时取消翻译协程，上游连接随之关闭。
+    协程中没有 Flask 应用上下文，Word文档的保存目录从 config（Flask 应用的配置）中读取后显式传入。
+    """
+    start = time.perf_counter()
+    status = CLIENT_CLOSED_STATUS
+
+    async def send_and_track(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        await send(message)
+
+    try:
+        # 翻译协程由 ensure_future 创建，复制当前上下文，请求 ID 随之传递
+        with request_context(request_header(scope, REQUEST_ID_HEADER)) as request_id:
+            await handle_translate_stream(receive, send_and_track, request_id, config)
+    finally:
+        record_request(STREAM_ENDPOINT, status, time.perf_counter() - start)
+
+
+async def handle_translate_stream(receive, send, request_id, config):
+    request_id_header = (REQUEST_ID_HEADER.lower().encode(), request_id.encode())
+    try:
+        body = await read_body(receive)
+    except RequestBodyTooLarge as e:
+        await send_json(
+            send,
+            413,
+            {"success": False, "error": str(e)},
+            [request_id_header],
+        )
+        return
+    if body is None:
+        return
+    args, errors = parse_translate_args(body)
+    if errors is not None:
+        await send_json(
+            send,
+            400,
+            {"success": False, "error": errors},
+            [request_id_header],
+        )
+        return
+
+    output_format = args["output_format"]
+    if output_format == "word_inline":
+        # 流式响应无法携带二进制文档，按 word 处理
+        output_format = "word"
+    logger.info("接收到异步流式翻译请求，文本长度: %s 字符", len(args["text"]))
+
+    async def send_event(data):
+        await send(
+            {
+                "type": "http.response.body",
+                "body": f"data: {data}\n\n".encode("utf-8"),
+                "more_body": True,
+            }
+        )
+
+    async def generate():
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"connection", b"keep-alive"),
+                    request_id_header,
+                ],
+            }
+        )
+        error_occurred = False
+        stream = translate_with_vocabulary_stream(
+            args["text"],
+            output_format,
+            args["include_vocabulary"],
+            async_document=args["async_document"],
+            download_folder=config["DOWNLOAD_FOLDER"],
+            job_folder=config["DOCUMENT_JOB_FOLDER"],
+        )
+        try:
+            async for chunk in stream:
+                await send_event(json.dumps(chunk))
+        except Exception as e:
+            error_occurred = True
+            logger.error("流式翻译请求处理错误: %s", e)
+            await send_event(
+                json.dumps({"success": False, "type": "error", "error": str(e)})
+            )
+        finally:
+            await stream.aclose()
+
+        if not error_occurred:
+            await send_event("[DONE]")
+        await send({"type": "http.response.body", "body": b""})
+
+    async def wait_for_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    producer = asyncio.ensure_future(generate())
+    watcher = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await asyncio.wait({producer, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not producer.done():
+            # 客户端断开，取消翻译协程，立即关闭上游流并跳过后续的Word文档生成
+            record_client_disconnect()
+            logger.info("客户端已断开，取消流式翻译")
+            producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+
+async def lifespan(receive, send, config):
+    """处理 ASGI lifespan 事件：启动时在当前进程中启动文档清理线程，关闭时释放上游连接池"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            start_document_janitor(config["DOWNLOAD_FOLDER"])
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def create_asgi_app(wsgi_app=None):
+    """
+    创建 ASGI 应用
+
+    POST /api/v2/translate 由 asyncio 实现处理，每个打开的流是一个协程；
+    其余请求通过 asgiref 转交给 Flask 应用，在线程池中执行
+
+    参数:
+    wsgi_app: 处理其余请求的 WSGI 应用，为 None 时创建 Flask 应用
+
+    返回:
+    callable: ASGI 应用
+    """
+    if wsgi_app is None:
+        from app import create_app
+
+        wsgi_app = create_app()
+    fallback = WsgiToAsgi(wsgi_app) if WsgiToAsgi is not None else None
+
+    async def application(scope, receive, send):
+        if scope["type"] == "lifespan":
+            await lifespan(receive, send, wsgi_app.config)
+            return
+        if (
+            scope["type"] == "http"
+            and scope["path"] == STREAM_PATH
+            and scope["method"] == "POST"
+        ):
+            await translate_stream(scope, receive, send, wsgi_app.config)
+            return
+        if fallback is None:
+            await send_json(send, 404, {"success": False, "error": "Not Found"})
+            return
+        await fallback(scope, receive, send)
+
+    return application
@@ -0,0 +1,413 @@
+import json
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+
+import requests
+
+from app.services.async_upstream_client import stream_post, as_requests_error
+from app.services.resilience import is_retryable, UpstreamRejected
+from app.services.scheduler import PRIORITY_INTERACTIVE, upstream_scheduler
+from app.services.providers import MODE_STREAM
+from app.services.cache import translation_cache
+from app.services.chunker import (
+    TRANSLATION_CHUNK_TOKENS,
+    TRANSLATION_VOCABULARY_MAX_TERMS,
+    TRANSLATION_CHUNK_CONCURRENCY,
+    split_into_chunks,
+    join_chunk_translations,
+    merge_vocabularies,
+)
+from app.services.tokens import estimate_tokens, output_token_budget, record_truncation
+from app.services.cancellation import record_upstream_cancelled, record_document_skipped
+from app.services.stream_mux import TRANSLATION_STREAM_BUFFER_EVENTS
+from app.services.stream_parser import SeparatorStreamParser, VocabularyStreamParser
+from app.services.tracing import span
+from app.services.metrics import UpstreamStreamTimer
+from app.services import translator
+from app.services.translator import (
+    SEPARATOR,
+    STREAM_DONE,
+    get_translation_prompts,
+    get_payload,
+    get_cache_key,
+    continuation_payload,
+    estimate_payload_tokens,
+    failed_vocabulary,
+    cache_translation,
+    replay_cached_translation,
+    parse_stream_line,
+    choice_events,
+    stream_result,
+    translate_chunk,
+    word_document_chunk,
+)
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+async def open_stream(payload):
+    """
+    选择上游并建立流式连接
+
+    连接失败（尚未输出任何数据块）时换下一个上游重试，所有上游都失败时抛出最后的异常
+
+    参数:
+    payload (dict): 流式请求体
+
+    返回:
+    tuple: (provider, response, stack)，关闭 stack 时关闭响应
+    """
+    provider_router = translator.provider_router
+    tried = set()
+    while True:
+        provider = provider_router.select(MODE_STREAM, exclude=tried)
+        tried.add(provider.name)
+        stack = AsyncExitStack()
+        try:
+            with provider_router.track(provider, MODE_STREAM):
+                response = await stack.enter_async_context(
+                    stream_post(
+                        provider.url,
+                        json=provider.payload(payload),
+                        headers=provider.headers(),
+                    )
+                )
+            return provider, response, stack
+        except Exception as e:
+            await stack.aclose()
+            if not is_retryable(e) or len(tried) >= len(provider_router.providers):
+                raise
+            logger.warning("上游 %s 流式连接失败，换用其他上游", provider.name)
+
+
+async def stream_round(payload, parser, vocabulary_parser, state):
+    """
+    发送一次流式请求，将输出交给解析器
+
+    参数:
+    payload (dict): 流式请求体
+    parser (SeparatorStreamParser): 翻译和词汇表的分隔解析器
+    vocabulary_parser (VocabularyStreamParser): 词汇表增量解析器
+    state (dict): 结束时写入 completed（上游流是否完整结束）和 truncated（输出是否达到 max_tokens）
+
+    返回:
+    async generator: 逐个产出数据块
+    """
+    state["completed"] = False
+    state["truncated"] = False
+    timer = UpstreamStreamTimer()
+    offset = len(parser.content)
+    # 已输出的数据块无法撤回，流式请求只在建立连接时换上游重试
+    with span("upstream_ttfb"):
+        provider, response, stack = await open_stream(payload)
+    async with stack:
+        try:
+            with span("upstream_stream", provider=provider.name):
+                # 逐行处理流式响应
+                async for line in response.aiter_lines():
+                    choice = parse_stream_line(line)
+                    # 终止信号
+                    if choice == STREAM_DONE:
+                        state["completed"] = True
+                        break
+                    if choice is None:
+                        continue
+                    if choice.get("finish_reason") == "length":
+                        state["truncated"] = True
+                    if (choice.get("delta") or {}).get("content"):
+                        timer.token()
+                    for event in choice_events(choice, parser, vocabulary_parser):
+                        yield event
+        except Exception as e:
+            error = as_requests_error(e)
+            provider.record_failure(error)
+            if error is e:
+                raise
+            raise error from e
+        finally:
+            timer.finish(provider.name, estimate_tokens(parser.content[offset:]))
+
+
+async def stream_chunk(text, include_vocabulary, result):
+    """
+    流式翻译单个分块（不经过缓存）
+
+    参数:
+    text (str): 要翻译的英文文本
+    include_vocabulary (bool): 是否同时提取专业词汇
+    result (dict): 结束时写入 translation、vocabulary 和 completed（上游流是否完整结束）
+
+    返回:
+    async generator: 逐个产出翻译和词汇数据块
+    """
+    with span("prompt_build", chars=len(text)):
+        # 获取翻译所需的prompt模板
+        system_prompt, user_prompt = get_translation_prompts(text, include_vocabulary)
+
+        # 构建请求数据
+        payload = get_payload(
+            system_prompt,
+            user_prompt,
+            stream=True,
+            max_tokens=output_token_budget(text, include_vocabulary),
+        )
+
+    parser = SeparatorStreamParser(SEPARATOR, detect_separator=include_vocabulary)
+    vocabulary_parser = VocabularyStreamParser()
+    state = {"completed": False, "truncated": False}
+    logger.info(
+        "发送异步流式翻译请求到DeepSeek API，文本长度: %s 字符, 包含词汇表: %s",
+        len(text),
+        include_vocabulary,
+    )
+
+    # 流式请求属于交互式请求，整个流期间占用名额
+    async with upstream_scheduler.admit_async(
+        estimate_payload_tokens(payload), PRIORITY_INTERACTIVE
+    ):
+        request_payload = payload
+        try:
+            for continuation in range(translator.TRANSLATION_MAX_CONTINUATIONS + 1):
+                if continuation:
+                    # 输出被截断，把已生成的内容交给模型从中断处继续，新内容接着输出
+                    logger.warning(
+                        "上游输出达到 max_tokens 被截断，第 %s 次续写", continuation
+                    )
+                    request_payload = continuation_payload(payload, parser.content)
+                async for event in stream_round(
+                    request_payload, parser, vocabulary_parser, state
+                ):
+                    yield event
+                if not state["truncated"]:
+                    break
+                record_truncation(
+                    continuation < translator.TRANSLATION_MAX_CONTINUATIONS
+                )
+        except (GeneratorExit, asyncio.CancelledError):
+            # 客户端断开：协程被取消，上游响应随 async with 关闭
+            tokens_saved = payload["max_tokens"] - estimate_tokens(parser.content)
+            record_upstream_cancelled(tokens_saved)
+            logger.info("客户端断开，已取消上游流，估算节省 %s 个令牌", tokens_saved)
+            raise
+
+    for event in parser.finish():
+        yield event
+
+    translation, vocabulary_list = stream_result(
+        parser, vocabulary_parser, include_vocabulary
+    )
+    # 续写次数用完仍被截断的结果不完整，不写入缓存
+    result.update(
+        translation=translation,
+        vocabulary=vocabulary_list,
+        completed=state["completed"] and not state["truncated"],
+    )
+
+
+async def stream_chunks_ordered(chunks, include_vocabulary, result):
+    """
+    并发流式翻译多个分块，并按原顺序输出
+
+    与 OrderedStreamMux 相同：第一个分块实时输出，后续分块缓冲到有界队列中，
+    队列写满时该分块暂停读取上游；分块在输出任何数据块之前失败时改用非流式翻译。
+
+    参数:
+    chunks (list): split_into_chunks 返回的 [(chunk, separator), ...]
+    include_vocabulary (bool): 是否同时提取专业词汇
+    result (dict): 结束时写入 translation、vocabulary 和 completed
+
+    返回:
+    async generator: 逐个产出数据块
+    """
+    count = len(chunks)
+    results = [None] * count
+    queues = [asyncio.Queue(TRANSLATION_STREAM_BUFFER_EVENTS) for _ in range(count)]
+    delivered = [False] * count
+    failed = set()
+    # 按分块顺序获取名额，轮到输出的分块一定已经开始读取
+    semaphore = asyncio.Semaphore(max(1, TRANSLATION_CHUNK_CONCURRENCY))
+
+    async def recover(index, error):
+        """分块出错时尝试用非流式翻译替换，无法替换时输出 error 数据块"""
+        if not delivered[index]:
+            while not queues[index].empty():
+                queues[index].get_nowait()
+            logger.warning("分块 %s 流式翻译失败，改用备用方式: %s", index, error)
+            try:
+                translation, vocabulary_list = await asyncio.to_thread(
+                    translate_chunk, chunks[index][0], include_vocabulary
+                )
+                results[index] = (translation, vocabulary_list, True)
+                await queues[index].put({"type": "chunk", "translation": translation})
+                return
+            except Exception as e:
+                error = e
+        logger.error("分块 %s 流式翻译失败: %s", index, error)
+        failed.add(index)
+        await queues[index].put({"type": "error", "chunk": index, "error": str(error)})
+
+    async def produce(index):
+        async with semaphore:
+            try:
+                outcome = {}
+                async for event in stream_chunk(
+                    chunks[index][0], include_vocabulary, outcome
+                ):
+                    await queues[index].put(event)
+                results[index] = (
+                    outcome["translation"],
+                    outcome["vocabulary"],
+                    outcome["completed"],
+                )
+            except Exception as e:
+                await recover(index, e)
+            # 被取消时没有人再读取队列，不写入结束标记
+            await queues[index].put(None)
+
+    logger.info("切分为 %s 个分块并发异步流式翻译", count)
+    tasks = [asyncio.create_task(produce(index)) for index in range(count)]
+    seen_terms = set()
+    try:
+        for index in range(count):
+            while True:
+                event = await queues[index].get()
+                if event is None:
+                    break
+                delivered[index] = True
+                # 不同分块提取的相同术语只输出一次，总数不超过合并后词汇表的上限
+                if event.get("type") == "term":
+                    key = event["term"]["english"].strip().lower()
+                    if (
+                        key not in seen_terms
+                        and len(seen_terms) < TRANSLATION_VOCABULARY_MAX_TERMS
+                    ):
+                        seen_terms.add(key)
+                        yield event
+                    continue
+                # 各分块的原始词汇片段无法拼成合法的JSON，最后统一输出合并后的词汇表
+                event.pop("vocabulary", None)
+                if len(event) > 1:
+                    yield event
+    finally:
+        # 客户端断开或出错时取消所有分块的上游流，等待取消完成，名额和连接归还后再返回
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    translation = join_chunk_translations(
+        [item[0] if item else "" for item in results],
+        [chunk[1] for chunk in chunks],
+    )
+    vocabulary_list = merge_vocabularies(
+        [item[1] for item in results if item], ignored=failed_vocabulary()
+    )
+    if include_vocabulary:
+        if vocabulary_list:
+            yield {
+                "type": "chunk",
+                "vocabulary": json.dumps(vocabulary_list, ensure_ascii=False),
+            }
+        else:
+            vocabulary_list = failed_vocabulary()
+    result.update(
+        translation=translation,
+        vocabulary=vocabulary_list,
+        completed=not failed and all(item and item[2] for item in results),
+    )
+
+
+async def translate_with_vocabulary_stream(
+    text,
+    output_format="json",
+    include_vocabulary=False,
+    async_document=False,
+    download_folder=None,
+    job_folder=None,
+):
+    """
+    使用DeepSeek API将英文文本翻译为中文，并可选地提取专业词汇（asyncio 流式版本）
+
+    参数和输出的数据块与 app.services.translator.translate_with_vocabulary_stream 相同，
+    共用提示词、缓存、上游路由和准入调度。每个打开的流是一个协程，客户端断开时取消协程即可
+    关闭上游连接。相同的进行中流不合并，各自请求上游；缓存读写和Word文档生成在线程池中执行，
+    不阻塞事件循环。
+
+    参数:
+    text (str): 要翻译的英文文本
+    output_format (str): 输出格式，'word' 时在翻译结束后生成Word文档
+    include_vocabulary (bool): 是否同时提取专业词汇
+    async_document (bool): 是否在后台生成Word文档，立即返回任务句柄
+    download_folder (str): Word文档保存目录，线程池中没有应用上下文，ASGI 入口需要显式传入
+    job_folder (str): 后台文档任务的状态目录，同上
+
+    返回:
+    async generator: 流式返回翻译结果的异步生成器
+    """
+    translation = None
+    try:
+        # 命中缓存时以合成数据块回放，不再请求上游
+        cache_key = get_cache_key(text, include_vocabulary)
+        cached = await asyncio.to_thread(translation_cache.get, cache_key)
+        if cached is not None:
+            logger.info("命中翻译缓存，回放缓存结果")
+            translation, vocabulary_list = cached
+            for event in replay_cached_translation(
+                translation, vocabulary_list, include_vocabulary
+            ):
+                yield event
+        else:
+            # 长文本切分为多个分块并发流式翻译
+            result = {}
+            chunks = split_into_chunks(text, TRANSLATION_CHUNK_TOKENS)
+            if len(chunks) > 1:
+                stream = stream_chunks_ordered(chunks, include_vocabulary, result)
+            else:
+                stream = stream_chunk(text, include_vocabulary, result)
+            async for event in stream:
+                yield event
+            translation, vocabulary_list = result["translation"], result["vocabulary"]
+            # 只缓存完整结束的流
+            if result["completed"]:
+                await asyncio.to_thread(
+                    cache_translation, cache_key, translation, vocabulary_list
+                )
+
+        if output_format == "word":
+            yield await asyncio.to_thread(
+                word_document_chunk,
+                text,
+                translation,
+                vocabulary_list,
+                async_document,
+                download_folder,
+                job_folder,
+            )
+        yield {
+            "type": "complete",
+            "done": True,
+        }
+
+    except (GeneratorExit, asyncio.CancelledError):
+        # 客户端断开，不再生成没有人下载的Word文档
+        if output_format == "word" and translation is None:
+            record_document_skipped()
+        raise
+
+    except UpstreamRejected as e:
+        logger.warning("DeepSeek API暂时不可用: %s", e)
+        yield {
+            "type": "error",
+            "error": f"翻译服务暂时不可用: {str(e)}",
+            "retry_after": int(e.retry_after) + 1,
+        }
+        return
+    except requests.exceptions.RequestException as e:
+        logger.error("DeepSeek API流式请求错误: %s", e)
+        yield {"type": "error", "error": f"翻译服务请求失败: {str(e)}"}
+        return
+    except Exception as e:
+        logger.error("流式翻译处理错误: %s", e)
+        yield {"type": "error", "error": f"翻译服务处理失败: {str(e)}"}
+        return
@@ -0,0 +1,125 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import requests
+
+from app.services.upstream_client import (
+    UPSTREAM_POOL_MAXSIZE,
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_READ_TIMEOUT,
+)
+
+try:
+    import httpx
+except ImportError:  # 只有 ASGI 入口需要 httpx
+    httpx = None
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 空闲 keep-alive 连接的保留时间（秒）
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+
+# 每个事件循环一个客户端，httpx 的连接不能跨事件循环使用
+_client = None
+_client_loop = None
+_client_pid = None
+
+
+def _create_client():
+    """创建带连接池的异步客户端，连接池大小和超时与同步会话一致"""
+    if httpx is None:
+        raise RuntimeError("异步上游客户端需要安装 httpx")
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(UPSTREAM_READ_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=None,
+            max_keepalive_connections=UPSTREAM_POOL_MAXSIZE,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_client():
+    """
+    获取当前事件循环的共享异步客户端
+
+    客户端按进程 ID 和事件循环缓存，fork 出的子进程或新的事件循环会自动重建
+
+    返回:
+    httpx.AsyncClient: 带连接池的异步客户端
+    """
+    global _client, _client_loop, _client_pid
+    loop = asyncio.get_running_loop()
+    pid = os.getpid()
+    if _client is None or _client_loop is not loop or _client_pid != pid:
+        # 旧事件循环上的连接无法在当前循环中关闭，直接丢弃即可
+        _client = _create_client()
+        _client_loop = loop
+        _client_pid = pid
+        logger.info("已为进程 %s 创建异步上游连接池", pid)
+    return _client
+
+
+async def close_client():
+    """关闭当前事件循环的客户端，释放所有连接（用于 ASGI 应用关闭时）"""
+    global _client, _client_loop, _client_pid
+    client, loop = _client, _client_loop
+    if client is None or loop is not asyncio.get_running_loop():
+        return
+    _client = _client_loop = _client_pid = None
+    await client.aclose()
+    logger.info("已关闭进程 %s 的异步上游连接池", os.getpid())
+
+
+def as_requests_error(error):
+    """
+    将 httpx 异常转换为对应的 requests 异常
+
+    重试判断、熔断器和错误提示都基于 requests 的异常类型，转换后同步和异步实现的行为一致
+
+    参数:
+    error (Exception): httpx 抛出的异常
+
+    返回:
+    Exception: 对应的 requests 异常；无法对应时原样返回
+    """
+    if httpx is None:
+        return error
+    if isinstance(error, httpx.TimeoutException):
+        return requests.exceptions.Timeout(str(error))
+    if isinstance(error, httpx.TransportError):
+        return requests.exceptions.ConnectionError(str(error))
+    if isinstance(error, httpx.HTTPStatusError):
+        return requests.exceptions.HTTPError(str(error), response=error.response)
+    return error
+
+
+@asynccontextmanager
+async def stream_post(url, **kwargs):
+    """
+    通过共享客户端发送流式 POST 请求
+
+    非 2xx 响应和连接错误以 requests 异常抛出，退出 with 块时关闭响应
+
+    参数:
+    url (str): 请求地址
+    kwargs: 透传给 httpx.AsyncClient.stream 的参数
+
+    返回:
+    httpx.Response: 尚未读取响应体的响应对象
+    """
+    try:
+        async with get_client().stream("POST", url, **kwargs) as response:
+            try:
+                response.raise_for_status()
+            except Exception as e:
+                raise as_requests_error(e) from e
+            yield response
+    except Exception as e:
+        converted = as_requests_error(e)
+        if converted is e:
+            raise
+        raise converted from e
@@ -0,0 +1,347 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from app.services.cache import translation_cache
+from app.services.chunker import run_bounded
+from app.services.tokens import estimate_tokens
+from app.services.scheduler import PRIORITY_BATCH, request_priority
+from app.services.translator import (
+    get_cache_key,
+    cache_translation,
+    translate_segments,
+    count_upstream_requests,
+    translate_with_vocabulary,
+)
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 单次批量请求的条目数上限
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+# 批量请求内并发的上游请求数上限
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# 合并到同一个提示词中的条目总令牌预算
+BATCH_PACK_TOKENS = int(os.getenv("BATCH_PACK_TOKENS", "400"))
+# 单个条目不超过该令牌数时才参与合并
+BATCH_PACK_ITEM_TOKENS = int(os.getenv("BATCH_PACK_ITEM_TOKENS", "100"))
+# NDJSON 流式批量翻译同时进行的上游请求数，读取输入受该窗口限制
+BATCH_STREAM_WINDOW = int(os.getenv("BATCH_STREAM_WINDOW", "8"))
+# NDJSON 单行记录的字节数上限
+BATCH_STREAM_MAX_LINE_BYTES = int(
+    os.getenv("BATCH_STREAM_MAX_LINE_BYTES", str(64 * 1024))
+)
+
+_lock = threading.Lock()
+_stats = {
+    "batches": 0,
+    "items": 0,
+    "upstream_requests": 0,
+    "upstream_calls_saved": 0,
+    "pack_fallbacks": 0,
+    "stream_records": 0,
+    "stream_errors": 0,
+}
+
+
+def _is_packable(text, include_vocabulary):
+    """不需要词汇表、非空且足够短的条目可以与其他条目合并翻译"""
+    return (
+        not include_vocabulary
+        and text.strip() != ""
+        and "[[" not in text
+        and estimate_tokens(text) <= BATCH_PACK_ITEM_TOKENS
+    )
+
+
+def plan_batch(keys, pack_tokens=BATCH_PACK_TOKENS):
+    """
+    将去重后的条目分为合并请求和单独请求
+
+    参数:
+    keys (list): 去重后的 (text, include_vocabulary) 列表
+    pack_tokens (int): 每个合并请求的令牌预算
+
+    每个条目只查询一次缓存，命中的结果随计划返回，执行时不再查询
+
+    返回:
+    tuple: (packs, singles, cached)
+        - packs (list): 每个元素是一组合并翻译的条目序号
+        - singles (list): 单独翻译的条目序号
+        - cached (dict): 已命中缓存的条目序号到 (译文, 词汇表) 的映射
+    """
+    packs = []
+    singles = []
+    cached = {}
+    current = []
+    current_tokens = 0
+    for index, (text, include_vocabulary) in enumerate(keys):
+        value = translation_cache.get(get_cache_key(text, include_vocabulary))
+        if value is not None:
+            cached[index] = tuple(value)
+            continue
+        if not _is_packable(text, include_vocabulary):
+            singles.append(index)
+            continue
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > pack_tokens:
+            packs.append(current)
+            current = []
+            current_tokens = 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+
+    # 只有一个条目的组没有合并的意义，按单独请求处理
+    singles.extend(pack[0] for pack in packs if len(pack) == 1)
+    packs = [pack for pack in packs if len(pack) > 1]
+    return packs, singles, cached
+
+
+def _translate_one(text, include_vocabulary):
+    """翻译单个未命中缓存的条目，返回 (结果, 异常)"""
+    try:
+        return (
+            translate_with_vocabulary(text, include_vocabulary, check_cache=False),
+            None,
+        )
+    except Exception as e:
+        return None, e
+
+
+def translate_batch(items, concurrency=BATCH_CONCURRENCY):
+    """
+    批量翻译
+
+    相同的条目只翻译一次；不需要词汇表的短条目在令牌预算内合并到同一个提示词中，
+    其余条目单独翻译；所有上游请求以有界并发执行。单个条目失败不影响其他条目。
+
+    参数:
+    items (list): 条目列表，每个元素包含 text 和 include_vocabulary
+    concurrency (int): 并发的上游请求数上限
+
+    返回:
+    tuple: (results, stats)
+        - results (list): 与 items 顺序一致，每个元素为
+          {"translation", "vocabulary", "error", "latency_ms"}
+        - stats (dict): 条目数、去重后条目数、上游请求数和节省的请求数
+    """
+    start = time.perf_counter()
+
+    # 去重
+    keys = []
+    key_indexes = {}
+    item_keys = []
+    for item in items:
+        key = (item["text"], bool(item.get("include_vocabulary", False)))
+        if key not in key_indexes:
+            key_indexes[key] = len(keys)
+            keys.append(key)
+        item_keys.append(key_indexes[key])
+
+    packs, singles, cached = plan_batch(keys)
+    outcomes = [None] * len(keys)
+    fallbacks = []
+    for index, result in cached.items():
+        outcomes[index] = (result, None, time.perf_counter() - start)
+
+    def run_pack(pack):
+        texts = [keys[index][0] for index in pack]
+        try:
+            translations = translate_segments(texts)
+        except Exception as e:
+            # 合并结果无法对齐或请求失败时，逐个单独翻译
+            logger.warning("合并翻译 %s 个条目失败，改为逐个翻译: %s", len(pack), e)
+            fallbacks.append(len(pack))
+            for index in pack:
+                run_single(index)
+            return
+        # 合并翻译的结果使用单个条目的缓存键：translate_segments 按编号标记拆分结果，
+        # 编号缺失、重复或多出时整组抛出异常，不会写入缓存，对齐后的每段译文与单独翻译等价
+        elapsed = time.perf_counter() - start
+        for index, text, translation in zip(pack, texts, translations):
+            cache_translation(get_cache_key(text, False), translation, [])
+            outcomes[index] = ((translation, []), None, elapsed)
+
+    def run_single(index):
+        result, error = _translate_one(*keys[index])
+        outcomes[index] = (result, error, time.perf_counter() - start)
+
+    tasks = [(run_pack, pack) for pack in packs]
+    tasks += [(run_single, index) for index in singles]
+    # 批量请求的上游调用排在交互式请求之后；分块任务复制当前上下文，共用同一个计数器
+    with request_priority(PRIORITY_BATCH), count_upstream_requests() as sent:
+        run_bounded(lambda task: task[0](task[1]), tasks, concurrency)
+
+    upstream_requests = sent.value
+    stats = {
+        "items": len(items),
+        "unique_items": len(keys),
+        "cached_items": len(cached),
+        "packed_requests": len(packs),
+        "packed_items": sum(len(pack) for pack in packs),
+        "upstream_requests": upstream_requests,
+        "upstream_calls_saved": max(0, len(items) - upstream_requests),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    with _lock:
+        _stats["batches"] += 1
+        _stats["items"] += stats["items"]
+        _stats["upstream_requests"] += stats["upstream_requests"]
+        _stats["upstream_calls_saved"] += stats["upstream_calls_saved"]
+        _stats["pack_fallbacks"] += len(fallbacks)
+
+    results = []
+    for index in item_keys:
+        result, error, elapsed = outcomes[index]
+        results.append(
+            {
+                "translation": result[0] if result else None,
+                "vocabulary": result[1] if result else None,
+                "error": str(error) if error else None,
+                "latency_ms": round(elapsed * 1000, 1),
+            }
+        )
+    logger.info(
+        "批量翻译完成，条目数: %s，上游请求数: %s", stats["items"], upstream_requests
+    )
+    return results, stats
+
+
+def iter_ndjson_records(stream, max_line_bytes=BATCH_STREAM_MAX_LINE_BYTES):
+    """
+    逐行读取 NDJSON 输入
+
+    每次只读取一行，超长的行会被丢弃并返回错误，不会把整个输入读入内存
+
+    参数:
+    stream: 二进制输入流（支持 readline）
+    max_line_bytes (int): 单行字节数上限
+
+    返回:
+    generator: (行号, 记录, 错误信息)，记录和错误信息只有一个不为 None
+    """
+    line_number = 0
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        line_number += 1
+        if len(line) > max_line_bytes and not line.endswith(b"\n"):
+            # 丢弃该行剩余的内容
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(max_line_bytes)
+            yield line_number, None, f"记录超过 {max_line_bytes} 字节"
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"无效的JSON: {str(e)}"
+            continue
+        if not isinstance(record, dict) or not isinstance(record.get("text"), str):
+            yield line_number, None, "记录必须是包含 text 字段的JSON对象"
+            continue
+        yield line_number, record, None
+
+
+def _translate_record(record, max_text_length):
+    """翻译一条 NDJSON 记录，返回结果记录"""
+    text = record["text"]
+    result = {"id": record.get("id")}
+    if len(text) > max_text_length:
+        result.update(success=False, error=f"文本长度不能超过 {max_text_length} 个字符")
+        return result
+
+    include_vocabulary = bool(record.get("include_vocabulary", False))
+    start = time.perf_counter()
+    try:
+        with request_priority(PRIORITY_BATCH):
+            translation, vocabulary = translate_with_vocabulary(
+                text, include_vocabulary
+            )
+    except Exception as e:
+        result.update(success=False, error=str(e))
+    else:
+        result.update(success=True, translation=translation)
+        if include_vocabulary and vocabulary:
+            result["vocabulary"] = vocabulary
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+def translate_ndjson(stream, max_text_length, window=BATCH_STREAM_WINDOW):
+    """
+    流式批量翻译 NDJSON 输入
+
+    最多同时进行 window 个上游请求，窗口已满时暂停读取输入，
+    结果按完成顺序输出并带上记录的 id，内存占用与输入大小无关。
+
+    参数:
+    stream: 二进制输入流，每行一个 {"id", "text", "include_vocabulary"} 记录
+    max_text_length (int): 单条记录的文本长度上限
+    window (int): 同时进行的上游请求数
+
+    返回:
+    generator: 每条记录一个结果字典
+    """
+    window = max(1, window)
+    records = iter_ndjson_records(stream)
+    executor = ThreadPoolExecutor(max_workers=window, thread_name_prefix="batch")
+    pending = set()
+    exhausted = False
+    try:
+        while True:
+            # 补满窗口，格式错误的记录直接输出
+            while not exhausted and len(pending) < window:
+                try:
+                    line_number, record, error = next(records)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if error is not None:
+                    with _lock:
+                        _stats["stream_errors"] += 1
+                    yield {
+                        "id": None,
+                        "line": line_number,
+                        "success": False,
+                        "error": error,
+                    }
+                    continue
+                # 记录在请求上下文的副本中翻译，日志带有批量请求的 ID
+                pending.add(
+                    executor.submit(
+                        contextvars.copy_context().run,
+                        _translate_record,
+                        record,
+                        max_text_length,
+                    )
+                )
+
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                with _lock:
+                    _stats["stream_records"] += 1
+                    if not result["success"]:
+                        _stats["stream_errors"] += 1
+                yield result
+    finally:
+        # 客户端断开时取消尚未开始的请求
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_batch_stats():
+    """获取当前进程的批量翻译统计"""
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 缓存配置，TRANSLATION_CACHE_SIZE 为 0 时关闭进程内缓存
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "512"))
+TRANSLATION_CACHE_TTL = float(os.getenv("TRANSLATION_CACHE_TTL", "86400"))
+# 设置后启用 SQLite 共享缓存，gunicorn 的多个 worker 共享命中
+TRANSLATION_CACHE_DB = os.getenv("TRANSLATION_CACHE_DB", "")
+TRANSLATION_CACHE_DB_MAX_ENTRIES = int(
+    os.getenv("TRANSLATION_CACHE_DB_MAX_ENTRIES", "100000")
+)
+
+
+def make_cache_key(*parts):
+    """
+    根据内容生成缓存键
+
+    参数:
+    parts: 参与计算的各部分内容（文本、是否包含词汇表、模型、提示词版本等）
+
+    返回:
+    str: sha256 十六进制摘要
+    """
+    raw = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """进程内 LRU 缓存，按条目数和过期时间淘汰"""
+
+    def __init__(self, max_size=TRANSLATION_CACHE_SIZE, ttl=TRANSLATION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """基于 SQLite 的共享缓存，同一节点上的多个进程共享"""
+
+    # 每写入多少次清理一次过期和超量的条目
+    PRUNE_INTERVAL = 100
+
+    def __init__(
+        self,
+        path,
+        ttl=TRANSLATION_CACHE_TTL,
+        max_entries=TRANSLATION_CACHE_DB_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._writes = 0
+
+    def _connect(self):
+        # 连接不能跨 fork 使用，按进程重新打开
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        try:
+            with self._lock:
+                row = (
+                    self._connect()
+                    .execute(
+                        "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+                    )
+                    .fetchone()
+                )
+        except sqlite3.Error as e:
+            logger.warning("读取共享缓存失败: %s", e)
+            return None
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (
+                            key,
+                            json.dumps(value, ensure_ascii=False),
+                            time.time() + self.ttl,
+                        ),
+                    )
+                self._writes += 1
+                if self._writes % self.PRUNE_INTERVAL == 0:
+                    self._prune(conn)
+        except sqlite3.Error as e:
+            logger.warning("写入共享缓存失败: %s", e)
+
+    def _prune(self, conn):
+        with conn:
+            conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+            conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.execute("DELETE FROM cache")
+        except sqlite3.Error as e:
+            logger.warning("清空共享缓存失败: %s", e)
+
+
+class TranslationCache:
+    """
+    多级翻译缓存
+
+    依次查询各级缓存（进程内 LRU 在前，共享缓存在后），
+    下级命中时回填上级；写入时写入所有级别。
+    """
+
+    def __init__(self, tiers):
+        self.tiers = list(tiers)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def _record(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key):
+        for index, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for upper in self.tiers[:index]:
+                    upper.set(key, value)
+                self._record("hits")
+                return value
+        self._record("misses")
+        return None
+
+    def set(self, key, value):
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def reset_stats(self):
+        """清零命中统计（fork 之后丢弃从 master 继承的统计）"""
+        with self._lock:
+            self._stats = {"hits": 0, "misses": 0}
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["tiers"] = [type(tier).__name__ for tier in self.tiers]
+        return stats
+
+
+def create_translation_cache():
+    """根据环境变量创建翻译缓存"""
+    tiers = [LRUCache()]
+    if TRANSLATION_CACHE_DB:
+        tiers.append(SQLiteCache(TRANSLATION_CACHE_DB))
+    return TranslationCache(tiers)
+
+
+translation_cache = create_translation_cache()
@@ -0,0 +1,129 @@
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+_current_scope = contextvars.ContextVar("cancel_scope", default=None)
+
+_lock = threading.Lock()
+_stats = {
+    "client_disconnects": 0,
+    "upstream_cancelled": 0,
+    "tokens_saved": 0,
+    "documents_skipped": 0,
+}
+
+
+class StreamCancelled(Exception):
+    """上游流已被取消（所有客户端都已断开）"""
+
+
+class CancelScope:
+    """
+    一组可以从其他线程取消的上游流
+
+    读取上游流的线程把响应登记到当前的取消范围，客户端断开的线程调用 cancel()
+    立即关闭这些响应，读取线程随即收到异常，不必等到下一个数据块到达。
+    子范围随父范围一起取消。
+    """
+
+    def __init__(self, parent=None):
+        self._lock = threading.Lock()
+        self._responses = set()
+        self._children = set()
+        self._cancelled = False
+        if parent is not None:
+            parent._add_child(self)
+
+    @property
+    def cancelled(self):
+        with self._lock:
+            return self._cancelled
+
+    def _add_child(self, child):
+        with self._lock:
+            cancelled = self._cancelled
+            if not cancelled:
+                self._children.add(child)
+        if cancelled:
+            child.cancel()
+
+    def register(self, response):
+        """
+        登记一个上游响应
+
+        异常:
+        StreamCancelled: 范围已经取消，响应已关闭
+        """
+        with self._lock:
+            if not self._cancelled:
+                self._responses.add(response)
+                return
+        response.close()
+        raise StreamCancelled("客户端已断开，取消上游请求")
+
+    def unregister(self, response):
+        with self._lock:
+            self._responses.discard(response)
+
+    def cancel(self):
+        """取消范围内所有进行中的上游流"""
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            responses, self._responses = self._responses, set()
+            children, self._children = self._children, set()
+        for response in responses:
+            try:
+                response.close()
+            except Exception as e:
+                logger.debug("关闭上游响应失败: %s", e)
+        for child in children:
+            child.cancel()
+
+
+def current_scope():
+    """当前上下文的取消范围，没有时返回 None"""
+    return _current_scope.get()
+
+
+@contextmanager
+def cancel_scope(scope):
+    """在 with 块内把 scope 设为当前的取消范围"""
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+
+
+def record_client_disconnect():
+    with _lock:
+        _stats["client_disconnects"] += 1
+
+
+def record_upstream_cancelled(tokens_saved):
+    """
+    记录一次提前关闭的上游流
+
+    参数:
+    tokens_saved (int): 估算节省的输出令牌数（max_tokens 减去已生成的令牌数）
+    """
+    with _lock:
+        _stats["upstream_cancelled"] += 1
+        _stats["tokens_saved"] += max(0, int(tokens_saved))
+
+
+def record_document_skipped():
+    with _lock:
+        _stats["documents_skipped"] += 1
+
+
+def get_cancellation_stats():
+    """获取客户端断开和上游取消统计"""
+    with _lock:
+        return dict(_stats)
@@ -0,0 +1,141 @@
+import os
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.translation_memory import split_segments
+from app.services.tokens import (
+    estimate_tokens,
+    OUTPUT_TOKEN_RATIO,
+    OUTPUT_TOKENS_MAX,
+    VOCABULARY_OUTPUT_TOKENS,
+)
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 每个分块的输入令牌预算，超出后拆分为多个分块并发翻译；0 表示不切分。
+# 默认为单次响应的最大输出令牌数能容纳的原文长度，普通长度的请求不切分，
+# 只有译文无法在一次响应中输出完的长文本才并发翻译
+TRANSLATION_CHUNK_TOKENS = int(
+    os.getenv(
+        "TRANSLATION_CHUNK_TOKENS",
+        str(int((OUTPUT_TOKENS_MAX - VOCABULARY_OUTPUT_TOKENS) / OUTPUT_TOKEN_RATIO)),
+    )
+)
+# 合并各分块的词汇表后最多保留的术语数，与提示词要求的 3-5 个术语一致
+TRANSLATION_VOCABULARY_MAX_TERMS = int(
+    os.getenv("TRANSLATION_VOCABULARY_MAX_TERMS", "5")
+)
+# 单个请求内并发翻译的分块数上限
+TRANSLATION_CHUNK_CONCURRENCY = int(os.getenv("TRANSLATION_CHUNK_CONCURRENCY", "4"))
+
+
+def _split_oversized(segment, max_tokens):
+    """将超出预算的单个句子按单词切分"""
+    pieces = []
+    current = []
+    for word in segment.split(" "):
+        candidate = " ".join(current + [word])
+        if current and estimate_tokens(candidate) > max_tokens:
+            pieces.append(" ".join(current))
+            current = [word]
+        else:
+            current.append(word)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def split_into_chunks(text, max_tokens=TRANSLATION_CHUNK_TOKENS):
+    """
+    在段落和句子边界上将文本切分为不超过令牌预算的分块
+
+    参数:
+    text (str): 英文文本
+    max_tokens (int): 每个分块的令牌预算，为 0 时不切分
+
+    返回:
+    list: [(chunk, separator), ...]，separator 为分块之后的原始分隔符
+    """
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return [(text, "")]
+
+    segments = []
+    for segment, separator in split_segments(text):
+        if estimate_tokens(segment) > max_tokens:
+            pieces = _split_oversized(segment, max_tokens)
+            segments.extend((piece, " ") for piece in pieces[:-1])
+            segments.append((pieces[-1], separator))
+        else:
+            segments.append((segment, separator))
+
+    chunks = []
+    current = ""
+    current_separator = ""
+    for segment, separator in segments:
+        candidate = current + current_separator + segment if current else segment
+        if current and estimate_tokens(candidate) > max_tokens:
+            chunks.append((current, current_separator))
+            candidate = segment
+        current = candidate
+        current_separator = separator
+    if current:
+        chunks.append((current, current_separator))
+    return chunks
+
+
+def join_chunk_translations(translations, separators):
+    """按原顺序拼接各分块译文，保留原文中的换行"""
+    parts = []
+    for translation, separator in zip(translations, separators):
+        parts.append(translation)
+        if "\n" in separator:
+            parts.append("\n" * separator.count("\n"))
+    return "".join(parts).strip()
+
+
+def merge_vocabularies(
+    vocabulary_lists, ignored=None, limit=TRANSLATION_VOCABULARY_MAX_TERMS
+):
+    """
+    合并各分块的词汇表，按英文术语去重（不区分大小写）
+
+    参数:
+    vocabulary_lists (list): 各分块的词汇表
+    ignored (list): 需要忽略的词汇（例如词汇提取失败的占位项）
+    limit (int): 最多保留的术语数，为 None 时不限制
+
+    返回:
+    list: 去重后的词汇表，保持首次出现的顺序，与流式输出的术语事件一致
+    """
+    ignored = ignored or []
+    merged = []
+    seen = set()
+    for vocabulary in vocabulary_lists:
+        for term in vocabulary:
+            if term in ignored or not isinstance(term, dict):
+                continue
+            key = str(term.get("english", "")).strip().lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(term)
+            if limit and len(merged) >= limit:
+                return merged
+    return merged
+
+
+def run_bounded(func, items, concurrency=TRANSLATION_CHUNK_CONCURRENCY):
+    """
+    以有界并发执行任务，按输入顺序返回结果
+
+    gunicorn 使用 gevent worker 时线程已被 monkey patch 为协程。
+    任务在调用方上下文（contextvars）的副本中执行，上游请求的优先级等设置随之传递
+    """
+    items = list(items)
+    if len(items) <= 1 or concurrency <= 1:
+        return [func(item) for item in items]
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as executor:
+        return list(executor.map(lambda item: context.copy().run(func, item), items))
@@ -1,14 +1,211 @@
-from docx import Document
-from docx.shared import Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
 import logging
-import os, uuid
+import os
+import io
+import time
+import copy
+import zipfile
+import datetime
+import threading
 from flask import current_app
 
+from app.services.document_storage import (
+    document_filename,
+    record_document_written,
+    touch_document,
+)
+from app.services.tracing import span
+from app.services.metrics import document_build_duration, document_bytes
+
 # 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+FOOTER_TEXT = "此文档由 xxx 翻译助手自动生成"
+
+# 直接在响应中返回的文档大小上限（字节），限制的是响应体的大小。
+# 文档压缩后的大小无法从输入长度可靠地估算，只能在生成之后检查，
+# 生成期间的内存占用由接口的文本长度上限（MAX_TEXT_LENGTH）约束
+DOCUMENT_INLINE_MAX_BYTES = int(
+    os.getenv("DOCUMENT_INLINE_MAX_BYTES", str(10 * 1024 * 1024))
+)
+
+
+# 文档中固定的时间：zip 条目的修改时间和文档属性的创建、修改时间不随生成时间变化，
+# 相同输入总是生成字节相同的文档，按输入命名的文件被清理后重新生成或被并发请求覆盖时内容不变，
+# 文件名中的摘要可以作为强 ETag
+DOCUMENT_TIMESTAMP = datetime.datetime(2020, 1, 1)
+DOCUMENT_ZIP_DATE_TIME = (2020, 1, 1, 0, 0, 0)
+
+
+class DocumentTooLarge(Exception):
+    """文档超过直接返回的大小上限"""
+
+
+_inline_lock = threading.Lock()
+_inline_stats = {
+    "documents": 0,
+    "rejected": 0,
+    "bytes_total": 0,
+    "bytes_max": 0,
+}
+
+# 每个 worker 进程缓存一份文档模板
+_template_lock = threading.Lock()
+_template_bytes = None
+
+
+def get_document_template():
+    """
+    获取预先设置好样式和页脚的文档模板
+
+    模板在每个 worker 进程中只构建一次，之后每个文档都从模板的字节内容复制，
+    不再重复设置样式和页脚。
+
+    返回:
+    bytes: 模板文档的内容
+    """
+    global _template_bytes
+    if _template_bytes is None:
+        with _template_lock:
+            if _template_bytes is None:
+                from docx import Document
+                from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+                doc = Document()
+
+                # 设置文档样式
+                setup_document_styles(doc)
+
+                # 添加页脚
+                for section in doc.sections:
+                    footer = section.footer
+                    footer_para = footer.paragraphs[0]
+                    footer_para.text = FOOTER_TEXT
+                    footer_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+                buffer = io.BytesIO()
+                doc.save(buffer)
+                _template_bytes = buffer.getvalue()
+    return _template_bytes
+
+
+def _set_cell_text(tc, text):
+    """直接在单元格的 XML 中写入文本，等价于 cell.text = text"""
+    tc.p_lst[0].add_r().text = text
+
+
+def add_vocabulary_rows(table, vocabulary_list):
+    """
+    向词汇表表格追加内容行
+
+    python-docx 的 table.add_row().cells 每次都要重新计算整个表格的单元格布局，
+    行数多时开销接近平方级。这里先生成一个空行作为原型，之后每行复制原型的 XML
+    并直接写入文本。
+
+    参数:
+    table: docx 表格对象
+    vocabulary_list (list): 词汇表列表
+    """
+    if not vocabulary_list:
+        return
+    prototype = table.add_row()._tr
+    tbl = prototype.getparent()
+    tbl.remove(prototype)
+    for vocab in vocabulary_list:
+        tr = copy.deepcopy(prototype)
+        cells = tr.tc_lst
+        _set_cell_text(cells[0], vocab.get("english", ""))
+        _set_cell_text(cells[1], vocab.get("chinese", ""))
+        _set_cell_text(cells[2], vocab.get("explanation", ""))
+        tbl.append(tr)
+
+
+def save_document(doc, target):
+    """
+    保存文档，输出只由文档内容决定
+
+    python-docx 按保存时的时间写入 zip 条目的修改时间，这里固定文档属性中的时间和修订号，
+    再用固定的修改时间重新打包各条目
+
+    参数:
+    doc: Document对象
+    target: 文件路径或可写的二进制文件对象
+    """
+    properties = doc.core_properties
+    properties.created = DOCUMENT_TIMESTAMP
+    properties.modified = DOCUMENT_TIMESTAMP
+    properties.revision = 1
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    with zipfile.ZipFile(buffer) as source, zipfile.ZipFile(
+        target, "w", compression=zipfile.ZIP_DEFLATED
+    ) as output:
+        for info in source.infolist():
+            entry = zipfile.ZipInfo(info.filename, date_time=DOCUMENT_ZIP_DATE_TIME)
+            entry.compress_type = zipfile.ZIP_DEFLATED
+            entry.external_attr = info.external_attr
+            output.writestr(entry, source.read(info))
+
+
+def build_word_document(english_text, chinese_translation, vocabulary_list):
+    """
+    构建包含英文原文、中文翻译和词汇表的Word文档对象
+
+    参数:
+    english_text (str): 原始英文文本
+    chinese_translation (str): 中文翻译文本
+    vocabulary_list (list): 词汇表列表，每个元素是包含english、chinese和explanation的字典
+
+    返回:
+    Document: 文档对象
+    """
+    # python-docx 和 lxml 在第一次生成文档时才导入，不需要文档的 worker 不占用这部分内存
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+    # 从预先设置好样式的模板创建文档
+    doc = Document(io.BytesIO(get_document_template()))
+
+    # 添加标题
+    title = doc.add_heading("翻译结果文档", 0)
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    # 添加英文原文部分
+    doc.add_heading("一、英文原文", level=1)
+    doc.add_paragraph(english_text)
+
+    # 添加中文翻译部分
+    doc.add_heading("二、中文翻译", level=1)
+    doc.add_paragraph(chinese_translation)
+
+    # 添加词汇表部分（如果有）
+    if vocabulary_list:
+        doc.add_heading("三、专业词汇表", level=1)
+
+        # 创建词汇表表格
+        table = doc.add_table(rows=1, cols=3)
+        table.style = "Table Grid"
+
+        # 设置表头
+        hdr_cells = table.rows[0].cells
+        hdr_cells[0].text = "英文术语"
+        hdr_cells[1].text = "中文翻译"
+        hdr_cells[2].text = "术语解释"
+
+        # 设置表头样式
+        for cell in hdr_cells:
+            cell.paragraphs[0].runs[0].bold = True
+            cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+        # 添加词汇表内容
+        add_vocabulary_rows(table, vocabulary_list)
+
+        # 添加一个空段落作为分隔
+        doc.add_paragraph()
+
+    return doc
+
 
 def generate_word_document(
     english_text, chinese_translation, vocabulary_list, output_path
@@ -26,98 +223,120 @@ def generate_word_document(
     bool: 文档生成是否成功
     """
     try:
-        # 创建一个新的Word文档
-        doc = Document()
-
-        # 设置文档样式
-        setup_document_styles(doc)
-
-        # 添加标题
-        title = doc.add_heading("翻译结果文档", 0)
-        title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-        # 添加英文原文部分
-        doc.add_heading("一、英文原文", level=1)
-        english_section = doc.add_paragraph(english_text)
-
-        # 添加中文翻译部分
-        doc.add_heading("二、中文翻译", level=1)
-        chinese_section = doc.add_paragraph(chinese_translation)
-
-        # 添加词汇表部分（如果有）
-        if vocabulary_list:
-            doc.add_heading("三、专业词汇表", level=1)
-
-            # 创建词汇表表格
-            table = doc.add_table(rows=1, cols=3)
-            table.style = "Table Grid"
-
-            # 设置表头
-            hdr_cells = table.rows[0].cells
-            hdr_cells[0].text = "英文术语"
-            hdr_cells[1].text = "中文翻译"
-            hdr_cells[2].text = "术语解释"
-
-            # 设置表头样式
-            for cell in hdr_cells:
-                cell.paragraphs[0].runs[0].bold = True
-                cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-            # 添加词汇表内容
-            for vocab in vocabulary_list:
-                row_cells = table.add_row().cells
-                row_cells[0].text = vocab.get("english", "")
-                row_cells[1].text = vocab.get("chinese", "")
-                row_cells[2].text = vocab.get("explanation", "")
-
-            # 添加一个空段落作为分隔
-            doc.add_paragraph()
-
-        # 添加页脚
-        footer_text = "此文档由 xxx 翻译助手自动生成"
-        for section in doc.sections:
-            footer = section.footer
-            footer_para = footer.paragraphs[0]
-            footer_para.text = footer_text
-            footer_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-        # 保存文档
-        # 确保输出目录存在
-        output_dir = os.path.dirname(output_path)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir, exist_ok=True)
-
-        doc.save(output_path)
-        logger.info(f"Word文档已成功生成并保存至: {output_path}")
+        start = time.perf_counter()
+        with span("docx_build", vocabulary=len(vocabulary_list or [])):
+            doc = build_word_document(
+                english_text, chinese_translation, vocabulary_list
+            )
+
+            # 保存文档
+            # 确保输出目录存在
+            output_dir = os.path.dirname(output_path)
+            if output_dir and not os.path.exists(output_dir):
+                os.makedirs(output_dir, exist_ok=True)
+
+            save_document(doc, output_path)
+        document_build_duration.observe(time.perf_counter() - start, mode="file")
+        document_bytes.observe(os.path.getsize(output_path), mode="file")
+        logger.info("Word文档已成功生成并保存至: %s", output_path)
         return True
 
     except Exception as e:
-        logger.error(f"Word文档生成失败: {str(e)}")
+        logger.error("Word文档生成失败: %s", e)
         raise Exception(f"文档生成失败: {str(e)}")
 
 
-def generate_word_document_url(text, translation, vocabulary) -> str:
+def render_word_document(
+    english_text,
+    chinese_translation,
+    vocabulary_list,
+    max_bytes=DOCUMENT_INLINE_MAX_BYTES,
+):
+    """
+    在内存中生成Word文档，不写入磁盘
+
+    文档生成并保存到内存后才检查大小，超过上限时丢弃已生成的内容并抛出异常，
+    因此上限约束的是返回给客户端的响应大小，而不是生成过程中的峰值内存
+
+    参数:
+    english_text (str): 原始英文文本
+    chinese_translation (str): 中文翻译文本
+    vocabulary_list (list): 词汇表列表
+    max_bytes (int): 生成后的文档大小上限（字节）
+
+    返回:
+    io.BytesIO: 已定位到开头的文档内容
+
+    异常:
+    DocumentTooLarge: 生成的文档超过大小上限
+    """
+    start = time.perf_counter()
+    with span("docx_build", vocabulary=len(vocabulary_list or []), inline=True):
+        doc = build_word_document(english_text, chinese_translation, vocabulary_list)
+        buffer = io.BytesIO()
+        save_document(doc, buffer)
+    size = buffer.tell()
+    document_build_duration.observe(time.perf_counter() - start, mode="inline")
+    document_bytes.observe(size, mode="inline")
+
+    with _inline_lock:
+        if size > max_bytes:
+            _inline_stats["rejected"] += 1
+        else:
+            _inline_stats["documents"] += 1
+            _inline_stats["bytes_total"] += size
+            _inline_stats["bytes_max"] = max(_inline_stats["bytes_max"], size)
+    if size > max_bytes:
+        raise DocumentTooLarge(f"文档大小 {size} 字节超过上限 {max_bytes} 字节")
+
+    buffer.seek(0)
+    logger.info("Word文档已在内存中生成，大小: %s 字节", size)
+    return buffer
+
+
+def get_inline_document_stats():
+    """获取内存中生成文档的统计（数量、被拒绝数量、总字节数和单个文档最大字节数）"""
+    with _inline_lock:
+        return dict(_inline_stats)
+
+
+def generate_word_document_url(
+    text, translation, vocabulary, download_folder=None, filename=None
+) -> str:
     """
     生成Word文档URL
 
+    文件名由文档内容的哈希决定，相同内容的文档已存在时直接复用，不再重新生成
+
     参数:
     - text: 原始文本
     - translation: 翻译结果
     - vocabulary: 词汇表
-    - filepath: 文档保存路径
+    - download_folder: 文档保存目录，默认使用应用配置的 DOWNLOAD_FOLDER
+    - filename: 文档文件名，默认根据文档内容生成
 
     返回:
     - 文档URL
     """
+    filename = filename or document_filename(text, translation, vocabulary)
+    download_folder = download_folder or current_app.config["DOWNLOAD_FOLDER"]
+    filepath = os.path.join(download_folder, filename)
+
+    if touch_document(filepath):
+        logger.info("复用已有的Word文档，文件名: %s", filename)
+        return f"/downloads/{filename}"
+
+    # 先写入临时文件再重命名，避免并发请求或下载读到不完整的文件
     logger.info("开始生成Word文档")
-    # 生成唯一文件名
-    file_id = str(uuid.uuid4())[:8]
-    filename = f"translation_{file_id}.docx"
-    filepath = os.path.join(current_app.config["DOWNLOAD_FOLDER"], filename)
-
-    # 生成Word文档
-    generate_word_document(text, translation, vocabulary, filepath)
-    logger.info(f"Word文档生成完成，文件名: {filename}")
+    temp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        generate_word_document(text, translation, vocabulary, temp_path)
+        os.replace(temp_path, filepath)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    record_document_written(filepath)
+    logger.info("Word文档生成完成，文件名: %s", filename)
     return f"/downloads/{filename}"
 
 
@@ -128,6 +347,8 @@ def setup_document_styles(doc):
     参数:
     doc: Document对象
     """
+    from docx.shared import Pt
+
     # 获取样式集合
     styles = doc.styles
 
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+from app.services.document_generator import generate_word_document_url
+from app.services.document_storage import document_filename
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 每个 worker 进程生成文档的线程数
+DOCUMENT_JOB_WORKERS = int(os.getenv("DOCUMENT_JOB_WORKERS", "2"))
+# 每个 worker 进程排队中的任务上限，超出后由调用方同步生成
+DOCUMENT_JOB_QUEUE_SIZE = int(os.getenv("DOCUMENT_JOB_QUEUE_SIZE", "32"))
+# 任务状态文件的保留时间（秒）
+DOCUMENT_JOB_TTL = float(os.getenv("DOCUMENT_JOB_TTL", "3600"))
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class DocumentQueueFull(Exception):
+    """文档任务队列已满"""
+
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_queued = 0
+
+
+def _get_executor():
+    """获取当前进程的线程池，fork 之后重新创建"""
+    global _executor, _executor_pid, _queued
+    pid = os.getpid()
+    with _lock:
+        if _executor is None or _executor_pid != pid:
+            _executor = ThreadPoolExecutor(
+                max_workers=DOCUMENT_JOB_WORKERS, thread_name_prefix="document-job"
+            )
+            _executor_pid = pid
+            _queued = 0
+        return _executor
+
+
+def _job_path(job_folder, job_id):
+    return os.path.join(job_folder, f"{job_id}.json")
+
+
+def _write_job(job_folder, job):
+    """
+    写入任务状态文件
+
+    状态保存在文件中，gunicorn 的任意 worker 都能查询其他 worker 提交的任务
+    """
+    os.makedirs(job_folder, exist_ok=True)
+    path = _job_path(job_folder, job["job_id"])
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def get_document_job(job_folder, job_id):
+    """
+    查询文档任务状态
+
+    参数:
+    job_folder (str): 任务状态目录
+    job_id (str): 任务ID
+
+    返回:
+    dict: 任务状态；任务不存在时返回 None
+    """
+    try:
+        uuid.UUID(hex=job_id)
+    except ValueError:
+        return None
+    try:
+        with open(_job_path(job_folder, job_id), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _prune_jobs(job_folder):
+    """删除过期的任务状态文件"""
+    expire_before = time.time() - DOCUMENT_JOB_TTL
+    try:
+        entries = list(os.scandir(job_folder))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.name.endswith(".json") and entry.stat().st_mtime < expire_before:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _run_job(job_folder, download_folder, job, text, translation, vocabulary):
+    global _queued
+    try:
+        _write_job(job_folder, dict(job, status=JOB_RUNNING))
+        generate_word_document_url(
+            text, translation, vocabulary, download_folder, job["filename"]
+        )
+        _write_job(job_folder, dict(job, status=JOB_DONE, finished_at=time.time()))
+    except Exception as e:
+        logger.error("文档任务 %s 失败: %s", job["job_id"], e)
+        _write_job(
+            job_folder,
+            dict(job, status=JOB_FAILED, error=str(e), finished_at=time.time()),
+        )
+    finally:
+        with _lock:
+            _queued -= 1
+
+
+def submit_document_job(job_folder, download_folder, text, translation, vocabulary):
+    """
+    提交后台Word文档生成任务
+
+    参数:
+    job_folder (str): 任务状态目录
+    download_folder (str): 文档保存目录
+    text (str): 原始文本
+    translation (str): 翻译结果
+    vocabulary (list): 词汇表
+
+    返回:
+    dict: 任务信息，包括 job_id、status 和文档完成后的下载地址 word_document_url
+
+    异常:
+    DocumentQueueFull: 当前进程排队中的任务已达上限
+    """
+    global _queued
+    executor = _get_executor()
+    with _lock:
+        if _queued >= DOCUMENT_JOB_QUEUE_SIZE:
+            raise DocumentQueueFull("文档任务队列已满")
+        _queued += 1
+
+    filename = document_filename(text, translation, vocabulary)
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "status": JOB_PENDING,
+        "filename": filename,
+        "word_document_url": f"/downloads/{filename}",
+        "created_at": time.time(),
+    }
+    try:
+        _prune_jobs(job_folder)
+        _write_job(job_folder, job)
+        # 在提交任务的请求上下文副本中生成文档，日志带有该请求的 ID
+        executor.submit(
+            contextvars.copy_context().run,
+            _run_job,
+            job_folder,
+            download_folder,
+            job,
+            text,
+            translation,
+            vocabulary,
+        )
+    except Exception:
+        with _lock:
+            _queued -= 1
+        raise
+    logger.info("已提交文档任务: %s", job["job_id"])
+    return job
+
+
+def start_document_job(
+    text, translation, vocabulary, job_folder=None, download_folder=None
+):
+    """
+    在当前应用中提交文档任务，返回可直接放入响应的任务句柄
+
+    参数:
+    text (str): 原始文本
+    translation (str): 翻译结果
+    vocabulary (list): 词汇表
+    job_folder (str): 任务状态目录，默认使用应用配置的 DOCUMENT_JOB_FOLDER
+    download_folder (str): 文档保存目录，默认使用应用配置的 DOWNLOAD_FOLDER
+
+    返回:
+    dict: 任务句柄（job_id、status、status_url、word_document_url）；
+          队列已满时返回 None，由调用方同步生成文档
+    """
+    try:
+        job = submit_document_job(
+            job_folder or current_app.config["DOCUMENT_JOB_FOLDER"],
+            download_folder or current_app.config["DOWNLOAD_FOLDER"],
+            text,
+            translation,
+            vocabulary,
+        )
+    except DocumentQueueFull:
+        logger.warning("文档任务队列已满，改为同步生成")
+        return None
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"/api/v1/documents/{job['job_id']}",
+        "word_document_url": job["word_document_url"],
+    }
+
+
+def get_document_job_stats():
+    """获取当前进程的文档任务统计"""
+    with _lock:
+        return {"queued": _queued, "workers": DOCUMENT_JOB_WORKERS}
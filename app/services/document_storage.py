@@ -0,0 +1,201 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 文档的空闲保留时间（秒）：最近一次生成或复用之后超过该时间未再使用的文档被删除。
+# 复用文档会刷新修改时间，经常被复用的文档不会因此过期，只受 DOCUMENT_MAX_BYTES 约束。
+# 兼容旧的 DOCUMENT_MAX_AGE 环境变量
+DOCUMENT_IDLE_TTL = float(
+    os.getenv("DOCUMENT_IDLE_TTL", os.getenv("DOCUMENT_MAX_AGE", "86400"))
+)
+# 下载目录的总大小上限（字节），超出后按最近使用时间淘汰
+DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(200 * 1024 * 1024)))
+# 清理间隔（秒），为 0 时不启动后台清理
+DOCUMENT_JANITOR_INTERVAL = float(os.getenv("DOCUMENT_JANITOR_INTERVAL", "300"))
+
+# 文档格式版本，修改文档模板或内容结构时需要递增，避免复用旧文档
+DOCUMENT_FORMAT_VERSION = "2"
+
+# document_filename 生成的文件名，分组为内容摘要
+DOCUMENT_FILENAME_PATTERN = re.compile(r"^translation_([0-9a-f]{32})\.docx$")
+
+_lock = threading.Lock()
+_janitors = {}
+_stats = {
+    "bytes_stored": 0,
+    "files_stored": 0,
+    "files_written": 0,
+    "files_reused": 0,
+    "files_evicted": 0,
+    "bytes_evicted": 0,
+}
+
+
+def document_filename(text, translation, vocabulary):
+    """
+    根据文档内容生成文件名
+
+    相同的原文、译文和词汇表总是得到相同的文件名，重复请求可以直接复用已有文件
+
+    返回:
+    str: 形如 translation_<hash>.docx 的文件名
+    """
+    raw = json.dumps(
+        [DOCUMENT_FORMAT_VERSION, text, translation, vocabulary],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    digest = hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+    return f"translation_{digest}.docx"
+
+
+def touch_document(path):
+    """
+    如果文档已存在，刷新其最近使用时间并返回 True
+
+    清理时按修改时间淘汰，复用文档时更新修改时间即可实现 LRU
+    """
+    try:
+        os.utime(path)
+    except OSError:
+        return False
+    with _lock:
+        _stats["files_reused"] += 1
+    return True
+
+
+def document_etag(filename):
+    """
+    返回按内容命名的文档的强 ETag
+
+    文件名中的摘要由原文、译文、词汇表和文档格式版本决定，文档生成时固定了 zip 条目和文档属性中的时间，
+    相同输入总是生成字节相同的文档，因此摘要可以直接用作强 ETag，不需要读取文件。
+
+    参数:
+    filename (str): 文档文件名
+
+    返回:
+    str: 文件名中的摘要（不含引号）；不是按内容命名的文件返回 None
+    """
+    match = DOCUMENT_FILENAME_PATTERN.match(filename)
+    return match.group(1) if match else None
+
+
+def record_document_written(path):
+    """记录新写入的文档"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    with _lock:
+        _stats["files_written"] += 1
+        _stats["files_stored"] += 1
+        _stats["bytes_stored"] += size
+
+
+def sweep_documents(folder, idle_ttl=DOCUMENT_IDLE_TTL, max_bytes=DOCUMENT_MAX_BYTES):
+    """
+    清理下载目录
+
+    先删除空闲超过保留时间的文档，再在总大小超出上限时按最近使用时间从旧到新删除。
+    两者都以修改时间（最近一次生成或复用的时间）为准
+
+    参数:
+    folder (str): 下载目录
+    idle_ttl (float): 文档的空闲保留时间（秒）
+    max_bytes (int): 目录总大小上限（字节）
+
+    返回:
+    dict: 本次清理删除的文件数和字节数
+    """
+    try:
+        entries = [
+            entry
+            for entry in os.scandir(folder)
+            if entry.is_file() and entry.name.endswith(".docx")
+        ]
+    except OSError:
+        return {"files_evicted": 0, "bytes_evicted": 0}
+
+    files = []
+    for entry in entries:
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+
+    expire_before = time.time() - idle_ttl
+    total_bytes = sum(size for _, size, _ in files)
+    evicted_files = 0
+    evicted_bytes = 0
+    remaining = len(files)
+    for mtime, size, path in files:
+        if mtime >= expire_before and total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_bytes -= size
+        remaining -= 1
+        evicted_files += 1
+        evicted_bytes += size
+
+    with _lock:
+        _stats["bytes_stored"] = total_bytes
+        _stats["files_stored"] = remaining
+        _stats["files_evicted"] += evicted_files
+        _stats["bytes_evicted"] += evicted_bytes
+    if evicted_files:
+        logger.info(
+            "清理下载目录，删除 %s 个文件，%s 字节", evicted_files, evicted_bytes
+        )
+    return {"files_evicted": evicted_files, "bytes_evicted": evicted_bytes}
+
+
+def _janitor_loop(folder, interval):
+    while True:
+        try:
+            sweep_documents(folder)
+        except Exception as e:
+            logger.error("清理下载目录失败: %s", e)
+        time.sleep(interval)
+
+
+def start_document_janitor(folder, interval=DOCUMENT_JANITOR_INTERVAL):
+    """
+    启动后台清理线程，每个进程每个目录只启动一个
+
+    参数:
+    folder (str): 下载目录
+    interval (float): 清理间隔（秒），为 0 时不启动
+    """
+    if interval <= 0:
+        return
+    key = (os.getpid(), folder)
+    with _lock:
+        if key in _janitors:
+            return
+        thread = threading.Thread(
+            target=_janitor_loop,
+            args=(folder, interval),
+            name="document-janitor",
+            daemon=True,
+        )
+        _janitors[key] = thread
+    thread.start()
+
+
+def get_document_storage_stats():
+    """获取文档存储统计"""
+    with _lock:
+        return dict(_stats)
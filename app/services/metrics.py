@@ -0,0 +1,452 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 多进程指标目录：每个 worker 定期把自己的指标快照写入 <pid>.json（由 start_worker_metrics 启动），
+# /metrics 汇总目录中的所有快照。
+# 为空时只输出当前进程的指标（flask run、单进程 uvicorn）
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+# worker 写入指标快照的间隔（秒）
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 已退出 worker 的计数器和直方图合并到该文件，计数器在 worker 回收后保持单调递增
+ARCHIVE_FILE = "archive.json"
+# 归档文件中记录的最近归档的进程数，读取时跳过这些进程尚未删除的快照
+ARCHIVED_PIDS_LIMIT = 100
+
+# 耗时直方图的分桶（秒），上限与 gunicorn 的 timeout 相当
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 240)
+# 首个令牌耗时的分桶（秒）
+TTFT_BUCKETS = (0.1, 0.25, 0.5, 1, 1.5, 2, 3, 5, 10, 30)
+# 流式输出速度的分桶（令牌/秒）
+TOKEN_RATE_BUCKETS = (5, 10, 20, 30, 50, 75, 100, 150, 200, 400)
+# Word 文档大小的分桶（字节）
+DOCUMENT_BYTES_BUCKETS = (16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+_lock = threading.Lock()
+_registry = {}
+# (指标名, 标签) -> 计数器和仪表的值，或直方图的 [各分桶计数, 总和, 次数]
+_values = {}
+_pid = None
+_flushers = {}
+
+
+def _ensure_process():
+    """fork 之后清空从 master 继承的值（调用方持有 _lock）"""
+    global _pid
+    pid = os.getpid()
+    if _pid == pid:
+        return
+    _pid = pid
+    _values.clear()
+
+
+def start_worker_metrics():
+    """
+    在 worker 进程中开始记录指标（在 gunicorn 的 post_worker_init 中调用）
+
+    preload 模式下 master 中产生的缓存和准入统计会被 fork 继承，先清零，避免每个 worker 重复计入；
+    配置了 METRICS_DIR 时启动定期写入快照的线程。master 不调用该函数，不写快照，
+    即使 master 中记录过指标也不会被当作一个 worker 汇总
+    """
+    from app.services.cache import translation_cache
+    from app.services.scheduler import upstream_scheduler
+
+    translation_cache.reset_stats()
+    upstream_scheduler.reset_stats()
+    pid = os.getpid()
+    with _lock:
+        _ensure_process()
+        if not METRICS_DIR or METRICS_FLUSH_INTERVAL <= 0 or pid in _flushers:
+            return
+        thread = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+        _flushers[pid] = thread
+    thread.start()
+
+
+class Metric:
+    """已注册的指标，值保存在模块级的 _values 中，便于整体写入快照"""
+
+    def __init__(self, name, kind, description, buckets=None):
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.buckets = tuple(buckets) if buckets else None
+        _registry[name] = self
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+
+class Counter(Metric):
+    def __init__(self, name, description):
+        super().__init__(name, COUNTER, description)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(self.name, labels)
+        with _lock:
+            _ensure_process()
+            _values[key] = _values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """用已有统计中当前进程的累计值设置计数器"""
+        key = self._key(self.name, labels)
+        with _lock:
+            _ensure_process()
+            _values[key] = value
+
+
+class Gauge(Metric):
+    def __init__(self, name, description):
+        super().__init__(name, GAUGE, description)
+
+    def set(self, value, **labels):
+        key = self._key(self.name, labels)
+        with _lock:
+            _ensure_process()
+            _values[key] = value
+
+
+class Histogram(Metric):
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        super().__init__(name, HISTOGRAM, description, buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(self.name, labels)
+        with _lock:
+            _ensure_process()
+            state = _values.get(key)
+            if state is None:
+                state = _values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+
+http_requests = Counter("translator_http_requests_total", "HTTP 请求数")
+http_request_duration = Histogram(
+    "translator_http_request_duration_seconds",
+    "HTTP 请求耗时，流式响应计到最后一个数据块发送完毕",
+)
+upstream_ttft = Histogram(
+    "translator_upstream_ttft_seconds",
+    "流式请求从发起到收到第一个令牌的耗时",
+    TTFT_BUCKETS,
+)
+upstream_duration = Histogram(
+    "translator_upstream_duration_seconds", "上游请求的总耗时"
+)
+upstream_queue_wait = Histogram(
+    "translator_upstream_queue_wait_seconds", "上游请求在准入队列中的等待时间"
+)
+stream_tokens = Counter(
+    "translator_stream_tokens_total", "流式请求输出的令牌数（估算）"
+)
+stream_token_rate = Histogram(
+    "translator_stream_tokens_per_second",
+    "每个流式请求从第一个令牌到结束的输出速度（估算令牌数/秒）",
+    TOKEN_RATE_BUCKETS,
+)
+vocabulary_parse_failures = Counter(
+    "translator_vocabulary_parse_failures_total", "词汇表解析失败次数"
+)
+document_build_duration = Histogram(
+    "translator_document_build_seconds", "生成Word文档的耗时"
+)
+document_bytes = Histogram(
+    "translator_document_bytes", "生成的Word文档大小", DOCUMENT_BYTES_BUCKETS
+)
+cache_requests = Counter("translator_cache_requests_total", "翻译缓存查询次数")
+upstream_admitted = Counter(
+    "translator_upstream_admitted_total", "准入调度放行的上游请求数"
+)
+upstream_queue_timeouts = Counter(
+    "translator_upstream_queue_timeouts_total", "在准入队列中等待超时的请求数"
+)
+upstream_in_flight = Gauge("translator_upstream_in_flight", "正在进行的上游请求数")
+upstream_waiting = Gauge("translator_upstream_waiting", "在准入队列中等待的请求数")
+document_jobs_queued = Gauge(
+    "translator_document_jobs_queued", "排队和进行中的后台文档任务数"
+)
+
+
+def record_request(endpoint, status, duration):
+    """记录一次 HTTP 请求"""
+    http_requests.inc(endpoint=endpoint, status=str(status))
+    http_request_duration.observe(duration, endpoint=endpoint)
+
+
+class UpstreamStreamTimer:
+    """记录一次上游流式请求的首个令牌耗时、总耗时和输出速度"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token = None
+
+    def token(self):
+        """收到包含内容的数据块时调用"""
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+
+    def finish(self, provider, tokens):
+        """
+        流结束时调用
+
+        参数:
+        provider (str): 上游名称
+        tokens (int): 本次请求输出的估算令牌数
+        """
+        end = time.perf_counter()
+        upstream_duration.observe(end - self.start, mode="stream", provider=provider)
+        if self.first_token is None:
+            return
+        upstream_ttft.observe(self.first_token - self.start, provider=provider)
+        stream_tokens.inc(tokens, provider=provider)
+        if tokens > 0 and end > self.first_token:
+            stream_token_rate.observe(
+                tokens / (end - self.first_token), provider=provider
+            )
+
+
+def _collect_runtime_stats():
+    """把已有的缓存和队列统计写入对应的指标"""
+    from app.services.cache import translation_cache
+    from app.services.scheduler import get_admission_stats
+    from app.services.document_jobs import get_document_job_stats
+
+    cache_stats = translation_cache.get_stats()
+    cache_requests.set_total(cache_stats["hits"], result="hit")
+    cache_requests.set_total(cache_stats["misses"], result="miss")
+    admission = get_admission_stats()
+    upstream_admitted.set_total(admission["admitted"])
+    upstream_queue_timeouts.set_total(admission["timeouts"])
+    upstream_in_flight.set(admission["in_flight"])
+    upstream_waiting.set(admission["waiting"])
+    document_jobs_queued.set(get_document_job_stats()["queued"])
+
+
+def snapshot():
+    """
+    当前进程的指标快照
+
+    返回:
+    list: [指标名, 标签字典, 值] 的列表，直方图的值为 [各分桶计数, 总和, 次数]
+    """
+    _collect_runtime_stats()
+    with _lock:
+        return [
+            [
+                name,
+                dict(labels),
+                (
+                    [list(value[0]), value[1], value[2]]
+                    if isinstance(value, list)
+                    else value
+                ),
+            ]
+            for (name, labels), value in _values.items()
+        ]
+
+
+def _write_json(path, data):
+    """先写临时文件再替换，读取方不会看到写了一半的文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot():
+    """把当前进程的指标快照写入 METRICS_DIR/<pid>.json"""
+    if not METRICS_DIR:
+        return
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write_json(os.path.join(METRICS_DIR, f"{os.getpid()}.json"), snapshot())
+    except Exception as e:
+        logger.warning("写入指标快照失败: %s", e)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        write_snapshot()
+
+
+def _merge(totals, samples, kinds=None):
+    """把快照中的样本累加到 totals"""
+    for name, labels, value in samples:
+        metric = _registry.get(name)
+        if metric is None or (kinds is not None and metric.kind not in kinds):
+            continue
+        key = Metric._key(name, labels)
+        if metric.kind != HISTOGRAM:
+            totals[key] = totals.get(key, 0) + value
+            continue
+        state = totals.get(key)
+        if state is None:
+            state = totals[key] = [[0] * len(metric.buckets), 0.0, 0]
+        if len(value[0]) != len(state[0]):
+            # 分桶配置已变化的旧快照
+            continue
+        state[0] = [a + b for a, b in zip(state[0], value[0])]
+        state[1] += value[1]
+        state[2] += value[2]
+
+
+def archive_process(pid):
+    """
+    合并已退出 worker 的计数器和直方图到归档文件，删除其快照（在 gunicorn master 的 child_exit 中调用）
+
+    参数:
+    pid (int): 已退出的 worker 进程 ID
+    """
+    if not METRICS_DIR:
+        return
+    path = os.path.join(METRICS_DIR, f"{pid}.json")
+    samples = _read_json(path)
+    if samples is None:
+        return
+    archive_path = os.path.join(METRICS_DIR, ARCHIVE_FILE)
+    archive = _read_json(archive_path) or {"samples": [], "pids": []}
+    totals = {}
+    _merge(totals, archive["samples"])
+    # 仪表只反映存活进程的状态，不归档
+    _merge(totals, samples, kinds=(COUNTER, HISTOGRAM))
+    archive = {
+        "samples": [
+            [name, dict(labels), value] for (name, labels), value in totals.items()
+        ],
+        "pids": (archive["pids"] + [pid])[-ARCHIVED_PIDS_LIMIT:],
+    }
+    try:
+        _write_json(archive_path, archive)
+        os.remove(path)
+    except OSError as e:
+        logger.warning("归档 worker %s 的指标失败: %s", pid, e)
+
+
+def reset_metrics_dir():
+    """清空指标目录中上次运行留下的快照（在 gunicorn master 启动时调用）"""
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    for name in os.listdir(METRICS_DIR):
+        if name.endswith(".json") or name.endswith(".tmp"):
+            try:
+                os.remove(os.path.join(METRICS_DIR, name))
+            except OSError:
+                pass
+
+
+def remove_metrics_dir():
+    """删除指标目录（在 gunicorn master 退出时调用）"""
+    if METRICS_DIR:
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+
+def collect():
+    """
+    汇总所有进程的指标
+
+    返回:
+    dict: (指标名, 标签) -> 值
+    """
+    totals = {}
+    _merge(totals, snapshot())
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return totals
+    pid = os.getpid()
+    archive = _read_json(os.path.join(METRICS_DIR, ARCHIVE_FILE))
+    skip = {f"{pid}.json"}
+    if archive is not None:
+        _merge(totals, archive["samples"])
+        skip.update(f"{archived}.json" for archived in archive["pids"])
+    for name in os.listdir(METRICS_DIR):
+        if name == ARCHIVE_FILE or name in skip or not name.endswith(".json"):
+            continue
+        samples = _read_json(os.path.join(METRICS_DIR, name))
+        if samples is not None:
+            _merge(totals, samples)
+    return totals
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escaped = (
+        '{}="{}"'.format(
+            key,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for key, value in items
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render_metrics():
+    """
+    以 Prometheus 文本格式输出所有进程汇总后的指标
+
+    返回:
+    str: /metrics 的响应内容
+    """
+    totals = collect()
+    by_name = {}
+    for (name, labels), value in totals.items():
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, metric in _registry.items():
+        lines.append(f"# HELP {name} {metric.description}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for labels, value in sorted(by_name.get(name, [])):
+            if metric.kind != HISTOGRAM:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets, counts):
+                cumulative += bucket_count
+                lines.append(
+                    f"{name}_bucket{_format_labels(labels, [('le', _format_value(float(bound)))])} "
+                    f"{cumulative}"
+                )
+            lines.append(
+                f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}"
+            )
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+
+from app.services.cancellation import StreamCancelled
+from app.services.resilience import (
+    BREAKER_OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 上游服务列表（JSON），每项包含 name、url、api_key（或 api_key_env）、model、weight，
+# 未设置时只使用 DEEPSEEK_API_URL 一个上游
+UPSTREAM_PROVIDERS = os.getenv("UPSTREAM_PROVIDERS", "")
+# 延迟和错误率的指数加权平均系数，越大越偏重最近的请求
+PROVIDER_EWMA_ALPHA = float(os.getenv("PROVIDER_EWMA_ALPHA", "0.2"))
+# 按权重随机选择上游的概率，用于刷新非最快上游的统计
+PROVIDER_EXPLORE_RATE = float(os.getenv("PROVIDER_EXPLORE_RATE", "0.05"))
+# 错误率对评分的放大系数：评分 = 延迟 × (1 + 系数 × 错误率) / 权重
+PROVIDER_ERROR_PENALTY = 4.0
+
+MODE_COMPLETION = "completion"
+MODE_STREAM = "stream"
+
+
+class Provider:
+    """
+    一个兼容 OpenAI 接口的上游服务
+
+    分别记录非流式请求耗时和流式请求首字节耗时的指数加权平均，以及错误率；
+    每个上游有独立的熔断器，熔断期间不参与选择。
+    """
+
+    def __init__(self, name, url, api_key, model=None, weight=1.0, breaker=None):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.weight = max(float(weight), 0.001)
+        self.breaker = breaker or CircuitBreaker()
+        self._lock = threading.Lock()
+        self._latency = {MODE_COMPLETION: None, MODE_STREAM: None}
+        self._error_rate = 0.0
+        self._stats = {"requests": 0, "errors": 0}
+
+    def headers(self):
+        """构建请求头"""
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+        }
+
+    def payload(self, payload):
+        """按上游的模型名调整请求体"""
+        if self.model and payload.get("model") != self.model:
+            return dict(payload, model=self.model)
+        return payload
+
+    def available(self):
+        """熔断器未打开，或已到试探时间"""
+        return self.breaker.state != BREAKER_OPEN or self.breaker.retry_after() <= 0
+
+    def latency(self, mode):
+        with self._lock:
+            return self._latency[mode]
+
+    def score(self, mode):
+        """评分越低越优先；没有样本时返回 None"""
+        with self._lock:
+            latency = self._latency[mode]
+            error_rate = self._error_rate
+        if latency is None:
+            return None
+        return latency * (1 + PROVIDER_ERROR_PENALTY * error_rate) / self.weight
+
+    def record_success(self, mode, seconds):
+        with self._lock:
+            previous = self._latency[mode]
+            self._latency[mode] = (
+                seconds
+                if previous is None
+                else previous + PROVIDER_EWMA_ALPHA * (seconds - previous)
+            )
+            self._error_rate -= PROVIDER_EWMA_ALPHA * self._error_rate
+            self._stats["requests"] += 1
+        self.breaker.record_success()
+
+    def record_failure(self, error):
+        with self._lock:
+            self._error_rate += PROVIDER_EWMA_ALPHA * (1 - self._error_rate)
+            self._stats["requests"] += 1
+            self._stats["errors"] += 1
+        self.breaker.record_failure(error)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats, error_rate=round(self._error_rate, 4))
+            for mode, latency in self._latency.items():
+                stats[f"{mode}_latency_ms"] = (
+                    round(latency * 1000, 1) if latency is not None else None
+                )
+        stats["breaker"] = self.breaker.get_stats()["state"]
+        stats["weight"] = self.weight
+        return stats
+
+
+class ProviderRouter:
+    """
+    上游路由
+
+    每个请求发往当前评分最低（最快且健康）的上游；没有样本的上游按权重随机选择，
+    并以 PROVIDER_EXPLORE_RATE 的概率按权重随机选择以刷新统计。
+    请求失败重试时排除本次已经失败的上游，按同样的规则选择下一个。
+    """
+
+    def __init__(self, providers, explore_rate=PROVIDER_EXPLORE_RATE, rng=None):
+        if not providers:
+            raise ValueError("至少需要配置一个上游服务")
+        self.providers = list(providers)
+        self.explore_rate = explore_rate
+        self._random = rng or random.Random()
+
+    def has_credentials(self):
+        """是否至少有一个上游配置了密钥"""
+        return any(provider.api_key for provider in self.providers)
+
+    def _weighted_choice(self, providers):
+        total = sum(provider.weight for provider in providers)
+        point = self._random.uniform(0, total)
+        for provider in providers:
+            point -= provider.weight
+            if point <= 0:
+                return provider
+        return providers[-1]
+
+    def rank(self, mode, exclude=()):
+        """
+        按选择顺序排列可用的上游
+
+        参数:
+        mode (str): 请求类型，completion 或 stream
+        exclude (iterable): 需要排除的上游名称
+
+        返回:
+        list: 可用的上游，第一个为首选
+        """
+        candidates = [
+            provider
+            for provider in self.providers
+            if provider.name not in exclude and provider.available()
+        ]
+        if not candidates:
+            return []
+        unmeasured = [p for p in candidates if p.score(mode) is None]
+        if unmeasured:
+            first = self._weighted_choice(unmeasured)
+        elif len(candidates) > 1 and self._random.random() < self.explore_rate:
+            first = self._weighted_choice(candidates)
+        else:
+            first = None
+        ordered = sorted(
+            candidates,
+            key=lambda p: (p.score(mode) is None, p.score(mode) or 0, -p.weight),
+        )
+        if first is not None:
+            ordered.remove(first)
+            ordered.insert(0, first)
+        return ordered
+
+    def select(self, mode, exclude=()):
+        """
+        选择一个上游并占用其熔断器的试探名额
+
+        所有上游都被排除时忽略排除列表重新选择
+
+        异常:
+        CircuitOpenError: 所有上游都已熔断
+        """
+        ranked = self.rank(mode, exclude) or self.rank(mode)
+        for provider in ranked:
+            try:
+                provider.breaker.before_call()
+            except CircuitOpenError:
+                continue
+            return provider
+        retry_after = min(provider.breaker.retry_after() for provider in self.providers)
+        raise CircuitOpenError(max(retry_after, 0))
+
+    @contextmanager
+    def track(self, provider, mode):
+        """
+        记录一次请求的结果
+
+        非流式请求记录完整耗时；流式请求在调用方进入 with 块时（已收到响应头）记录首字节耗时
+        """
+        start = time.monotonic()
+        try:
+            yield
+        except StreamCancelled:
+            # 请求被主动取消，不是上游故障
+            raise
+        except Exception as e:
+            provider.record_failure(e)
+            logger.warning("上游 %s 请求失败: %s", provider.name, e)
+            raise
+        provider.record_success(mode, time.monotonic() - start)
+
+    def get_stats(self):
+        return {provider.name: provider.get_stats() for provider in self.providers}
+
+
+def load_providers(
+    config=UPSTREAM_PROVIDERS,
+    default_url=None,
+    default_api_key=None,
+    default_model=None,
+):
+    """
+    从 JSON 配置加载上游服务列表
+
+    参数:
+    config (str): JSON 数组；为空时使用默认上游
+    default_url (str): 默认上游地址
+    default_api_key (str): 默认上游密钥
+    default_model (str): 默认模型
+
+    返回:
+    list: Provider 列表
+    """
+    if not config:
+        return [Provider("deepseek", default_url, default_api_key, default_model)]
+
+    providers = []
+    for index, item in enumerate(json.loads(config)):
+        api_key = item.get("api_key")
+        if not api_key and item.get("api_key_env"):
+            api_key = os.getenv(item["api_key_env"])
+        providers.append(
+            Provider(
+                name=item.get("name") or f"provider-{index}",
+                url=item["url"],
+                api_key=api_key or default_api_key,
+                model=item.get("model") or default_model,
+                weight=item.get("weight", 1.0),
+            )
+        )
+    logger.info("已加载 %s 个上游服务", len(providers))
+    return providers
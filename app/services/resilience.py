@@ -0,0 +1,383 @@
+import os
+import time
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+
+from app.services.cancellation import CancelScope, cancel_scope, current_scope
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 非流式请求失败后的重试次数
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+# 重试的基础等待时间和最长等待时间（秒），实际等待时间为指数退避上限内的随机值
+UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", "0.2"))
+UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", "2"))
+# 一次调用（包括所有重试）的总时间上限（秒），超过后不再重试
+UPSTREAM_RETRY_DEADLINE = float(os.getenv("UPSTREAM_RETRY_DEADLINE", "60"))
+# 对冲请求的延迟百分位，例如 95 表示请求耗时超过最近 p95 时再发一个相同请求；0 表示关闭
+UPSTREAM_HEDGE_PERCENTILE = float(os.getenv("UPSTREAM_HEDGE_PERCENTILE", "0"))
+# 计算百分位所需的最少样本数，样本不足时不对冲
+UPSTREAM_HEDGE_MIN_SAMPLES = int(os.getenv("UPSTREAM_HEDGE_MIN_SAMPLES", "20"))
+# 连续失败多少次后熔断
+UPSTREAM_BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+# 熔断后多久（秒）允许一次试探请求
+UPSTREAM_BREAKER_RESET = float(os.getenv("UPSTREAM_BREAKER_RESET", "30"))
+
+# 计算延迟百分位时保留的最近样本数
+LATENCY_WINDOW = 200
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class UpstreamRejected(requests.exceptions.RequestException):
+    """
+    请求没有发往上游就被拒绝（熔断或排队超时），调用方应按上游暂时不可用处理
+
+    retry_after 为建议客户端等待的秒数
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamRejected):
+    """上游已熔断，请求被直接拒绝"""
+
+    def __init__(self, retry_after):
+        super().__init__(
+            f"上游服务暂时不可用，请在 {int(retry_after) + 1} 秒后重试", retry_after
+        )
+
+
+class UpstreamUnavailable(Exception):
+    """上游熔断且没有缓存结果可用，调用方应返回 503"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error):
+    """
+    判断上游错误是否值得重试，同时也是熔断器计数的依据
+
+    连接错误、超时、429 和 5xx 视为上游故障；其他 4xx 是请求本身的问题，重试无意义
+    """
+    if isinstance(error, UpstreamRejected):
+        return False
+    if isinstance(
+        error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    ):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is not None and (
+            response.status_code == 429 or response.status_code >= 500
+        )
+    return False
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败达到阈值后打开，打开期间直接拒绝请求；经过恢复时间后进入半开状态，
+    只放行一个试探请求，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(
+        self,
+        failure_threshold=UPSTREAM_BREAKER_FAILURES,
+        reset_timeout=UPSTREAM_BREAKER_RESET,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = BREAKER_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def before_call(self):
+        """
+        请求前检查，熔断时抛出 CircuitOpenError
+
+        半开状态下只允许一个试探请求
+        """
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self._state == BREAKER_OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    self._stats["rejected"] += 1
+                    raise CircuitOpenError(remaining)
+                self._state = BREAKER_HALF_OPEN
+                self._probing = False
+            if self._state == BREAKER_HALF_OPEN:
+                if self._probing:
+                    self._stats["rejected"] += 1
+                    raise CircuitOpenError(self.reset_timeout)
+                self._probing = True
+
+    def retry_after(self):
+        """熔断打开时距离允许试探的秒数，未打开时为 0"""
+        with self._lock:
+            if self._state != BREAKER_OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            if self._state != BREAKER_CLOSED:
+                logger.info("上游恢复，熔断器关闭")
+            self._state = BREAKER_CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, error):
+        """记录一次失败，只统计上游故障"""
+        if not is_retryable(error):
+            # 非上游故障（如 400）说明上游可用
+            self.record_success()
+            return
+        with self._lock:
+            self._failures += 1
+            if self._state == BREAKER_HALF_OPEN or (
+                self._state == BREAKER_CLOSED
+                and self._failures >= self.failure_threshold
+            ):
+                if self._state != BREAKER_OPEN:
+                    self._stats["opened"] += 1
+                    logger.warning("上游连续失败 %s 次，熔断器打开", self._failures)
+                self._state = BREAKER_OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def reset(self):
+        with self._lock:
+            self._state = BREAKER_CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def get_stats(self):
+        with self._lock:
+            return dict(
+                self._stats, state=self._state, consecutive_failures=self._failures
+            )
+
+
+class LatencyTracker:
+    """记录最近的成功请求耗时，计算百分位"""
+
+    def __init__(self, size=LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent, min_samples=1):
+        """返回百分位耗时（秒），样本不足时返回 None"""
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index]
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+class ResilientUpstream:
+    """
+    上游调用的容错层：带抖动的指数退避重试、可选的对冲请求，以及可选的整体熔断器
+
+    只用于可以安全重复的非流式请求。配置了多个上游时，熔断由每个上游各自的熔断器负责
+    （见 app/services/providers.py），此时不需要整体熔断器。
+    """
+
+    def __init__(
+        self,
+        breaker=None,
+        retries=UPSTREAM_RETRIES,
+        base_delay=UPSTREAM_RETRY_BASE_DELAY,
+        max_delay=UPSTREAM_RETRY_MAX_DELAY,
+        deadline=UPSTREAM_RETRY_DEADLINE,
+        hedge_percentile=UPSTREAM_HEDGE_PERCENTILE,
+        hedge_min_samples=UPSTREAM_HEDGE_MIN_SAMPLES,
+    ):
+        self.breaker = breaker
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyTracker()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._stats = {"calls": 0, "retries": 0, "hedged": 0, "hedge_wins": 0}
+
+    def _get_executor(self):
+        """获取当前进程的对冲线程池，fork 之后重新创建"""
+        pid = os.getpid()
+        with self._lock:
+            if self._executor is None or self._executor_pid != pid:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=32, thread_name_prefix="upstream-hedge"
+                )
+                self._executor_pid = pid
+            return self._executor
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def backoff(self, attempt):
+        """第 attempt 次重试前的等待时间（秒），在指数退避上限内均匀随机"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _timed(self, func):
+        start = time.monotonic()
+        result = func()
+        self.latency.record(time.monotonic() - start)
+        return result
+
+    def _scoped(self, func, scope):
+        with cancel_scope(scope):
+            return self._timed(func)
+
+    def _submit(self, func):
+        """
+        在线程池中发出一次请求
+
+        请求在当前上下文的副本中执行，请求 ID、优先级和计数器随之传递；
+        每次请求有单独的取消范围（当前取消范围的子范围），落后的请求可以单独取消
+
+        返回:
+        tuple: (future, 取消范围)
+        """
+        scope = CancelScope(parent=current_scope())
+        future = self._get_executor().submit(
+            contextvars.copy_context().run, self._scoped, func, scope
+        )
+        return future, scope
+
+    def _hedged(self, func):
+        """
+        请求耗时超过延迟百分位时再发一个相同请求，返回先成功的结果
+
+        先成功的请求返回后取消另一个请求：关闭其上游响应，尚未发出的请求不再发出
+        """
+        threshold = None
+        if self.hedge_percentile > 0:
+            threshold = self.latency.percentile(
+                self.hedge_percentile, self.hedge_min_samples
+            )
+        if threshold is None:
+            return self._timed(func)
+
+        first, first_scope = self._submit(func)
+        done, _ = wait([first], timeout=threshold)
+        if done:
+            return first.result()
+
+        self._count("hedged")
+        second, second_scope = self._submit(func)
+        scopes = {first: first_scope, second: second_scope}
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        self._count("hedge_wins")
+                    for loser in pending:
+                        scopes[loser].cancel()
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def call(self, func):
+        """
+        以容错方式调用上游
+
+        参数:
+        func (callable): 无参函数，发送一次请求并返回结果，失败时抛出 requests 异常
+
+        返回:
+        func 的返回值
+
+        异常:
+        CircuitOpenError: 上游已熔断
+        requests.exceptions.RequestException: 重试后仍然失败
+        """
+        self._count("calls")
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.before_call()
+            try:
+                result = self._hedged(func)
+            except Exception as e:
+                if self.breaker is not None:
+                    self.breaker.record_failure(e)
+                delay = self.backoff(attempt)
+                if (
+                    attempt >= self.retries
+                    or not is_retryable(e)
+                    or time.monotonic() + delay > deadline
+                ):
+                    raise
+                attempt += 1
+                self._count("retries")
+                logger.warning(
+                    "上游请求失败，%.2f 秒后第 %s 次重试: %s", delay, attempt, e
+                )
+                time.sleep(delay)
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        if self.breaker is not None:
+            stats["breaker"] = self.breaker.get_stats()
+        p50 = self.latency.percentile(50)
+        p95 = self.latency.percentile(95)
+        stats["latency_p50_ms"] = round(p50 * 1000, 1) if p50 is not None else None
+        stats["latency_p95_ms"] = round(p95 * 1000, 1) if p95 is not None else None
+        return stats
+
+
+upstream = ResilientUpstream()
+
+
+def get_resilience_stats():
+    """获取上游容错统计"""
+    return upstream.get_stats()
@@ -0,0 +1,465 @@
+import os
+import time
+import asyncio
+import logging
+import tempfile
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager, asynccontextmanager
+
+from app.services.resilience import UpstreamRejected, LatencyTracker
+from app.services.metrics import upstream_queue_wait
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 每个 worker 同时进行的上游请求数上限，0 表示不限制。
+# 流式请求在整个流期间占用名额，上限低于 worker 同时处理的连接数（gunicorn 的 worker_connections）时，
+# 超出上限的流要排队等待前面的流结束，可能排队超时，因此默认不限制，需要限流时优先使用令牌预算
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "0"))
+# 同一节点所有 worker 同时进行的上游请求数上限，0 表示不限制；通过文件锁在 worker 之间协调
+UPSTREAM_GLOBAL_CONCURRENCY = int(os.getenv("UPSTREAM_GLOBAL_CONCURRENCY", "0"))
+# 全局并发上限使用的锁文件目录
+UPSTREAM_ADMISSION_LOCK_DIR = os.getenv(
+    "UPSTREAM_ADMISSION_LOCK_DIR", tempfile.gettempdir()
+)
+# 每个 worker 每分钟发往上游的令牌预算（提示词估算令牌数 + max_tokens），0 表示不限制
+UPSTREAM_TOKENS_PER_MINUTE = int(os.getenv("UPSTREAM_TOKENS_PER_MINUTE", "0"))
+# 排队的最长时间（秒），超时后按上游不可用处理
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "30"))
+# 排队每超过该秒数，请求的优先级提升一级，避免低优先级请求一直等待
+UPSTREAM_QUEUE_AGING = float(os.getenv("UPSTREAM_QUEUE_AGING", "10"))
+# 等待全局并发名额时轮询文件锁的间隔（秒），gevent worker 中不能阻塞等待文件锁
+ADMISSION_LOCK_POLL_INTERVAL = 0.01
+
+# 优先级，数值越小越先获得名额
+PRIORITY_INTERACTIVE = 0
+PRIORITY_STANDARD = 1
+PRIORITY_BATCH = 2
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_STANDARD: "standard",
+    PRIORITY_BATCH: "batch",
+}
+
+_current_priority = contextvars.ContextVar(
+    "upstream_priority", default=PRIORITY_STANDARD
+)
+
+
+@contextmanager
+def request_priority(priority):
+    """
+    设置当前上下文中上游请求的优先级
+
+    参数:
+    priority (int): PRIORITY_INTERACTIVE、PRIORITY_STANDARD 或 PRIORITY_BATCH
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority():
+    return _current_priority.get()
+
+
+class QueueTimeout(UpstreamRejected):
+    """排队等待上游名额超时，按上游暂时不可用处理"""
+
+    def __init__(self, waited, retry_after=1.0):
+        super().__init__(
+            f"上游请求排队 {waited:.1f} 秒仍未获得名额，请稍后重试", retry_after
+        )
+
+
+class _Waiter:
+    """
+    一个排队中的请求
+
+    线程中排队的请求等待 threading.Event；事件循环中排队的请求（loop 不为 None）等待一个 future，
+    由放行名额的线程通过 call_soon_threadsafe 唤醒，排队期间不占用线程
+    """
+
+    def __init__(self, priority, tokens, seq, loop=None):
+        self.priority = priority
+        self.tokens = tokens
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+        self.granted = False
+
+    def wake(self):
+        """唤醒等待中的请求（调用方持有调度器的锁）"""
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+    def rank(self, now, aging):
+        """排队越久优先级越高，同一优先级先到先得"""
+        priority = self.priority
+        if aging > 0:
+            priority -= (now - self.enqueued_at) / aging
+        return (priority, self.seq)
+
+
+class _GlobalSlots:
+    """
+    同一节点所有 worker 共享的并发名额
+
+    锁文件中的每个字节是一个名额，worker 用 fcntl 记录锁占用其中一个，
+    进程退出时操作系统自动释放。同一进程内 fcntl 记录锁不互斥，因此进程内另外记录已占用的名额。
+    """
+
+    def __init__(self, limit, lock_dir):
+        self.limit = limit
+        self.lock_dir = lock_dir
+        self._lock = threading.Lock()
+        self._fd = None
+        self._fd_pid = None
+        self._taken = set()
+        self._next = 0
+
+    def _get_fd(self):
+        """获取当前进程的锁文件描述符，fork 之后重新打开（调用方持有 _lock）"""
+        pid = os.getpid()
+        if self._fd is None or self._fd_pid != pid:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            self._fd = os.open(
+                os.path.join(self.lock_dir, "upstream-admission.lock"),
+                os.O_RDWR | os.O_CREAT,
+                0o644,
+            )
+            self._fd_pid = pid
+            self._taken = set()
+        return self._fd
+
+    def _try_acquire(self):
+        import fcntl
+
+        with self._lock:
+            fd = self._get_fd()
+            for _ in range(self.limit):
+                slot = self._next
+                self._next = (self._next + 1) % self.limit
+                if slot in self._taken:
+                    continue
+                try:
+                    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot)
+                except OSError:
+                    continue
+                self._taken.add(slot)
+                return slot
+        return None
+
+    def acquire(self, deadline):
+        """占用一个名额，返回名额序号；超过 deadline 仍未获得时返回 None"""
+        while True:
+            slot = self._try_acquire()
+            if slot is not None or time.monotonic() >= deadline:
+                return slot
+            time.sleep(ADMISSION_LOCK_POLL_INTERVAL)
+
+    async def acquire_async(self, deadline):
+        """与 acquire 相同，在事件循环中轮询"""
+        while True:
+            slot = self._try_acquire()
+            if slot is not None or time.monotonic() >= deadline:
+                return slot
+            await asyncio.sleep(ADMISSION_LOCK_POLL_INTERVAL)
+
+    def release(self, slot):
+        import fcntl
+
+        with self._lock:
+            self._taken.discard(slot)
+            fcntl.lockf(self._get_fd(), fcntl.LOCK_UN, 1, slot)
+
+
+class AdmissionScheduler:
+    """
+    上游请求的准入调度
+
+    请求在发往上游前排队，同时满足以下条件时才放行：当前 worker 的并发数低于上限、
+    令牌桶中有足够的令牌、（配置了全局上限时）节点上还有空闲的全局名额。
+    排队的请求按优先级放行（交互式流式请求优先于批量请求），同一优先级先到先得，
+    排队越久优先级越高。
+    """
+
+    def __init__(
+        self,
+        max_concurrency=UPSTREAM_MAX_CONCURRENCY,
+        tokens_per_minute=UPSTREAM_TOKENS_PER_MINUTE,
+        global_concurrency=UPSTREAM_GLOBAL_CONCURRENCY,
+        lock_dir=UPSTREAM_ADMISSION_LOCK_DIR,
+        timeout=UPSTREAM_QUEUE_TIMEOUT,
+        aging=UPSTREAM_QUEUE_AGING,
+    ):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.timeout = timeout
+        self.aging = aging
+        self.global_slots = (
+            _GlobalSlots(global_concurrency, lock_dir)
+            if global_concurrency > 0
+            else None
+        )
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._wait_times = {priority: LatencyTracker() for priority in PRIORITY_NAMES}
+        self._stats = {"admitted": 0, "queued": 0, "timeouts": 0, "tokens": 0}
+
+    def _refill(self, now):
+        """按经过的时间补充令牌，桶容量为一分钟的预算"""
+        if self.tokens_per_minute <= 0:
+            return
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._tokens = min(
+            float(self.tokens_per_minute),
+            self._tokens + elapsed * self.tokens_per_minute / 60,
+        )
+
+    def _cost(self, tokens):
+        """单个请求最多消耗一整桶令牌，否则永远无法放行"""
+        if self.tokens_per_minute <= 0:
+            return 0
+        return min(max(int(tokens), 1), self.tokens_per_minute)
+
+    def _can_admit(self, waiter):
+        if self.max_concurrency > 0 and self._in_flight >= self.max_concurrency:
+            return False
+        return self._tokens >= self._cost(waiter.tokens)
+
+    def _admit(self, waiter):
+        self._in_flight += 1
+        if self.tokens_per_minute > 0:
+            self._tokens -= self._cost(waiter.tokens)
+        self._stats["admitted"] += 1
+        self._stats["tokens"] += waiter.tokens
+        waiter.granted = True
+        waiter.wake()
+
+    def _dispatch(self):
+        """按排队顺序放行队首的请求，队首无法放行时后面的请求继续等待，保证公平"""
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters:
+            head = min(self._waiters, key=lambda waiter: waiter.rank(now, self.aging))
+            if not self._can_admit(head):
+                break
+            self._waiters.remove(head)
+            self._admit(head)
+
+    def _refill_wait(self):
+        """队首因令牌不足等待时，距离令牌足够的秒数"""
+        if self.tokens_per_minute <= 0 or not self._waiters:
+            return None
+        now = time.monotonic()
+        head = min(self._waiters, key=lambda waiter: waiter.rank(now, self.aging))
+        missing = self._cost(head.tokens) - self._tokens
+        if missing <= 0:
+            return None
+        return missing * 60 / self.tokens_per_minute
+
+    def _enqueue(self, priority, tokens, loop=None):
+        """没有排队的请求且可以放行时直接放行，否则加入队列"""
+        with self._lock:
+            waiter = _Waiter(priority, tokens, next(self._seq), loop)
+            self._refill(time.monotonic())
+            if not self._waiters and self._can_admit(waiter):
+                self._admit(waiter)
+                return waiter
+            self._waiters.append(waiter)
+            self._stats["queued"] += 1
+        return waiter
+
+    def _wait_timeout(self, deadline):
+        """下一次等待的秒数：到排队截止时间，或到队首的令牌补足为止"""
+        remaining = deadline - time.monotonic()
+        with self._lock:
+            refill_wait = self._refill_wait()
+        timeout = remaining if refill_wait is None else min(remaining, refill_wait)
+        return max(timeout, 0)
+
+    def _check_waiter(self, waiter, deadline):
+        """被唤醒或等待超时后检查：已放行返回 True，排队超时返回 False，否则返回 None 继续等待"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._dispatch()
+            if waiter.granted:
+                return True
+            if time.monotonic() >= deadline:
+                self._waiters.remove(waiter)
+                self._stats["timeouts"] += 1
+                # 队首超时离开后，后面的请求可能已经可以放行
+                self._dispatch()
+                return False
+        return None
+
+    def _acquire_local(self, priority, tokens, deadline):
+        waiter = self._enqueue(priority, tokens)
+        granted = waiter.granted or None
+        while granted is None:
+            waiter.event.wait(self._wait_timeout(deadline))
+            granted = self._check_waiter(waiter, deadline)
+        return waiter if granted else None
+
+    async def _acquire_local_async(self, priority, tokens, deadline):
+        waiter = self._enqueue(priority, tokens, asyncio.get_running_loop())
+        granted = waiter.granted or None
+        try:
+            while granted is None:
+                try:
+                    await asyncio.wait_for(
+                        asyncio.shield(waiter.future), self._wait_timeout(deadline)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                granted = self._check_waiter(waiter, deadline)
+        except asyncio.CancelledError:
+            # 排队期间被取消：离开队列，已经放行的名额立即归还
+            with self._lock:
+                if waiter.granted:
+                    self._in_flight -= 1
+                else:
+                    self._waiters.remove(waiter)
+                self._dispatch()
+            raise
+        return waiter if granted else None
+
+    def _release_local(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    @contextmanager
+    def admit(self, tokens=0, priority=None):
+        """
+        获得上游请求名额，with 块结束时归还
+
+        参数:
+        tokens (int): 请求预计消耗的令牌数（提示词估算令牌数 + max_tokens）
+        priority (int): 优先级，为 None 时使用当前上下文的优先级
+
+        异常:
+        QueueTimeout: 超过排队时间仍未获得名额
+        """
+        if priority is None:
+            priority = current_priority()
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        waiter = self._acquire_local(priority, tokens, deadline)
+        if waiter is None:
+            self._record_wait(priority, start)
+            raise QueueTimeout(time.monotonic() - start)
+
+        slot = None
+        try:
+            if self.global_slots is not None:
+                slot = self.global_slots.acquire(deadline)
+                if slot is None:
+                    with self._lock:
+                        self._stats["timeouts"] += 1
+                    raise QueueTimeout(time.monotonic() - start)
+            self._record_wait(priority, start)
+            yield
+        finally:
+            if slot is not None:
+                self.global_slots.release(slot)
+            self._release_local()
+
+    @asynccontextmanager
+    async def admit_async(self, tokens=0, priority=None):
+        """
+        获得上游请求名额的协程版本，参数和异常与 admit 相同
+
+        在事件循环中等待名额，排队期间不占用线程池的线程；async with 块结束或协程被取消时归还名额
+        """
+        if priority is None:
+            priority = current_priority()
+        start = time.monotonic()
+        deadline = start + self.timeout
+
+        waiter = await self._acquire_local_async(priority, tokens, deadline)
+        if waiter is None:
+            self._record_wait(priority, start)
+            raise QueueTimeout(time.monotonic() - start)
+
+        slot = None
+        try:
+            if self.global_slots is not None:
+                slot = await self.global_slots.acquire_async(deadline)
+                if slot is None:
+                    with self._lock:
+                        self._stats["timeouts"] += 1
+                    raise QueueTimeout(time.monotonic() - start)
+            self._record_wait(priority, start)
+            yield
+        finally:
+            if slot is not None:
+                self.global_slots.release(slot)
+            self._release_local()
+
+    def _record_wait(self, priority, start):
+        waited = time.monotonic() - start
+        self._wait_times[priority].record(waited)
+        upstream_queue_wait.observe(waited, priority=PRIORITY_NAMES[priority])
+
+    def reset_stats(self):
+        """清零累计统计（fork 之后丢弃从 master 继承的统计），进行中和排队的请求数不变"""
+        with self._lock:
+            self._stats = {"admitted": 0, "queued": 0, "timeouts": 0, "tokens": 0}
+
+    def get_stats(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            stats = dict(
+                self._stats,
+                in_flight=self._in_flight,
+                waiting=len(self._waiters),
+                max_concurrency=self.max_concurrency,
+                global_concurrency=(
+                    self.global_slots.limit if self.global_slots is not None else 0
+                ),
+            )
+            if self.tokens_per_minute > 0:
+                stats["tokens_available"] = int(self._tokens)
+                stats["tokens_per_minute"] = self.tokens_per_minute
+        queue_wait = {}
+        for priority, name in PRIORITY_NAMES.items():
+            tracker = self._wait_times[priority]
+            p50 = tracker.percentile(50)
+            p95 = tracker.percentile(95)
+            queue_wait[name] = {
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            }
+        stats["queue_wait"] = queue_wait
+        return stats
+
+
+upstream_scheduler = AdmissionScheduler()
+
+
+def get_admission_stats():
+    """获取上游准入调度统计"""
+    return upstream_scheduler.get_stats()
@@ -0,0 +1,313 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from app.services.cancellation import CancelScope, StreamCancelled, cancel_scope
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 是否合并相同的进行中翻译请求，设置为 0 时关闭
+TRANSLATION_COALESCE = os.getenv("TRANSLATION_COALESCE", "1") != "0"
+# 设置后启用跨 worker 合并：同一节点的 worker 通过该目录下的文件锁互相等待，
+# 需要同时配置 TRANSLATION_CACHE_DB，等待结束后从共享缓存读取结果
+COALESCE_LOCK_DIR = os.getenv("COALESCE_LOCK_DIR", "")
+# 等待其他 worker 的最长时间（秒），超时后自行请求上游
+COALESCE_LOCK_TIMEOUT = float(os.getenv("COALESCE_LOCK_TIMEOUT", "60"))
+# 轮询文件锁的间隔（秒），gevent worker 中不能阻塞等待文件锁
+COALESCE_LOCK_POLL_INTERVAL = 0.05
+
+_stats_lock = threading.Lock()
+_stats = {"cross_worker_waits": 0, "cross_worker_coalesced": 0}
+
+
+class _Call:
+    """一次进行中的调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    合并相同键的进行中调用
+
+    同一个键同时只执行一次函数，执行期间到达的相同调用等待并共享同一个结果或异常
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key, func):
+        """
+        执行 func，或等待进行中的相同调用
+
+        参数:
+        key (str): 调用的键
+        func (callable): 无参函数
+
+        返回:
+        func 的返回值
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["leaders"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+class _StreamFlight:
+    """一次进行中的上游流"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.events = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.subscribers = 0
+        # 所有订阅者断开时立即关闭上游响应
+        self.scope = CancelScope()
+
+
+class StreamBroadcaster:
+    """
+    将一个上游流广播给多个订阅者
+
+    第一个订阅者启动后台线程读取上游流，数据块保存在缓冲区中；之后到达的订阅者
+    先回放已缓冲的数据块，再实时接收后续数据块。所有订阅者都断开时立即关闭上游响应，
+    停止读取上游流。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {"streams": 0, "coalesced": 0, "abandoned": 0}
+
+    def _produce(self, key, flight, factory):
+        """在后台线程中读取上游流"""
+        with cancel_scope(flight.scope):
+            self._read(key, flight, factory)
+
+    def _read(self, key, flight, factory):
+        """逐个读取上游数据块写入缓冲区"""
+        generator = factory()
+        try:
+            while True:
+                # 加锁顺序与 subscribe 一致，放弃后新的订阅者会创建新的流
+                with self._lock, flight.cond:
+                    if flight.subscribers == 0:
+                        # 所有订阅者都已断开，不再读取上游
+                        self._stats["abandoned"] += 1
+                        if self._flights.get(key) is flight:
+                            del self._flights[key]
+                        break
+                try:
+                    event = next(generator)
+                except StopIteration as stop:
+                    flight.result = stop.value
+                    break
+                with flight.cond:
+                    flight.events.append(event)
+                    flight.cond.notify_all()
+        except StreamCancelled:
+            with self._lock:
+                self._stats["abandoned"] += 1
+        except Exception as e:
+            flight.error = e
+        finally:
+            generator.close()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def subscribe(self, key, factory):
+        """
+        订阅键对应的流，没有进行中的流时用 factory 创建
+
+        参数:
+        key (str): 流的键
+        factory (callable): 无参函数，返回上游数据块的生成器，生成器的返回值会传给所有订阅者
+
+        返回:
+        generator: 依次输出所有数据块，返回值为上游生成器的返回值
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _StreamFlight()
+                self._flights[key] = flight
+                self._stats["streams"] += 1
+            else:
+                self._stats["coalesced"] += 1
+            with flight.cond:
+                flight.subscribers += 1
+
+        if leader:
+            # 上游流在发起请求的上下文副本中读取，日志和耗时分段记在该请求名下
+            threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(self._produce, key, flight, factory),
+                name="stream-flight",
+                daemon=True,
+            ).start()
+
+        index = 0
+        try:
+            while True:
+                with flight.cond:
+                    while index >= len(flight.events) and not flight.done:
+                        flight.cond.wait()
+                    events = flight.events[index:]
+                    index = len(flight.events)
+                    done = flight.done
+                for event in events:
+                    yield event
+                if done and not events:
+                    break
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        finally:
+            with self._lock, flight.cond:
+                flight.subscribers -= 1
+                abandoned = flight.subscribers == 0 and not flight.done
+                if abandoned and self._flights.get(key) is flight:
+                    # 新的订阅者不再加入即将取消的流
+                    del self._flights[key]
+            if abandoned:
+                flight.scope.cancel()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._flights))
+
+
+_lock_fd = None
+_lock_fd_pid = None
+
+
+def _get_lock_fd(lock_dir):
+    """
+    获取当前进程的锁文件描述符
+
+    fcntl 记录锁在进程关闭该文件的任意描述符时全部释放，因此每个进程只打开一次
+    """
+    global _lock_fd, _lock_fd_pid
+    pid = os.getpid()
+    with _stats_lock:
+        if _lock_fd is None or _lock_fd_pid != pid:
+            os.makedirs(lock_dir, exist_ok=True)
+            _lock_fd = os.open(
+                os.path.join(lock_dir, "coalesce.lock"), os.O_RDWR | os.O_CREAT, 0o644
+            )
+            _lock_fd_pid = pid
+        return _lock_fd
+
+
+@contextmanager
+def worker_lock(key, lock_dir=None, timeout=None):
+    """
+    跨 worker 的键锁
+
+    每个键对应锁文件中的一个字节区间，同一节点的多个 worker 对相同的键互斥，
+    不同的键互不影响，也不会产生大量锁文件。
+
+    参数:
+    key (str): 十六进制键（如缓存键）
+    lock_dir (str): 锁文件目录，为空时不加锁
+    timeout (float): 等待其他 worker 的最长时间（秒）
+
+    返回:
+    bool: 是否等待过其他 worker（等待过时调用方应先检查共享缓存）
+    """
+    lock_dir = COALESCE_LOCK_DIR if lock_dir is None else lock_dir
+    timeout = COALESCE_LOCK_TIMEOUT if timeout is None else timeout
+    if not lock_dir:
+        yield False
+        return
+
+    import fcntl
+
+    fd = _get_lock_fd(lock_dir)
+    offset = int(key[:15], 16)
+    deadline = time.monotonic() + timeout
+    waited = False
+    acquired = False
+    while True:
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+            acquired = True
+            break
+        except OSError:
+            if not waited:
+                waited = True
+                with _stats_lock:
+                    _stats["cross_worker_waits"] += 1
+            if time.monotonic() >= deadline:
+                logger.warning("等待其他 worker 的相同翻译超时，直接请求上游")
+                break
+            time.sleep(COALESCE_LOCK_POLL_INTERVAL)
+    try:
+        yield waited
+    finally:
+        if acquired:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, offset)
+
+
+def record_cross_worker_coalesced():
+    """记录一次通过共享缓存复用其他 worker 结果的请求"""
+    with _stats_lock:
+        _stats["cross_worker_coalesced"] += 1
+
+
+translation_flights = SingleFlight()
+stream_flights = StreamBroadcaster()
+
+
+def get_coalescing_stats():
+    """获取请求合并统计"""
+    with _stats_lock:
+        cross_worker = dict(_stats)
+    return {
+        "enabled": TRANSLATION_COALESCE,
+        "translations": translation_flights.get_stats(),
+        "streams": stream_flights.get_stats(),
+        "cross_worker": cross_worker,
+    }
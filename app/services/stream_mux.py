@@ -0,0 +1,156 @@
+import os
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.cancellation import CancelScope, cancel_scope, current_scope
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 尚未轮到输出的分块最多缓冲的数据块数，超出后暂停读取该分块的上游流
+TRANSLATION_STREAM_BUFFER_EVENTS = int(
+    os.getenv("TRANSLATION_STREAM_BUFFER_EVENTS", "1024")
+)
+
+
+class OrderedStreamMux:
+    """
+    按顺序合并多个并发的流
+
+    所有分块的上游流同时读取，第一个分块的数据块实时输出，后续分块的数据块先缓冲，
+    轮到该分块时再依次输出。每个分块的缓冲区有上限，写满后该分块的读取线程等待，
+    内存占用有界。
+
+    某个分块出错时，如果它的数据块还没有输出给客户端，就丢弃缓冲并调用 fallback
+    重新生成该分块；否则输出一个带分块序号的 error 数据块，继续输出后续分块。
+
+    合并被关闭（客户端断开）或所在的取消范围被取消时，立即关闭所有分块的上游响应。
+    """
+
+    def __init__(
+        self,
+        streams,
+        fallback=None,
+        concurrency=4,
+        max_buffered_events=TRANSLATION_STREAM_BUFFER_EVENTS,
+    ):
+        """
+        参数:
+        streams (list): 每个分块一个无参函数，调用后返回该分块的生成器
+        fallback (callable): 接收分块序号、返回替代数据块列表的函数
+        concurrency (int): 同时读取的上游流数量上限
+        max_buffered_events (int): 每个分块缓冲的数据块数上限
+        """
+        self.streams = list(streams)
+        self.fallback = fallback
+        self.concurrency = max(1, concurrency)
+        self.max_buffered_events = max(1, max_buffered_events)
+        self.failed = set()
+
+        count = len(self.streams)
+        self._cond = threading.Condition()
+        self._buffers = [deque() for _ in range(count)]
+        self._done = [False] * count
+        self._delivered = [False] * count
+        self._head = 0
+        self._closed = False
+        # 读取线程在调用方上下文的副本中运行（请求 ID 随之传递），分块的上游响应登记在子范围中
+        self._scope = CancelScope(parent=current_scope())
+
+    def _put(self, index, event):
+        """写入分块缓冲区，非当前分块写满时等待；合并已关闭时返回 False"""
+        with self._cond:
+            while (
+                not self._closed
+                and index != self._head
+                and len(self._buffers[index]) >= self.max_buffered_events
+            ):
+                self._cond.wait()
+            if self._closed:
+                return False
+            self._buffers[index].append(event)
+            self._cond.notify_all()
+            return True
+
+    def _produce(self, index):
+        """在工作线程中读取一个分块的流"""
+        with cancel_scope(self._scope):
+            self._read(index)
+
+    def _read(self, index):
+        generator = None
+        try:
+            generator = self.streams[index]()
+            for event in generator:
+                if event.get("type") == "error":
+                    raise RuntimeError(event.get("error"))
+                if not self._put(index, event):
+                    return
+        except Exception as e:
+            self._recover(index, e)
+        finally:
+            if generator is not None:
+                generator.close()
+            with self._cond:
+                self._done[index] = True
+                self._cond.notify_all()
+
+    def _recover(self, index, error):
+        """分块出错时尝试用 fallback 替换，无法替换时输出 error 数据块"""
+        if self._scope.cancelled:
+            # 已取消，不再发起新的上游请求
+            return
+        with self._cond:
+            recoverable = self.fallback is not None and not self._delivered[index]
+            if recoverable:
+                self._buffers[index].clear()
+
+        if recoverable:
+            logger.warning("分块 %s 流式翻译失败，改用备用方式: %s", index, error)
+            try:
+                for event in self.fallback(index):
+                    if not self._put(index, event):
+                        return
+                return
+            except Exception as e:
+                error = e
+
+        logger.error("分块 %s 流式翻译失败: %s", index, error)
+        self.failed.add(index)
+        self._put(index, {"type": "error", "chunk": index, "error": str(error)})
+
+    def __iter__(self):
+        if not self.streams:
+            return
+        executor = ThreadPoolExecutor(
+            max_workers=min(self.concurrency, len(self.streams))
+        )
+        for index in range(len(self.streams)):
+            executor.submit(contextvars.copy_context().run, self._produce, index)
+        try:
+            for index in range(len(self.streams)):
+                while True:
+                    with self._cond:
+                        while not self._buffers[index] and not self._done[index]:
+                            self._cond.wait()
+                        if not self._buffers[index]:
+                            # 当前分块已结束，轮到下一个分块实时输出
+                            self._head = index + 1
+                            self._cond.notify_all()
+                            break
+                        event = self._buffers[index].popleft()
+                        self._delivered[index] = True
+                        self._cond.notify_all()
+                    yield event
+        finally:
+            # 客户端断开或出错时通知所有读取线程停止
+            with self._cond:
+                self._closed = True
+                finished = all(self._done)
+                self._cond.notify_all()
+            if not finished:
+                self._scope.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,195 @@
+import re
+import json
+import logging
+
+from app.services.metrics import vocabulary_parse_failures
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 对象或数组结束前多余的逗号
+_TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+
+
+class SeparatorStreamParser:
+    """
+    流式响应的增量解析器
+
+    按顺序接收模型输出的内容片段，在翻译和词汇表之间的分隔符处切换状态。
+    只保留可能是分隔符开头的末尾字符（最多 len(separator) - 1 个），
+    其余内容立即作为翻译片段输出，每个片段的处理开销与片段长度成正比，
+    分隔符被拆分到多个片段中时也不会泄漏到翻译内容里。
+    """
+
+    def __init__(self, separator, detect_separator=True):
+        """
+        参数:
+        separator (str): 翻译和词汇表之间的分隔符
+        detect_separator (bool): 是否检测分隔符；不需要词汇表时直接透传
+        """
+        self.separator = separator
+        self.detect_separator = detect_separator
+        self.found_separator = False
+        self._pending = ""
+        self._translation_parts = []
+        self._vocabulary_parts = []
+
+    def _held_back(self, window):
+        """返回 window 末尾可能是分隔符开头的字符数"""
+        for size in range(min(len(self.separator) - 1, len(window)), 0, -1):
+            if window.endswith(self.separator[:size]):
+                return size
+        return 0
+
+    def feed(self, content):
+        """
+        处理一个内容片段
+
+        参数:
+        content (str): 模型输出的内容片段
+
+        返回:
+        list: 需要输出的数据块，包含 translation 和/或 vocabulary 字段
+        """
+        if not content:
+            return []
+
+        if self.found_separator:
+            self._vocabulary_parts.append(content)
+            return [{"type": "chunk", "vocabulary": content}]
+
+        if not self.detect_separator:
+            self._translation_parts.append(content)
+            return [{"type": "chunk", "translation": content}]
+
+        window = self._pending + content
+        index = window.find(self.separator)
+        if index != -1:
+            self.found_separator = True
+            self._pending = ""
+            before = window[:index]
+            after = window[index + len(self.separator) :]
+            event = {"type": "chunk"}
+            if before:
+                self._translation_parts.append(before)
+                event["translation"] = before
+            if after:
+                self._vocabulary_parts.append(after)
+                event["vocabulary"] = after
+            return [event] if len(event) > 1 else []
+
+        held = self._held_back(window)
+        ready = window[: len(window) - held]
+        self._pending = window[len(window) - held :]
+        if not ready:
+            return []
+        self._translation_parts.append(ready)
+        return [{"type": "chunk", "translation": ready}]
+
+    def finish(self):
+        """
+        流结束时输出剩余的内容
+
+        返回:
+        list: 需要输出的数据块
+        """
+        if not self._pending:
+            return []
+        pending, self._pending = self._pending, ""
+        self._translation_parts.append(pending)
+        return [{"type": "chunk", "translation": pending}]
+
+    @property
+    def translation(self):
+        """已解析的翻译内容"""
+        return "".join(self._translation_parts) + self._pending
+
+    @property
+    def vocabulary_text(self):
+        """已解析的词汇表原始内容"""
+        return "".join(self._vocabulary_parts)
+
+    @property
+    def content(self):
+        """完整的模型输出内容"""
+        if self.found_separator:
+            return self.translation + self.separator + self.vocabulary_text
+        return self.translation
+
+
+class VocabularyStreamParser:
+    """
+    词汇表 JSON 数组的增量解析器
+
+    逐字符跟踪字符串、转义和花括号深度，每当一个顶层对象的右花括号到达时，
+    立即解析该对象并输出。已解析的内容会被丢弃，不会重复扫描。
+    数组前后的代码块标记、对象之间的多余逗号、缺失的右方括号等常见问题不影响解析，
+    对象内的尾随逗号会在解析前清理。
+    """
+
+    TERM_FIELDS = ("english", "chinese", "explanation")
+
+    def __init__(self):
+        self.terms = []
+        self.failures = 0
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, content):
+        """
+        处理一个词汇表内容片段
+
+        参数:
+        content (str): 词汇表 JSON 的片段
+
+        返回:
+        list: 本次片段中完成解析的词汇（字典）
+        """
+        completed = []
+        for char in content:
+            if self._depth == 0:
+                # 对象之外只关心对象的开始，忽略方括号、逗号和代码块标记
+                if char == "{":
+                    self._depth = 1
+                    self._buffer = [char]
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    term = self._parse_term("".join(self._buffer))
+                    self._buffer = []
+                    if term is not None:
+                        self.terms.append(term)
+                        completed.append(term)
+        return completed
+
+    def _parse_term(self, raw):
+        """解析单个词汇对象，失败时尝试清理常见格式问题"""
+        for candidate in (raw, _TRAILING_COMMA_PATTERN.sub(r"\1", raw)):
+            try:
+                value = json.loads(candidate, strict=False)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(value, dict):
+                return {
+                    field: str(value.get(field, "") or "") for field in self.TERM_FIELDS
+                }
+        self.failures += 1
+        vocabulary_parse_failures.inc(reason="invalid_term")
+        logger.warning("无法解析词汇对象，长度: %s", len(raw))
+        return None
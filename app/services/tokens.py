@@ -0,0 +1,135 @@
+import os
+import math
+import threading
+
+# 输出令牌数与输入令牌数之比：英文译为中文后令牌数通常略少于原文，留出余量
+OUTPUT_TOKEN_RATIO = float(os.getenv("OUTPUT_TOKEN_RATIO", "1.5"))
+# 需要词汇表时额外预留的输出令牌数（3-5 个词汇的 JSON 及解释）
+VOCABULARY_OUTPUT_TOKENS = int(os.getenv("VOCABULARY_OUTPUT_TOKENS", "400"))
+# max_tokens 的下限和上限，上限为 DeepSeek 对话模型的最大输出令牌数
+OUTPUT_TOKENS_MIN = int(os.getenv("OUTPUT_TOKENS_MIN", "256"))
+OUTPUT_TOKENS_MAX = int(os.getenv("OUTPUT_TOKENS_MAX", "8192"))
+# 每个输出句段的额外开销（批量翻译的编号标记和换行）
+SEGMENT_OVERHEAD_TOKENS = 8
+
+# UTF-8 中占 3 个字节的字符（中日韩文字和全角标点）的令牌数，
+# 取自 DeepSeek 文档给出的换算比例（1 个中文字符约 0.6 个令牌）
+CJK_TOKENS_PER_CHAR = 0.6
+# 常见英文单词是一个令牌，每多 12 个字母约多一个令牌
+LONG_WORD_LETTERS = 12
+
+
+def _ascii_classes():
+    """ASCII 字符分类表：字母 a、数字 0、换行、其他空白为空格、其余为标点"""
+    table = bytearray(range(256))
+    for code in range(128):
+        char = chr(code)
+        if char.isalpha():
+            table[code] = ord("a")
+        elif char.isdigit():
+            table[code] = ord("0")
+        elif char == "\n":
+            table[code] = ord("\n")
+        elif char.isspace():
+            table[code] = ord(" ")
+        else:
+            table[code] = ord(".")
+    return bytes(table)
+
+
+_ASCII_CLASSES = _ascii_classes()
+_LONG_WORD = b"a" * LONG_WORD_LETTERS
+
+
+def _run_starts(classes, kind):
+    """统计某类字符连续片段的个数（片段开头的前一个字符属于其他类别）"""
+    starts = sum(
+        classes.count(other + kind)
+        for other in (b"a", b"0", b".", b" ", b"\n")
+        if other != kind
+    )
+    return starts + classes.startswith(kind)
+
+
+_lock = threading.Lock()
+_stats = {"truncated_responses": 0, "continuations": 0, "incomplete": 0}
+
+
+def estimate_tokens(text):
+    """
+    估算文本的令牌数
+
+    英文按单词计数（每多 12 个字母多计一个令牌），数字每 3 位一个令牌，ASCII 标点和连续换行
+    各一个令牌，空格并入后面的单词；中日韩字符约 0.6 个令牌，其他非 ASCII 字符一个字符一个令牌。
+    全部使用 bytes.translate 和 count 在 C 中完成，不逐个字符或逐个令牌执行 Python 代码。
+
+    参数:
+    text (str): 文本
+
+    返回:
+    int: 估算的令牌数
+    """
+    if not text:
+        return 0
+    ascii_text = text.encode("ascii", "ignore")
+    classes = ascii_text.translate(_ASCII_CLASSES)
+    tokens = (
+        _run_starts(classes, b"a")
+        + classes.count(_LONG_WORD)
+        + (classes.count(b"0") + 2 * _run_starts(classes, b"0")) / 3
+        + classes.count(b".")
+        + _run_starts(classes, b"\n")
+    )
+    other = len(text) - len(ascii_text)
+    if other:
+        # 假设非 ASCII 字符在 UTF-8 中占 2 或 3 个字节，由总字节数解出 3 字节字符（中日韩）的个数
+        extra_bytes = len(text.encode("utf-8", "surrogatepass")) - len(ascii_text)
+        cjk = min(other, max(0, extra_bytes - 2 * other))
+        tokens += cjk * CJK_TOKENS_PER_CHAR + (other - cjk)
+    return math.ceil(tokens)
+
+
+def output_token_budget(text, include_vocabulary=False, segments=1):
+    """
+    根据输入文本计算请求的 max_tokens
+
+    参数:
+    text (str): 要翻译的文本（不含提示词模板）
+    include_vocabulary (bool): 是否需要输出词汇表
+    segments (int): 批量翻译时的句段数
+
+    返回:
+    int: 在 OUTPUT_TOKENS_MIN 和 OUTPUT_TOKENS_MAX 之间的输出令牌预算
+    """
+    budget = estimate_tokens(text) * OUTPUT_TOKEN_RATIO
+    budget += SEGMENT_OVERHEAD_TOKENS * segments
+    if include_vocabulary:
+        budget += VOCABULARY_OUTPUT_TOKENS
+    return max(OUTPUT_TOKENS_MIN, min(OUTPUT_TOKENS_MAX, math.ceil(budget)))
+
+
+def record_truncation(continued):
+    """
+    记录一次因达到 max_tokens 被截断的响应
+
+    参数:
+    continued (bool): 是否继续生成；False 表示续写次数已用完，返回了不完整的结果
+    """
+    with _lock:
+        _stats["truncated_responses"] += 1
+        if continued:
+            _stats["continuations"] += 1
+        else:
+            _stats["incomplete"] += 1
+
+
+def get_token_stats():
+    """获取输出令牌预算统计"""
+    with _lock:
+        stats = dict(_stats)
+    stats.update(
+        output_token_ratio=OUTPUT_TOKEN_RATIO,
+        output_tokens_min=OUTPUT_TOKENS_MIN,
+        output_tokens_max=OUTPUT_TOKENS_MAX,
+    )
+    return stats
@@ -0,0 +1,278 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler
+
+# 配置日志
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger("app.trace")
+
+# 日志级别，gunicorn 下使用配置文件中的 loglevel
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING").upper()
+# 日志格式：json（每行一个 JSON 对象）或 text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# 日志队列中最多积压的记录数，超出后丢弃新记录，慢速的日志输出不会占满内存
+LOG_QUEUE_MAXSIZE = int(os.getenv("LOG_QUEUE_MAXSIZE", "10000"))
+# 记录耗时分段的请求比例，0 表示不采样
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+
+# 请求 ID 的请求头，客户端传入的合法值会被沿用，并在响应中返回
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_sampled = contextvars.ContextVar("trace_sampled", default=False)
+
+_lock = threading.Lock()
+_stats = {"requests": 0, "sampled": 0, "log_dropped": 0}
+_spans = {}
+
+_listener = None
+_listener_pid = None
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+def start_request(request_id=None, sample_rate=None):
+    """
+    开始一个请求：设置当前上下文的请求 ID，并决定是否采样耗时分段
+
+    参数:
+    request_id (str): 客户端传入的请求 ID，不合法或为空时生成新的 ID
+    sample_rate (float): 采样比例，为 None 时使用 TRACE_SAMPLE_RATE
+
+    返回:
+    str: 本次请求使用的请求 ID
+    """
+    if not request_id or not REQUEST_ID_PATTERN.match(request_id):
+        request_id = new_request_id()
+    rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    sampled = rate > 0 and random.random() < rate
+    _request_id.set(request_id)
+    _sampled.set(sampled)
+    with _lock:
+        _stats["requests"] += 1
+        if sampled:
+            _stats["sampled"] += 1
+    return request_id
+
+
+@contextmanager
+def request_context(request_id=None, sample_rate=None):
+    """在 with 块内设置请求 ID 和采样状态，结束时恢复"""
+    id_token = _request_id.set(None)
+    sampled_token = _sampled.set(False)
+    try:
+        yield start_request(request_id, sample_rate)
+    finally:
+        _request_id.reset(id_token)
+        _sampled.reset(sampled_token)
+
+
+def current_request_id():
+    """当前上下文的请求 ID，不在请求中时返回 None"""
+    return _request_id.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    记录一个耗时分段
+
+    只有被采样的请求会记录：结束时输出一条结构化日志（trace 字段），并计入 /stats 的分段统计。
+    未采样时只有一次上下文变量读取的开销。
+
+    参数:
+    name (str): 分段名称，例如 prompt_build、upstream_ttfb、upstream_stream、docx_build
+    attributes: 附加到日志中的字段
+    """
+    if not _sampled.get():
+        yield
+        return
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = (time.perf_counter() - start) * 1000
+        with _lock:
+            stats = _spans.setdefault(name, {"count": 0, "total_ms": 0.0})
+            stats["count"] += 1
+            stats["total_ms"] += duration
+        trace = {"span": name, "duration_ms": round(duration, 1), **attributes}
+        if error is not None:
+            trace["error"] = error
+        trace_logger.info("%s %.1fms", name, duration, extra={"trace": trace})
+
+
+class RequestIdFilter(logging.Filter):
+    """在产生日志的线程中把当前请求 ID 写入日志记录"""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = _request_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        trace = getattr(record, "trace", None)
+        if trace:
+            entry["trace"] = trace
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """把日志记录放入队列，由后台线程写出；队列积压超过上限时丢弃并计数，调用方从不阻塞"""
+
+    def __init__(self, log_queue, maxsize=LOG_QUEUE_MAXSIZE):
+        super().__init__(log_queue)
+        self.maxsize = maxsize
+
+    def enqueue(self, record):
+        if self.maxsize and self.queue.qsize() >= self.maxsize:
+            with _lock:
+                _stats["log_dropped"] += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class _Listener:
+    """
+    在原生线程中从队列取出日志记录并交给输出 handler
+
+    gevent worker 中 threading 被替换为 greenlet，写日志的阻塞系统调用仍会卡住整个进程，
+    因此改用 gevent 线程池中的原生线程和未被替换的 SimpleQueue
+    """
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.queue, self._spawn = _native_queue_and_spawn()
+
+    def start(self):
+        self._spawn(self._run)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    try:
+                        handler.handle(record)
+                    except Exception:
+                        handler.handleError(record)
+
+    def stop(self):
+        self.queue.put_nowait(None)
+
+
+def _native_queue_and_spawn():
+    """返回 (可跨原生线程使用的队列, 在原生线程中运行函数的方法)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        monkey = None
+    if monkey is not None and monkey.is_module_patched("threading"):
+        import gevent
+
+        log_queue = monkey.get_original("queue", "SimpleQueue")()
+        return log_queue, gevent.get_hub().threadpool.spawn
+
+    def spawn(func):
+        threading.Thread(target=func, name="log-listener", daemon=True).start()
+
+    return queue.SimpleQueue(), spawn
+
+
+def create_log_handler(stream=None, log_format=None):
+    """创建输出到 stderr 的 handler，格式由 LOG_FORMAT 决定"""
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if (log_format or LOG_FORMAT) == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter(
+                "%(asctime)s [%(process)d] [%(levelname)s] [%(request_id)s] %(name)s: %(message)s"
+            )
+        )
+    return handler
+
+
+def install_queue_logging(level=None, handlers=None):
+    """
+    配置根日志：调用方只把记录放入队列，格式化和写出在后台原生线程中完成
+
+    每个进程只安装一次，fork 出的 worker 需要重新调用（队列线程不会被 fork 继承）
+
+    参数:
+    level (str | int): 日志级别，为 None 时使用 LOG_LEVEL
+    handlers (list): 实际输出日志的 handler，为 None 时输出到 stderr
+    """
+    global _listener, _listener_pid
+    pid = os.getpid()
+    with _lock:
+        if _listener is not None and _listener_pid == pid:
+            return
+        listener = _Listener(handlers or [create_log_handler()])
+        _listener, _listener_pid = listener, pid
+
+    queue_handler = BoundedQueueHandler(listener.queue)
+    queue_handler.addFilter(RequestIdFilter())
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, BoundedQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    level = level or LOG_LEVEL
+    # gunicorn 的 loglevel 为小写
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    if TRACE_SAMPLE_RATE > 0:
+        # 采样的耗时分段不受全局日志级别限制
+        trace_logger.setLevel(logging.INFO)
+    listener.start()
+
+
+def get_tracing_stats():
+    """获取请求采样、耗时分段和日志丢弃统计"""
+    with _lock:
+        stats = dict(_stats)
+        stats["spans"] = {
+            name: {
+                "count": span_stats["count"],
+                "avg_ms": round(span_stats["total_ms"] / span_stats["count"], 1),
+            }
+            for name, span_stats in _spans.items()
+        }
+    return stats
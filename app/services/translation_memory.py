@@ -0,0 +1,213 @@
+import os
+import re
+import time
+import logging
+import sqlite3
+import threading
+
+from app.services.cache import make_cache_key
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 设置数据库路径后启用翻译记忆
+TRANSLATION_MEMORY_DB = os.getenv("TRANSLATION_MEMORY_DB", "")
+# 翻译记忆最多保存的句段数，超出后淘汰最久未使用的句段
+TRANSLATION_MEMORY_MAX_SEGMENTS = int(
+    os.getenv("TRANSLATION_MEMORY_MAX_SEGMENTS", "200000")
+)
+
+# 段落之间按换行切分，段落内按英文句末标点切分
+_PARAGRAPH_PATTERN = re.compile(r"(\n\s*)")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])(\s+)(?=\S)")
+
+
+def split_segments(text):
+    """
+    将文本切分为句段
+
+    参数:
+    text (str): 英文文本
+
+    返回:
+    list: [(segment, separator), ...]，separator 为句段之后的原始分隔符
+    """
+    segments = []
+    paragraphs = _PARAGRAPH_PATTERN.split(text)
+    for i in range(0, len(paragraphs), 2):
+        paragraph = paragraphs[i]
+        paragraph_separator = paragraphs[i + 1] if i + 1 < len(paragraphs) else ""
+        sentences = _SENTENCE_PATTERN.split(paragraph)
+        for j in range(0, len(sentences), 2):
+            sentence = sentences[j]
+            separator = sentences[j + 1] if j + 1 < len(sentences) else ""
+            if j + 1 >= len(sentences):
+                separator = paragraph_separator
+            if sentence.strip():
+                segments.append((sentence.strip(), separator))
+            elif segments:
+                # 空句段只保留分隔符
+                last_segment, last_separator = segments[-1]
+                segments[-1] = (last_segment, last_separator + separator)
+    return segments
+
+
+def join_segments(translations, separators):
+    """
+    按原顺序拼接句段译文
+
+    中文句子之间不需要空格，只保留原文中的换行
+    """
+    parts = []
+    for translation, separator in zip(translations, separators):
+        parts.append(translation)
+        if "\n" in separator:
+            parts.append("\n" * separator.count("\n"))
+    return "".join(parts).strip()
+
+
+class TranslationMemory:
+    """
+    句段级翻译记忆
+
+    将文本切分为句段，按句段哈希查询持久化存储，只把未命中的句段交给上游翻译，
+    再按原顺序拼接结果。存储按最近使用时间淘汰，保持在 max_segments 以内。
+    """
+
+    def __init__(self, path, max_segments=TRANSLATION_MEMORY_MAX_SEGMENTS):
+        self.path = path
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._stats = {"segment_hits": 0, "segment_misses": 0, "evicted": 0}
+
+    def _connect(self):
+        # 连接不能跨 fork 使用，按进程重新打开
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS segments ("
+                "key TEXT PRIMARY KEY, translation TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS segments_last_used ON segments (last_used)"
+            )
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def lookup(self, keys):
+        """批量查询句段译文，并刷新命中句段的最近使用时间"""
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                f"SELECT key, translation FROM segments WHERE key IN ({placeholders})",
+                list(keys),
+            ).fetchall()
+            if rows:
+                with conn:
+                    conn.executemany(
+                        "UPDATE segments SET last_used = ? WHERE key = ?",
+                        [(time.time(), key) for key, _ in rows],
+                    )
+        return dict(rows)
+
+    def store(self, items):
+        """批量保存句段译文，超出容量时淘汰最久未使用的句段"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO segments (key, translation, last_used) VALUES (?, ?, ?)",
+                    [(key, translation, now) for key, translation in items.items()],
+                )
+                count = conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+                overflow = count - self.max_segments
+                if overflow > 0:
+                    conn.execute(
+                        "DELETE FROM segments WHERE key IN ("
+                        "SELECT key FROM segments ORDER BY last_used ASC LIMIT ?)",
+                        (overflow,),
+                    )
+                    self._stats["evicted"] += overflow
+
+    def translate(self, text, translate_segments, *key_parts):
+        """
+        使用翻译记忆翻译文本
+
+        参数:
+        text (str): 要翻译的英文文本
+        translate_segments (callable): 接收句段列表、返回同样顺序译文列表的函数
+        key_parts: 参与句段哈希的其他内容（模型、提示词版本等）
+
+        返回:
+        str: 拼接后的中文翻译；句段译文无法对齐时返回 None，由调用方整体翻译
+        """
+        segments = split_segments(text)
+        if not segments:
+            return None
+        sources = [segment for segment, _ in segments]
+        separators = [separator for _, separator in segments]
+        keys = [make_cache_key(source, *key_parts) for source in sources]
+
+        try:
+            found = self.lookup(keys)
+        except sqlite3.Error as e:
+            logger.warning("读取翻译记忆失败: %s", e)
+            return None
+
+        # 相同句段只翻译一次
+        missing = {}
+        for key, source in zip(keys, sources):
+            if key not in found and key not in missing:
+                missing[key] = source
+
+        miss_count = sum(1 for key in keys if key in missing)
+        with self._lock:
+            self._stats["segment_hits"] += len(keys) - miss_count
+            self._stats["segment_misses"] += miss_count
+
+        if missing:
+            logger.info(
+                "翻译记忆命中 %s/%s 个句段，翻译剩余 %s 个句段",
+                len(keys) - len(missing),
+                len(keys),
+                len(missing),
+            )
+            try:
+                translations = translate_segments(list(missing.values()))
+            except ValueError as e:
+                logger.warning("句段译文无法对齐，改为整体翻译: %s", e)
+                return None
+            translated = dict(zip(missing.keys(), translations))
+            try:
+                self.store(translated)
+            except sqlite3.Error as e:
+                logger.warning("写入翻译记忆失败: %s", e)
+            found.update(translated)
+
+        return join_segments([found[key] for key in keys], separators)
+
+    def get_stats(self):
+        """获取翻译记忆统计，包括句段命中率"""
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["segment_hits"] + stats["segment_misses"]
+        stats["hit_rate"] = stats["segment_hits"] / total if total else 0.0
+        return stats
+
+
+translation_memory = (
+    TranslationMemory(TRANSLATION_MEMORY_DB) if TRANSLATION_MEMORY_DB else None
+)
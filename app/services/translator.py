@@ -1,24 +1,137 @@
 import requests
 import os
+import time
 import logging
 import json
+import re
+import threading
+import contextvars
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
+from app.services import upstream_client
+from app.services.resilience import (
+    upstream,
+    is_retryable,
+    UpstreamRejected,
+    UpstreamUnavailable,
+)
+from app.services.scheduler import (
+    PRIORITY_INTERACTIVE,
+    upstream_scheduler,
+)
+from app.services.providers import (
+    MODE_COMPLETION,
+    MODE_STREAM,
+    ProviderRouter,
+    load_providers,
+)
+from app.services.cache import translation_cache, make_cache_key
+from app.services.translation_memory import translation_memory
+from app.services.chunker import (
+    TRANSLATION_CHUNK_TOKENS,
+    TRANSLATION_VOCABULARY_MAX_TERMS,
+    TRANSLATION_CHUNK_CONCURRENCY,
+    split_into_chunks,
+    join_chunk_translations,
+    merge_vocabularies,
+    run_bounded,
+)
+from app.services.tokens import estimate_tokens, output_token_budget, record_truncation
+from app.services.tracing import span
+from app.services.metrics import (
+    UpstreamStreamTimer,
+    upstream_duration,
+    vocabulary_parse_failures,
+)
+from app.services.cancellation import (
+    StreamCancelled,
+    current_scope,
+    record_upstream_cancelled,
+    record_document_skipped,
+)
+from app.services.stream_mux import OrderedStreamMux
+from app.services.stream_parser import SeparatorStreamParser, VocabularyStreamParser
 from app.services.document_generator import generate_word_document_url
+from app.services.document_jobs import start_document_job
+from app.services.singleflight import (
+    TRANSLATION_COALESCE,
+    translation_flights,
+    stream_flights,
+    worker_lock,
+    record_cross_worker_coalesced,
+)
 
 # 加载环境变量
 load_dotenv()
 
 # 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # DeepSeek API 配置
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL")
+DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+
+# 上游路由：UPSTREAM_PROVIDERS 配置多个兼容 OpenAI 接口的上游，未配置时只使用 DEEPSEEK_API_URL
+provider_router = ProviderRouter(
+    load_providers(
+        default_url=DEEPSEEK_API_URL,
+        default_api_key=DEEPSEEK_API_KEY,
+        default_model=DEEPSEEK_MODEL,
+    )
+)
 
 SEPARATOR = "==Terms=="
 
+# 上游流式响应的终止信号
+STREAM_DONE = "[DONE]"
+
+# 提示词版本，修改 get_translation_prompts 时需要同步递增，使旧缓存失效
+# （2：按输入计算 max_tokens 并续写被截断的输出，旧缓存中可能有被截断的译文）
+PROMPT_VERSION = "2"
+
+# 输出达到 max_tokens 被截断时最多续写的次数
+TRANSLATION_MAX_CONTINUATIONS = int(os.getenv("TRANSLATION_MAX_CONTINUATIONS", "2"))
+
+CONTINUE_PROMPT = "Continue exactly where your previous reply stopped. Do not repeat anything you have already written and do not add any explanation."
+
+# 缓存回放时每个合成数据块的字符数
+REPLAY_CHUNK_SIZE = 32
+
+# 批量翻译时句段的编号标记，例如 [[1]]
+SEGMENT_MARKER_PATTERN = re.compile(r"\[\[(\d+)\]\]")
+
+_upstream_counter = contextvars.ContextVar("upstream_counter", default=None)
+
+
+class UpstreamRequestCounter:
+    """count_upstream_requests 范围内实际发往上游的非流式请求数（包括重试和对冲请求）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def add(self):
+        with self._lock:
+            self.value += 1
+
+
+@contextmanager
+def count_upstream_requests():
+    """
+    统计 with 块内实际发往上游的请求数
+
+    计数器保存在上下文变量中，复制了当前上下文的线程（run_bounded 的分块任务等）共用同一个计数器；
+    命中缓存或合并到其他进行中请求的调用不计数
+    """
+    counter = UpstreamRequestCounter()
+    token = _upstream_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _upstream_counter.reset(token)
+
 
 def get_translation_prompts(text, include_vocabulary):
     """
@@ -55,7 +168,47 @@ def get_translation_prompts(text, include_vocabulary):
     return system_prompt, user_prompt
 
 
-def get_payload(system_prompt, user_prompt, stream=False):
+def get_batch_translation_prompts(segments):
+    """
+    生成在一次请求中翻译多个句段的系统提示和用户提示
+
+    参数:
+    segments (list): 要翻译的英文句段列表
+
+    返回:
+    tuple: (system_prompt, user_prompt) - 系统提示和用户提示
+    """
+    system_prompt = "You are a professional Chinese-English translation assistant. The user will provide several English segments, each starting with a numbered marker such as [[1]]. Translate every segment into Chinese independently. Return each translation on its own line, starting with the same marker, in the same order, without adding any extra content."
+    user_prompt = "\n".join(
+        f"[[{index}]] {segment}" for index, segment in enumerate(segments, start=1)
+    )
+    return system_prompt, user_prompt
+
+
+def split_batch_translation(content, count):
+    """
+    按编号标记拆分批量翻译结果
+
+    参数:
+    content (str): 模型返回的带编号标记的翻译结果
+    count (int): 句段数量
+
+    返回:
+    list: 按句段顺序排列的译文列表
+
+    异常:
+    ValueError: 编号缺失或无法与句段对齐
+    """
+    parts = SEGMENT_MARKER_PATTERN.split(content)
+    translations = {}
+    for i in range(1, len(parts) - 1, 2):
+        translations[int(parts[i])] = parts[i + 1].strip()
+    if sorted(translations) != list(range(1, count + 1)):
+        raise ValueError(f"期望 {count} 个句段，实际得到 {len(translations)} 个")
+    return [translations[index] for index in range(1, count + 1)]
+
+
+def get_payload(system_prompt, user_prompt, stream=False, max_tokens=None):
     """
     构建DeepSeek API请求的payload
 
@@ -63,24 +216,109 @@ def get_payload(system_prompt, user_prompt, stream=False):
     system_prompt (str): 系统提示
     user_prompt (str): 用户提示
     stream (bool): 是否使用流式响应
+    max_tokens (int): 输出令牌预算，为 None 时按用户提示的长度计算
 
     返回:
     dict: 符合DeepSeek API要求的payload格式
     """
-    if not DEEPSEEK_API_KEY:
+    if not provider_router.has_credentials():
         raise Exception("DeepSeek API密钥未配置")
     return {
-        "model": "deepseek-chat",  # 使用DeepSeek对话模型
+        "model": DEEPSEEK_MODEL,  # 使用DeepSeek对话模型
         "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ],
         "temperature": 0.1,  # 降低温度以获得更确定性的结果
-        "max_tokens": 3000,  # 增加最大令牌数以支持词汇表
+        "max_tokens": max_tokens or output_token_budget(user_prompt),
         "stream": stream,  # 是否使用流式响应
     }
 
 
+def estimate_payload_tokens(payload):
+    """估算一次请求最多消耗的令牌数：提示词令牌数 + max_tokens"""
+    prompt_tokens = sum(
+        estimate_tokens(message["content"]) for message in payload["messages"]
+    )
+    return prompt_tokens + payload.get("max_tokens", 0)
+
+
+def continuation_payload(payload, content):
+    """
+    构建续写请求：将已生成的内容作为助手消息，要求模型从中断处继续
+
+    参数:
+    payload (dict): 原始请求
+    content (str): 已生成的内容
+
+    返回:
+    dict: 续写请求
+    """
+    messages = payload["messages"] + [
+        {"role": "assistant", "content": content},
+        {"role": "user", "content": CONTINUE_PROMPT},
+    ]
+    return dict(payload, messages=messages)
+
+
+def failed_vocabulary():
+    """返回词汇提取失败时的占位词汇表"""
+    return [
+        {
+            "english": "Unknown",
+            "chinese": "未知",
+            "explanation": "词汇提取失败",
+        }
+    ]
+
+
+def get_cache_key(text, include_vocabulary):
+    """
+    生成翻译缓存键
+
+    参数:
+    text (str): 要翻译的英文文本
+    include_vocabulary (bool): 是否需要提取专业词汇
+
+    返回:
+    str: 由文本、是否包含词汇表、模型和提示词版本计算出的内容哈希
+    """
+    return make_cache_key(
+        text, bool(include_vocabulary), DEEPSEEK_MODEL, PROMPT_VERSION
+    )
+
+
+def cache_translation(cache_key, translation, vocabulary):
+    """缓存翻译结果，词汇提取失败的结果不缓存"""
+    if vocabulary == failed_vocabulary():
+        return
+    translation_cache.set(cache_key, [translation, vocabulary])
+
+
+def replay_cached_translation(translation, vocabulary, include_vocabulary):
+    """
+    将缓存的翻译结果按流式响应的格式回放
+
+    参数:
+    translation (str): 缓存的中文翻译
+    vocabulary (list): 缓存的词汇表
+    include_vocabulary (bool): 是否需要词汇表
+
+    返回:
+    generator: 与上游流式响应格式一致的数据块
+    """
+    for start in range(0, len(translation), REPLAY_CHUNK_SIZE):
+        yield {
+            "type": "chunk",
+            "translation": translation[start : start + REPLAY_CHUNK_SIZE],
+        }
+    if include_vocabulary and vocabulary:
+        yield {
+            "type": "chunk",
+            "vocabulary": json.dumps(vocabulary, ensure_ascii=False),
+        }
+
+
 def split_translation_vocabulary(content):
     """
     从翻译结果中分离中文翻译和专业词汇列表
@@ -102,7 +340,7 @@ def split_translation_vocabulary(content):
         try:
             vocabulary_list = json.loads(vocabulary_json)
             logger.info(
-                f"翻译和词汇提取成功完成，共提取 {len(vocabulary_list)} 个专业术语"
+                "翻译和词汇提取成功完成，共提取 %s 个专业术语", len(vocabulary_list)
             )
             return translation, vocabulary_list
         except json.JSONDecodeError:
@@ -115,40 +353,276 @@ def split_translation_vocabulary(content):
                 try:
                     vocabulary_list = json.loads(cleaned_json)
                     logger.info(
-                        f"翻译和词汇提取成功完成，共提取 {len(vocabulary_list)} 个专业术语"
+                        "翻译和词汇提取成功完成，共提取 %s 个专业术语",
+                        len(vocabulary_list),
                     )
                     return translation, vocabulary_list
                 except json.JSONDecodeError:
                     logger.error("清理后的词汇提取结果仍然不是有效的JSON格式")
-                    return translation, [
-                        {
-                            "english": "Unknown",
-                            "chinese": "未知",
-                            "explanation": "词汇提取失败",
-                        }
-                    ]
+                    vocabulary_parse_failures.inc(reason="invalid_json")
+                    return translation, failed_vocabulary()
             else:
                 logger.error("无法从响应中提取JSON格式的数据")
-                return translation, [
-                    {
-                        "english": "Unknown",
-                        "chinese": "未知",
-                        "explanation": "词汇提取失败",
-                    }
-                ]
+                vocabulary_parse_failures.inc(reason="no_json")
+                return translation, failed_vocabulary()
     else:
         # 如果没有找到词汇表标记，只返回翻译内容
         logger.warning("未在响应中找到词汇表部分")
+        vocabulary_parse_failures.inc(reason="missing_separator")
         return content, []
 
 
-def translate_with_vocabulary(text, include_vocabulary=False):
+def complete_once(payload):
+    """
+    发送一次非流式请求，失败时重试
+
+    参数:
+    payload (dict): 请求体
+
+    返回:
+    tuple: (content, finish_reason)
+    """
+    tokens = estimate_payload_tokens(payload)
+    # 本次调用已经尝试过的上游，重试和对冲请求优先发往其他上游
+    tried = set()
+
+    def attempt():
+        # 对冲请求在上下文的副本中执行，取消范围是该次请求单独的范围
+        scope = current_scope()
+        # 每次尝试单独排队，退避等待期间不占用名额
+        with upstream_scheduler.admit(tokens):
+            if scope is not None and scope.cancelled:
+                # 排队期间另一个对冲请求已经成功
+                raise StreamCancelled("上游请求已取消")
+            provider = provider_router.select(MODE_COMPLETION, exclude=tried)
+            tried.add(provider.name)
+            counter = _upstream_counter.get()
+            if counter is not None:
+                counter.add()
+            with provider_router.track(provider, MODE_COMPLETION):
+                start = time.perf_counter()
+                # 以流的方式读取响应体，取消时由其他线程关闭响应，读取随即中断
+                response = upstream_client.post(
+                    provider.url,
+                    json=provider.payload(payload),
+                    headers=provider.headers(),
+                    stream=True,
+                )
+                try:
+                    if scope is not None:
+                        scope.register(response)
+                    with response:
+                        # 检查响应状态
+                        response.raise_for_status()
+
+                        # 解析响应
+                        choice = response.json()["choices"][0]
+                except StreamCancelled:
+                    raise
+                except Exception as e:
+                    if scope is not None and scope.cancelled:
+                        raise StreamCancelled("上游请求已取消") from e
+                    raise
+                finally:
+                    if scope is not None:
+                        scope.unregister(response)
+                upstream_duration.observe(
+                    time.perf_counter() - start,
+                    mode="completion",
+                    provider=provider.name,
+                )
+                return choice["message"]["content"], choice.get("finish_reason")
+
+    # 失败时按指数退避重试，可选对冲请求
+    with span("upstream_request", tokens=tokens):
+        return upstream.call(attempt)
+
+
+def request_completion(system_prompt, user_prompt, max_tokens=None):
+    """
+    发送非流式请求到DeepSeek API
+
+    输出达到 max_tokens 被截断（finish_reason 为 length）时自动续写，拼接各次输出
+
+    参数:
+    system_prompt (str): 系统提示
+    user_prompt (str): 用户提示
+    max_tokens (int): 输出令牌预算，为 None 时按用户提示的长度计算
+
+    返回:
+    str: 模型返回的内容
+    """
+    payload = get_payload(system_prompt, user_prompt, max_tokens=max_tokens)
+    content, finish_reason = complete_once(payload)
+    continuations = 0
+    while finish_reason == "length":
+        continued = continuations < TRANSLATION_MAX_CONTINUATIONS
+        record_truncation(continued)
+        if not continued:
+            logger.warning("上游输出被截断且续写次数已用完，返回不完整的结果")
+            break
+        continuations += 1
+        logger.warning("上游输出达到 max_tokens 被截断，第 %s 次续写", continuations)
+        part, finish_reason = complete_once(continuation_payload(payload, content))
+        content += part
+    return content.strip()
+
+
+def open_stream(payload):
+    """
+    选择上游并建立流式连接
+
+    连接失败（尚未输出任何数据块）时换下一个上游重试，所有上游都失败时抛出最后的异常
+
+    参数:
+    payload (dict): 流式请求体
+
+    返回:
+    tuple: (provider, response)
+    """
+    tried = set()
+    while True:
+        provider = provider_router.select(MODE_STREAM, exclude=tried)
+        tried.add(provider.name)
+        try:
+            with provider_router.track(provider, MODE_STREAM):
+                response = upstream_client.post(
+                    provider.url,
+                    json=provider.payload(payload),
+                    headers=provider.headers(),
+                    stream=True,
+                )
+                try:
+                    response.raise_for_status()
+                except Exception:
+                    response.close()
+                    raise
+            return provider, response
+        except Exception as e:
+            if not is_retryable(e) or len(tried) >= len(provider_router.providers):
+                raise
+            logger.warning("上游 %s 流式连接失败，换用其他上游", provider.name)
+
+
+def translate_segments(segments):
+    """
+    在一次请求中翻译多个句段
+
+    参数:
+    segments (list): 要翻译的英文句段列表
+
+    返回:
+    list: 按句段顺序排列的中文译文
+    """
+    if len(segments) == 1:
+        system_prompt, user_prompt = get_translation_prompts(segments[0], False)
+        return [request_completion(system_prompt, user_prompt)]
+    system_prompt, user_prompt = get_batch_translation_prompts(segments)
+    max_tokens = output_token_budget(" ".join(segments), segments=len(segments))
+    content = request_completion(system_prompt, user_prompt, max_tokens)
+    return split_batch_translation(content, len(segments))
+
+
+def translate_chunk(text, include_vocabulary=False):
+    """
+    翻译单个分块（不经过缓存）
+
+    参数:
+    text (str): 要翻译的英文文本
+    include_vocabulary (bool): 是否同时提取专业词汇
+
+    返回:
+    tuple: (翻译后的中文文本, 词汇列表)
+    """
+    # 不需要词汇表时，优先使用句段级翻译记忆，只翻译改动过的句段
+    if not include_vocabulary and translation_memory is not None:
+        translation = translation_memory.translate(
+            text, translate_segments, DEEPSEEK_MODEL, PROMPT_VERSION
+        )
+        if translation is not None:
+            return translation, []
+
+    # 获取翻译所需的prompt模板
+    with span("prompt_build", chars=len(text)):
+        system_prompt, user_prompt = get_translation_prompts(text, include_vocabulary)
+
+    # 发送请求到DeepSeek API
+    logger.info(
+        "发送翻译请求到DeepSeek API，文本长度: %s 字符, 包含词汇表: %s",
+        len(text),
+        include_vocabulary,
+    )
+    content = request_completion(
+        system_prompt, user_prompt, output_token_budget(text, include_vocabulary)
+    )
+
+    # 处理响应内容
+    if include_vocabulary:
+        return split_translation_vocabulary(content)
+
+    # 只需要翻译结果
+    logger.info("翻译成功完成")
+    return content, []
+
+
+def translate_uncached(text, include_vocabulary, cache_key):
+    """
+    请求上游翻译文本并写入缓存
+
+    配置了跨 worker 合并时，先获取该缓存键的文件锁；等待过其他 worker 时
+    直接使用其写入共享缓存的结果
+
+    参数:
+    text (str): 要翻译的英文文本
+    include_vocabulary (bool): 是否同时提取专业词汇
+    cache_key (str): 缓存键
+
+    返回:
+    tuple: (翻译后的中文文本, 词汇列表)
+    """
+    with worker_lock(cache_key) as waited:
+        if waited:
+            cached = translation_cache.get(cache_key)
+            if cached is not None:
+                logger.info("复用其他 worker 的翻译结果")
+                record_cross_worker_coalesced()
+                translation, vocabulary = cached
+                return translation, vocabulary
+
+        # 长文本在段落和句子边界上切分，各分块并发翻译
+        chunks = split_into_chunks(text, TRANSLATION_CHUNK_TOKENS)
+        if len(chunks) > 1:
+            logger.info(
+                "文本长度: %s 字符，切分为 %s 个分块并发翻译", len(text), len(chunks)
+            )
+            results = run_bounded(
+                lambda chunk: translate_chunk(chunk[0], include_vocabulary),
+                chunks,
+                TRANSLATION_CHUNK_CONCURRENCY,
+            )
+            translation = join_chunk_translations(
+                [result[0] for result in results], [chunk[1] for chunk in chunks]
+            )
+            vocabulary = merge_vocabularies(
+                [result[1] for result in results], ignored=failed_vocabulary()
+            )
+            if include_vocabulary and not vocabulary:
+                vocabulary = failed_vocabulary()
+        else:
+            translation, vocabulary = translate_chunk(text, include_vocabulary)
+
+        cache_translation(cache_key, translation, vocabulary)
+        return translation, vocabulary
+
+
+def translate_with_vocabulary(text, include_vocabulary=False, check_cache=True):
     """
     使用DeepSeek API将英文文本翻译为中文，并可选地提取专业词汇
 
     参数:
     text (str): 要翻译的英文文本
     include_vocabulary (bool): 是否同时提取专业词汇
+    check_cache (bool): 是否先查询缓存，调用方已经查询过（未命中）时传入 False，避免重复计入缓存统计
 
     返回:
     tuple: (翻译后的中文文本, 词汇列表) 如果 include_vocabulary=True
@@ -160,164 +634,438 @@ def translate_with_vocabulary(text, include_vocabulary=False):
             logger.warning("尝试翻译空文本")
             return "", []
 
-        # 获取翻译所需的prompt模板
-        system_prompt, user_prompt = get_translation_prompts(text, include_vocabulary)
-
-        # 构建请求数据
-        payload = get_payload(system_prompt, user_prompt)
-
-        # 设置请求头
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-        }
-
-        # 发送请求到DeepSeek API
-        logger.info(
-            f"发送翻译请求到DeepSeek API，文本长度: {len(text)} 字符, 包含词汇表: {include_vocabulary}"
-        )
-        response = requests.post(DEEPSEEK_API_URL, json=payload, headers=headers)
-
-        # 检查响应状态
-        response.raise_for_status()
+        # 相同请求直接返回缓存结果
+        cache_key = get_cache_key(text, include_vocabulary)
+        cached = translation_cache.get(cache_key) if check_cache else None
+        if cached is not None:
+            logger.info("命中翻译缓存")
+            translation, vocabulary = cached
+            return translation, vocabulary
 
-        # 解析响应
-        result = response.json()
-        content = result["choices"][0]["message"]["content"].strip()
-
-        # 处理响应内容
-        if include_vocabulary:
-            return split_translation_vocabulary(content)
-        else:
-            # 只需要翻译结果
-            logger.info("翻译成功完成")
-            return content, []
+        # 相同的进行中请求只调用一次上游，其余请求等待并共享结果
+        if TRANSLATION_COALESCE:
+            return translation_flights.do(
+                cache_key,
+                lambda: translate_uncached(text, include_vocabulary, cache_key),
+            )
+        return translate_uncached(text, include_vocabulary, cache_key)
 
+    except UpstreamRejected as e:
+        # 熔断或排队超时时直接失败，缓存命中的请求在此之前已经返回
+        logger.warning("DeepSeek API暂时不可用: %s", e)
+        raise UpstreamUnavailable(f"翻译服务暂时不可用: {str(e)}", e.retry_after)
     except requests.exceptions.RequestException as e:
-        logger.error(f"DeepSeek API请求错误: {str(e)}")
+        logger.error("DeepSeek API请求错误: %s", e)
         raise Exception(f"翻译服务请求失败: {str(e)}")
     except (KeyError, IndexError) as e:
-        logger.error(f"DeepSeek API响应解析错误: {str(e)}")
+        logger.error("DeepSeek API响应解析错误: %s", e)
         raise Exception(f"翻译服务响应格式错误: {str(e)}")
     except Exception as e:
-        logger.error(f"翻译处理错误: {str(e)}")
+        logger.error("翻译处理错误: %s", e)
         raise Exception(f"翻译服务处理失败: {str(e)}")
 
 
-def translate_with_vocabulary_stream(
-    text, output_format="json", include_vocabulary=False
+def word_document_chunk(
+    text,
+    translation,
+    vocabulary_list,
+    async_document=False,
+    download_folder=None,
+    job_folder=None,
 ):
     """
-    使用DeepSeek API将英文文本翻译为中文，并可选地提取专业词汇（流式版本）
+    生成Word文档并返回包含下载地址的流式数据块
+
+    async_document 为 True 时提交后台任务并立即返回任务句柄，不阻塞流式连接。
+    download_folder 和 job_folder 为 None 时使用当前应用的配置，不在应用上下文中调用时需要显式传入
+    """
+    if async_document:
+        job = start_document_job(
+            text,
+            translation,
+            vocabulary_list,
+            job_folder=job_folder,
+            download_folder=download_folder,
+        )
+        if job is not None:
+            return {
+                "type": "chunk",
+                "word_document_url": job["word_document_url"],
+                "word_document_job": job,
+            }
+    word_document_url = generate_word_document_url(
+        text, translation, vocabulary_list, download_folder=download_folder
+    )
+    return {
+        "type": "chunk",
+        "word_document_url": word_document_url,
+    }
+
+
+def parse_stream_line(line):
+    """
+    解析上游流式响应的一行
+
+    参数:
+    line (bytes | str): 响应行
+
+    返回:
+    STREAM_DONE 表示流结束；None 表示空行或无法解析的行；否则为第一个 choice 字典
+    """
+    if not line:
+        return None
+    # 移除前缀 "data: "
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    if line.startswith("data: "):
+        line = line[6:]
+    if line == STREAM_DONE:
+        return STREAM_DONE
+    try:
+        # 解析JSON
+        chunk = json.loads(line)
+    except json.JSONDecodeError:
+        # 不记录原始内容：可能很长且包含用户文本，出错时每一行都会记录一次
+        logger.debug("无法解析响应行，已跳过（长度 %s）", len(line))
+        return None
+    # 提取内容片段
+    if "choices" in chunk and len(chunk["choices"]) > 0:
+        return chunk["choices"][0]
+    return None
+
+
+def choice_events(choice, parser, vocabulary_parser):
+    """
+    将一个 choice 的内容片段交给解析器，产出翻译和词汇数据块
+
+    参数:
+    choice (dict): parse_stream_line 返回的 choice
+    parser (SeparatorStreamParser): 翻译和词汇表的分隔解析器
+    vocabulary_parser (VocabularyStreamParser): 词汇表增量解析器
+
+    返回:
+    generator: 数据块
+    """
+    delta = choice.get("delta") or {}
+    for event in parser.feed(delta.get("content") or ""):
+        yield event
+        # 每个词汇对象完整到达后立即作为 term 数据块输出
+        for term in vocabulary_parser.feed(event.get("vocabulary", "")):
+            yield {"type": "term", "term": term}
+
+
+def stream_round(payload, parser, vocabulary_parser):
+    """
+    发送一次流式请求，将输出交给解析器
+
+    参数:
+    payload (dict): 流式请求体
+    parser (SeparatorStreamParser): 翻译和词汇表的分隔解析器
+    vocabulary_parser (VocabularyStreamParser): 词汇表增量解析器
+
+    返回:
+    generator: 逐个产出数据块，结束时返回 (completed, truncated)
+               completed 表示上游流是否完整结束，truncated 表示输出是否达到 max_tokens
+    """
+    completed = False
+    truncated = False
+    scope = current_scope()
+    timer = UpstreamStreamTimer()
+    offset = len(parser.content)
+    # 已输出的数据块无法撤回，流式请求只在建立连接时换上游重试
+    with span("upstream_ttfb"):
+        provider, response = open_stream(payload)
+    try:
+        if scope is not None:
+            # 所有订阅者断开时由其他线程关闭响应
+            scope.register(response)
+        with response, span("upstream_stream", provider=provider.name):
+            # 逐行处理流式响应
+            for line in response.iter_lines():
+                choice = parse_stream_line(line)
+                # 终止信号
+                if choice == STREAM_DONE:
+                    completed = True
+                    break
+                if choice is None:
+                    continue
+                if choice.get("finish_reason") == "length":
+                    truncated = True
+                if (choice.get("delta") or {}).get("content"):
+                    timer.token()
+                yield from choice_events(choice, parser, vocabulary_parser)
+    except StreamCancelled:
+        raise
+    except Exception as e:
+        if scope is not None and scope.cancelled:
+            # 响应被主动关闭，不是上游故障
+            raise StreamCancelled("客户端已断开，取消上游请求") from e
+        provider.record_failure(e)
+        raise
+    finally:
+        if scope is not None:
+            scope.unregister(response)
+        timer.finish(provider.name, estimate_tokens(parser.content[offset:]))
+    return completed, truncated
+
+
+def stream_result(parser, vocabulary_parser, include_vocabulary):
+    """
+    从流式解析器中取出完整的翻译和词汇表
+
+    返回:
+    tuple: (translation, vocabulary_list)
+    """
+    if not include_vocabulary:
+        return parser.translation.strip(), []
+    if vocabulary_parser.terms:
+        # 已经增量解析出词汇，无需再完整解析一次
+        return parser.translation.strip(), vocabulary_parser.terms
+    return split_translation_vocabulary(parser.content)
+
+
+def stream_chunk(text, include_vocabulary=False):
+    """
+    流式翻译单个分块（不经过缓存）
 
     参数:
     text (str): 要翻译的英文文本
     include_vocabulary (bool): 是否同时提取专业词汇
 
     返回:
-    generator: 流式返回翻译结果的生成器
+    generator: 逐个产出翻译和词汇数据块，结束时返回
+               (translation, vocabulary_list, completed)，completed 表示上游流是否完整结束
     """
-    try:
+    with span("prompt_build", chars=len(text)):
         # 获取翻译所需的prompt模板
         system_prompt, user_prompt = get_translation_prompts(text, include_vocabulary)
 
         # 构建请求数据
-        payload = get_payload(system_prompt, user_prompt, stream=True)
+        payload = get_payload(
+            system_prompt,
+            user_prompt,
+            stream=True,
+            max_tokens=output_token_budget(text, include_vocabulary),
+        )
 
-        # 设置请求头
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-        }
+    parser = SeparatorStreamParser(SEPARATOR, detect_separator=include_vocabulary)
+    vocabulary_parser = VocabularyStreamParser()
+    completed = False
+    truncated = False
+    # 发送流式请求到DeepSeek API
+    logger.info(
+        "发送流式翻译请求到DeepSeek API，文本长度: %s 字符, 包含词汇表: %s",
+        len(text),
+        include_vocabulary,
+    )
+
+    # 流式请求属于交互式请求，优先于批量请求获得上游名额，整个流期间占用名额
+    with upstream_scheduler.admit(
+        estimate_payload_tokens(payload), PRIORITY_INTERACTIVE
+    ):
+        request_payload = payload
+        try:
+            for continuation in range(TRANSLATION_MAX_CONTINUATIONS + 1):
+                if continuation:
+                    # 输出被截断，把已生成的内容交给模型从中断处继续，新内容接着输出
+                    logger.warning(
+                        "上游输出达到 max_tokens 被截断，第 %s 次续写", continuation
+                    )
+                    request_payload = continuation_payload(payload, parser.content)
+                completed, truncated = yield from stream_round(
+                    request_payload, parser, vocabulary_parser
+                )
+                if not truncated:
+                    break
+                record_truncation(continuation < TRANSLATION_MAX_CONTINUATIONS)
+        except (GeneratorExit, StreamCancelled):
+            # 客户端断开：上游响应已随生成器关闭，剩余的输出不再生成
+            tokens_saved = payload["max_tokens"] - estimate_tokens(parser.content)
+            record_upstream_cancelled(tokens_saved)
+            logger.info("客户端断开，已取消上游流，估算节省 %s 个令牌", tokens_saved)
+            raise
+
+    yield from parser.finish()
+
+    translation, vocabulary_list = stream_result(
+        parser, vocabulary_parser, include_vocabulary
+    )
+    # 续写次数用完仍被截断的结果不完整，不写入缓存
+    return translation, vocabulary_list, completed and not truncated
+
+
+def stream_chunks_ordered(chunks, include_vocabulary=False):
+    """
+    并发流式翻译多个分块，并按原顺序输出
+
+    第一个分块实时输出，后续分块先缓冲，总耗时接近最慢的分块而不是所有分块之和。
+    各分块的词汇表在全部结束后合并去重，作为一个数据块输出。
+
+    参数:
+    chunks (list): split_into_chunks 返回的 [(chunk, separator), ...]
+    include_vocabulary (bool): 是否同时提取专业词汇
 
-        full_content = ""
-        # 发送流式请求到DeepSeek API
-        logger.info(
-            f"发送流式翻译请求到DeepSeek API，文本长度: {len(text)} 字符, 包含词汇表: {include_vocabulary}"
+    返回:
+    generator: 逐个产出数据块，结束时返回 (translation, vocabulary_list, completed)
+    """
+    results = [None] * len(chunks)
+
+    def make_stream(index):
+        def run():
+            results[index] = yield from stream_chunk(
+                chunks[index][0], include_vocabulary
+            )
+
+        return run
+
+    def fallback(index):
+        translation, vocabulary_list = translate_chunk(
+            chunks[index][0], include_vocabulary
         )
+        results[index] = (translation, vocabulary_list, True)
+        return [{"type": "chunk", "translation": translation}]
 
-        with requests.post(
-            DEEPSEEK_API_URL, json=payload, headers=headers, stream=True
-        ) as response:
-            # 检查响应状态
-            response.raise_for_status()
-            found_separator = False
-            buffer = ""
-            # 逐行处理流式响应
-            for line in response.iter_lines():
-                if line:
-                    # 移除前缀 "data: "
-                    line = line.decode("utf-8")
-                    if line.startswith("data: "):
-                        line = line[6:]
-                    # # 忽略终止信号
-                    if line == "[DONE]":
-                        if not include_vocabulary and len(buffer) > 0:
-                            yield {
-                                "type": "chunk",
-                                "translation": buffer,
-                            }
-                        break
-                    try:
-                        # 解析JSON
-                        chunk = json.loads(line)
-                        # 提取内容片段
-                        if "choices" in chunk and len(chunk["choices"]) > 0:
-                            delta = chunk["choices"][0].get("delta", {})
-                            content = delta.get("content", "")
-                            if content:
-                                full_content += content
-                                if found_separator:
-                                    buffer = ""
-                                    yield {"type": "chunk", "vocabulary": content}
-                                else:
-                                    buffer += content
-                                    if SEPARATOR not in buffer:
-                                        if len(buffer) >= 2 * len(SEPARATOR):
-                                            yield {
-                                                "type": "chunk",
-                                                "translation": buffer[0 : len(content)],
-                                            }
-                                            buffer = buffer[len(content) :]
-                                        else:
-                                            continue
-                                    else:
-                                        found_separator = True
-                                        first_part, second_part = buffer.split(
-                                            SEPARATOR, 1
-                                        )
-                                        buffer = second_part
-                                        found_separator = True
-                                        yield {
-                                            "type": "chunk",
-                                            "translation": first_part,
-                                            "vocabulary": second_part,
-                                        }
-
-                    except json.JSONDecodeError:
-                        logger.warning(f"无法解析响应行: {line}")
-
-            if output_format == "word":
-                translation, vocabulary_list = split_translation_vocabulary(
-                    full_content
-                )
-                word_document_url = generate_word_document_url(
-                    text, translation, vocabulary_list
-                )
-                yield {
-                    "type": "chunk",
-                    "word_document_url": word_document_url,
-                }
+    logger.info("切分为 %s 个分块并发流式翻译", len(chunks))
+    mux = OrderedStreamMux(
+        [make_stream(index) for index in range(len(chunks))],
+        fallback=fallback,
+        concurrency=TRANSLATION_CHUNK_CONCURRENCY,
+    )
+    seen_terms = set()
+    for event in mux:
+        # 不同分块提取的相同术语只输出一次，总数不超过合并后词汇表的上限
+        if event.get("type") == "term":
+            key = event["term"]["english"].strip().lower()
+            if (
+                key not in seen_terms
+                and len(seen_terms) < TRANSLATION_VOCABULARY_MAX_TERMS
+            ):
+                seen_terms.add(key)
+                yield event
+            continue
+        # 各分块的原始词汇片段无法拼成合法的JSON，最后统一输出合并后的词汇表
+        event.pop("vocabulary", None)
+        if len(event) > 1:
+            yield event
+
+    completed = not mux.failed and all(result and result[2] for result in results)
+    translation = join_chunk_translations(
+        [result[0] if result else "" for result in results],
+        [chunk[1] for chunk in chunks],
+    )
+    vocabulary_list = merge_vocabularies(
+        [result[1] for result in results if result], ignored=failed_vocabulary()
+    )
+    if include_vocabulary:
+        if vocabulary_list:
+            yield {
+                "type": "chunk",
+                "vocabulary": json.dumps(vocabulary_list, ensure_ascii=False),
+            }
+        else:
+            vocabulary_list = failed_vocabulary()
+    return translation, vocabulary_list, completed
+
+
+def stream_uncached(text, include_vocabulary, cache_key):
+    """
+    请求上游流式翻译文本，完整结束时写入缓存
+
+    参数:
+    text (str): 要翻译的英文文本
+    include_vocabulary (bool): 是否同时提取专业词汇
+    cache_key (str): 缓存键
+
+    返回:
+    generator: 流式数据块，返回值为 (翻译后的中文文本, 词汇列表)
+    """
+    # 长文本切分为多个分块并发流式翻译
+    chunks = split_into_chunks(text, TRANSLATION_CHUNK_TOKENS)
+    if len(chunks) > 1:
+        translation, vocabulary_list, completed = yield from (
+            stream_chunks_ordered(chunks, include_vocabulary)
+        )
+    else:
+        translation, vocabulary_list, completed = yield from stream_chunk(
+            text, include_vocabulary
+        )
+
+    # 只缓存完整结束的流
+    if completed:
+        cache_translation(cache_key, translation, vocabulary_list)
+    return translation, vocabulary_list
+
+
+def translate_with_vocabulary_stream(
+    text, output_format="json", include_vocabulary=False, async_document=False
+):
+    """
+    使用DeepSeek API将英文文本翻译为中文，并可选地提取专业词汇（流式版本）
+
+    参数:
+    text (str): 要翻译的英文文本
+    output_format (str): 输出格式，'word' 时在翻译结束后生成Word文档
+    include_vocabulary (bool): 是否同时提取专业词汇
+    async_document (bool): 是否在后台生成Word文档，立即返回任务句柄
+
+    返回:
+    generator: 流式返回翻译结果的生成器
+    """
+    translation = None
+    try:
+        # 命中缓存时以合成数据块回放，不再请求上游
+        cache_key = get_cache_key(text, include_vocabulary)
+        cached = translation_cache.get(cache_key)
+        if cached is not None:
+            logger.info("命中翻译缓存，回放缓存结果")
+            translation, vocabulary_list = cached
+            yield from replay_cached_translation(
+                translation, vocabulary_list, include_vocabulary
+            )
+        elif TRANSLATION_COALESCE:
+            # 相同的进行中流只请求一次上游，后到的请求先回放已收到的数据块
+            translation, vocabulary_list = yield from stream_flights.subscribe(
+                cache_key,
+                lambda: stream_uncached(text, include_vocabulary, cache_key),
+            )
+        else:
+            translation, vocabulary_list = yield from stream_uncached(
+                text, include_vocabulary, cache_key
+            )
+
+        if output_format == "word":
+            yield word_document_chunk(
+                text, translation, vocabulary_list, async_document
+            )
         yield {
             "type": "complete",
             "done": True,
         }
 
+    except GeneratorExit:
+        # 客户端断开，不再生成没有人下载的Word文档
+        if output_format == "word" and translation is None:
+            record_document_skipped()
+        raise
+    except StreamCancelled as e:
+        # 合并的上游流被所有订阅者放弃后，后加入的订阅者收到取消异常
+        logger.info("上游流已取消: %s", e)
+        yield {"type": "error", "error": f"翻译服务请求已取消: {str(e)}"}
+        return
+
+    except UpstreamRejected as e:
+        logger.warning("DeepSeek API暂时不可用: %s", e)
+        yield {
+            "type": "error",
+            "error": f"翻译服务暂时不可用: {str(e)}",
+            "retry_after": int(e.retry_after) + 1,
+        }
+        return
     except requests.exceptions.RequestException as e:
-        logger.error(f"DeepSeek API流式请求错误: {str(e)}")
+        logger.error("DeepSeek API流式请求错误: %s", e)
         yield {"type": "error", "error": f"翻译服务请求失败: {str(e)}"}
         return
     except Exception as e:
-        logger.error(f"流式翻译处理错误: {str(e)}")
+        logger.error("流式翻译处理错误: %s", e)
         yield {"type": "error", "error": f"翻译服务处理失败: {str(e)}"}
         return
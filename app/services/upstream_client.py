@@ -0,0 +1,152 @@
+import os
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 连接池配置（每个 worker 进程一个会话）
+UPSTREAM_POOL_CONNECTIONS = int(os.getenv("UPSTREAM_POOL_CONNECTIONS", "4"))
+UPSTREAM_POOL_MAXSIZE = int(os.getenv("UPSTREAM_POOL_MAXSIZE", "32"))
+UPSTREAM_POOL_BLOCK = os.getenv("UPSTREAM_POOL_BLOCK", "false").lower() == "true"
+
+# 超时配置（秒），读超时对流式响应而言是两次数据之间的最长间隔
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "120"))
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+# 连接池命中统计：requests 为发出的请求数，misses 为新建的连接数
+_stats = {"requests": 0, "misses": 0}
+
+
+def _record(name):
+    with _lock:
+        _stats[name] += 1
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _record("misses")
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _record("misses")
+        return super()._new_conn()
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """统计连接复用情况的 HTTPAdapter"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        _record("requests")
+        return super().send(request, **kwargs)
+
+
+def _create_session():
+    """创建带连接池和 keep-alive 的会话"""
+    session = requests.Session()
+    adapter = PooledHTTPAdapter(
+        pool_connections=UPSTREAM_POOL_CONNECTIONS,
+        pool_maxsize=UPSTREAM_POOL_MAXSIZE,
+        pool_block=UPSTREAM_POOL_BLOCK,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+
+def get_session():
+    """
+    获取当前 worker 进程的共享会话
+
+    会话按进程 ID 缓存，gunicorn fork 出的子进程（或 preload 之后）会自动重建，
+    避免多个进程共用同一个 socket。
+
+    返回:
+    requests.Session: 带连接池的会话
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+
+    with _lock:
+        if _session is None or _session_pid != pid:
+            # 父进程的会话不能在子进程中关闭，直接丢弃即可
+            _session = _create_session()
+            _session_pid = pid
+            logger.info("已为进程 %s 创建上游连接池", pid)
+        return _session
+
+
+def close_session():
+    """关闭当前进程的会话，释放所有连接（用于 worker 退出时）"""
+    global _session, _session_pid
+    with _lock:
+        session, pid = _session, _session_pid
+        _session = None
+        _session_pid = None
+    if session is not None and pid == os.getpid():
+        session.close()
+        logger.info("已关闭进程 %s 的上游连接池", pid)
+
+
+def get_timeout():
+    """返回 (连接超时, 读超时) 元组"""
+    return (UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT)
+
+
+def post(url, **kwargs):
+    """
+    通过共享会话发送 POST 请求
+
+    参数:
+    url (str): 请求地址
+    kwargs: 透传给 requests.Session.post 的参数，未指定 timeout 时使用默认超时
+
+    返回:
+    requests.Response: 响应对象
+    """
+    kwargs.setdefault("timeout", get_timeout())
+    return get_session().post(url, **kwargs)
+
+
+def get_pool_stats():
+    """
+    获取连接池命中统计
+
+    返回:
+    dict: requests（请求数）、hits（复用连接数）、misses（新建连接数）
+    """
+    with _lock:
+        requests_count = _stats["requests"]
+        misses = _stats["misses"]
+    return {
+        "requests": requests_count,
+        "hits": max(requests_count - misses, 0),
+        "misses": misses,
+    }
+
+
+def reset_pool_stats():
+    """重置连接池统计"""
+    with _lock:
+        _stats["requests"] = 0
+        _stats["misses"] = 0
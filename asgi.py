@@ -0,0 +1,12 @@
+from app.asgi import create_asgi_app
+from app.services.tracing import install_queue_logging
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 应用日志经队列由后台线程写出，不阻塞事件循环
+install_queue_logging()
+
+# 创建ASGI应用实例：uvicorn asgi:app 或 gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+app = create_asgi_app()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+gevent 与 asyncio 流式翻译的并发基准测试
+
+本进程启动本地模拟上游（tests/fake_upstream.py），每个流持续 --hold 秒；
+每种实现在独立的子进程中同时打开 N 个流式翻译，所有流都收到第一个数据块后采样子进程的 RSS：
+- gevent：monkey.patch_all() 后调用 app.services.translator.translate_with_vocabulary_stream，
+  与 gunicorn gevent worker 相同，每个流一个 greenlet（默认开启流合并，每个流还有一个读取上游的 greenlet）
+- asyncio：调用 app.services.async_translator.translate_with_vocabulary_stream，每个流一个协程
+
+输出每种实现每 MB RSS 能维持的打开流数量（流数 / (峰值 RSS - 基线 RSS)），以及全部流打开的耗时。
+
+用法:
+    python benchmarks/bench_async_streams.py [--streams 200 500 1000] [--hold 10]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+MODES = ["gevent", "asyncio"]
+
+# 模拟上游返回的译文，按 4 个字符一个数据块输出
+CONTENT = "这是一段用于基准测试的流式译文。" * 12
+TOKEN_SIZE = 4
+
+
+def rss_mb():
+    """当前进程的常驻内存（MB）"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    # 非 Linux 平台只能取得峰值 RSS（macOS 单位为字节）
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 / 1024 if sys.platform == "darwin" else maxrss / 1024
+
+
+def run_gevent(count, timeout):
+    """在 gevent 中同时打开 count 个流，返回 (基线 RSS, 峰值 RSS, 打开耗时)"""
+    from gevent import monkey
+
+    monkey.patch_all()
+    import gevent
+    from gevent.event import Event
+    from app.services.translator import translate_with_vocabulary_stream
+
+    # 预热：建立连接池、加载所有模块
+    list(translate_with_vocabulary_stream("warm up"))
+    baseline = rss_mb()
+
+    opened = [0]
+    all_open = Event()
+
+    def consume(index):
+        first = True
+        for _ in translate_with_vocabulary_stream(f"gevent stream {index}"):
+            if first:
+                first = False
+                opened[0] += 1
+                if opened[0] == count:
+                    all_open.set()
+
+    start = time.monotonic()
+    greenlets = [gevent.spawn(consume, index) for index in range(count)]
+    all_open.wait(timeout)
+    elapsed = time.monotonic() - start
+    peak = rss_mb()
+    gevent.joinall(greenlets, timeout=timeout)
+    return baseline, peak, elapsed, opened[0]
+
+
+def run_asyncio(count, timeout):
+    """在 asyncio 中同时打开 count 个流，返回 (基线 RSS, 峰值 RSS, 打开耗时)"""
+    import asyncio
+    from app.services.async_translator import translate_with_vocabulary_stream
+
+    async def main():
+        async for _ in translate_with_vocabulary_stream("warm up"):
+            pass
+        baseline = rss_mb()
+
+        opened = [0]
+        all_open = asyncio.Event()
+
+        async def consume(index):
+            first = True
+            async for _ in translate_with_vocabulary_stream(f"asyncio stream {index}"):
+                if first:
+                    first = False
+                    opened[0] += 1
+                    if opened[0] == count:
+                        all_open.set()
+
+        start = time.monotonic()
+        tasks = [asyncio.create_task(consume(index)) for index in range(count)]
+        try:
+            await asyncio.wait_for(all_open.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.monotonic() - start
+        peak = rss_mb()
+        await asyncio.wait(tasks, timeout=timeout)
+        return baseline, peak, elapsed, opened[0]
+
+    return asyncio.run(main())
+
+
+def worker(mode, count, timeout):
+    """子进程入口：输出一行 JSON 结果"""
+    runner = run_gevent if mode == "gevent" else run_asyncio
+    baseline, peak, elapsed, opened = runner(count, timeout)
+    print(
+        json.dumps(
+            {
+                "mode": mode,
+                "streams": count,
+                "opened": opened,
+                "baseline_mb": round(baseline, 1),
+                "peak_mb": round(peak, 1),
+                "open_seconds": round(elapsed, 2),
+            }
+        ),
+        flush=True,
+    )
+
+
+def run_worker(mode, count, upstream_url, hold):
+    """启动子进程运行一种实现，返回结果字典"""
+    env = dict(
+        os.environ,
+        DEEPSEEK_API_URL=upstream_url,
+        DEEPSEEK_API_KEY="bench",
+        # 不限制上游并发，测量的是服务端能维持的流数量
+        UPSTREAM_MAX_CONCURRENCY="0",
+        UPSTREAM_POOL_MAXSIZE=str(count),
+        TRANSLATION_CACHE_DB="",
+        TRANSLATION_MEMORY_DB="",
+    )
+    output = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--worker",
+            mode,
+            "--streams",
+            str(count),
+            "--hold",
+            str(hold),
+        ],
+        env=env,
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="gevent 与 asyncio 流式翻译并发基准测试"
+    )
+    parser.add_argument(
+        "--streams", type=int, nargs="+", default=[200, 500], help="同时打开的流数量"
+    )
+    parser.add_argument("--hold", type=float, default=10, help="每个上游流持续的秒数")
+    parser.add_argument("--worker", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.streams[0], timeout=args.hold * 3)
+        return
+
+    from tests.fake_upstream import FakeUpstream
+
+    token_delay = args.hold / (len(CONTENT) / TOKEN_SIZE)
+    with FakeUpstream(
+        content=CONTENT, token_size=TOKEN_SIZE, token_delay=token_delay
+    ) as upstream:
+        print(
+            f"{'实现':<8} {'流数':>6} {'已打开':>6} {'基线MB':>8} {'峰值MB':>8} "
+            f"{'增量MB':>8} {'流/MB':>8} {'打开耗时':>8}"
+        )
+        for count in args.streams:
+            for mode in MODES:
+                result = run_worker(mode, count, upstream.url, args.hold)
+                delta = result["peak_mb"] - result["baseline_mb"]
+                per_mb = result["opened"] / delta if delta > 0 else float("inf")
+                print(
+                    f"{mode:<8} {count:>6} {result['opened']:>6} "
+                    f"{result['baseline_mb']:>8.1f} {result['peak_mb']:>8.1f} "
+                    f"{delta:>8.1f} {per_mb:>8.1f} {result['open_seconds']:>7.2f}s"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文档下载基准测试
+
+对比原实现（每次由 worker 读取并发送整个文件）与现实现在以下场景中
+每次下载占用的 worker CPU 时间：
+- 完整下载
+- 携带 If-None-Match 的重复下载（304）
+- Range 请求
+- X-Accel-Redirect 卸载模式
+
+用法:
+    python benchmarks/bench_downloads.py [--requests 500] [--size 65536]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, send_from_directory
+
+from app import create_app
+
+FILENAME = "translation_bench.docx"
+
+
+def legacy_app(folder):
+    """原实现：直接使用 send_from_directory，没有 ETag 复用和缓存头"""
+    app = Flask(__name__)
+
+    @app.route("/downloads/<path:filename>")
+    def download_file(filename):
+        return send_from_directory(folder, filename)
+
+    return app
+
+
+def measure(client, requests, headers=None):
+    """返回每次请求平均占用的 CPU 时间（毫秒）和最后一次响应的状态码"""
+    status = None
+    start = time.process_time()
+    for _ in range(requests):
+        response = client.get(f"/downloads/{FILENAME}", headers=headers or {})
+        # 读取响应体，计入 worker 发送文件的开销
+        response.get_data()
+        status = response.status_code
+        response.close()
+    return (time.process_time() - start) * 1000 / requests, status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文档下载基准测试")
+    parser.add_argument("--requests", type=int, default=500, help="每个场景的请求数")
+    parser.add_argument("--size", type=int, default=64 * 1024, help="文档大小（字节）")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(folder, FILENAME), "wb") as f:
+            f.write(os.urandom(args.size))
+
+        app = create_app()
+        app.config["DOWNLOAD_FOLDER"] = folder
+        client = app.test_client()
+        etag = client.get(f"/downloads/{FILENAME}").headers["ETag"]
+
+        offload_app = create_app()
+        offload_app.config["DOWNLOAD_FOLDER"] = folder
+        offload_app.config["DOWNLOAD_OFFLOAD"] = "x-accel-redirect"
+
+        scenarios = [
+            ("原实现 完整下载", legacy_app(folder).test_client(), None),
+            ("现实现 完整下载", client, None),
+            ("现实现 If-None-Match", client, {"If-None-Match": etag}),
+            ("现实现 Range 前 4KB", client, {"Range": "bytes=0-4095"}),
+            ("X-Accel-Redirect 卸载", offload_app.test_client(), None),
+        ]
+
+        print(f"文档大小: {args.size} 字节，每个场景 {args.requests} 次请求")
+        print(f"{'场景':<24}{'状态码':>8}{'CPU 毫秒/次':>14}")
+        for name, scenario_client, headers in scenarios:
+            cost, status = measure(scenario_client, args.requests, headers)
+            print(f"{name:<24}{status:>8}{cost:>14.3f}")
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    main()
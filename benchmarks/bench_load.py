@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端压力测试
+
+1. 在子进程中启动本地模拟的 DeepSeek 服务（fake_deepseek.py），可配置首字节延迟、输出速度和错误注入
+2. 以 gunicorn -c config.py run:app 启动应用（与生产相同的 gevent worker），上游指向模拟服务；
+   也可以用 --url 压测已经启动的服务
+3. 对 /api/v1/translate 和 /api/v2/translate 依次以每个并发数发送请求，每个请求的原文不同，
+   不会命中缓存或合并
+4. 输出每个接口和并发数的 p50/p95/p99 延迟、首个数据块耗时（v2）、吞吐量、错误数，
+   以及压测期间 gunicorn master 和 worker 的 RSS/PSS 合计峰值（仅 Linux）
+
+结果保存为 JSON（默认 benchmarks/results/load-<commit>.json），--compare 与之前的结果对比，
+p95 延迟、首个数据块耗时或吞吐量变差超过 --threshold 时以非零状态退出，可用于在提交之间发现性能回退。
+
+用法:
+    python benchmarks/bench_load.py [--endpoints v1 v2] [--concurrency 1 8 32] [--requests 200]
+        [--words 120] [--include-vocabulary] [--output-format json]
+        [--ttfb 0.3] [--tokens-per-second 50] [--error-rate 0]
+        [--output result.json] [--compare baseline.json] [--threshold 10]
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from bench_startup import children, free_port, read_memory
+from fake_deepseek import add_upstream_arguments
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+ENDPOINTS = {
+    "v1": "/api/v1/translate",
+    "v2": "/api/v2/translate",
+}
+
+# 生成原文使用的单词
+WORDS = (
+    "the model translates technical documents about distributed systems "
+    "latency throughput memory network storage and machine learning"
+).split()
+
+# 对比时检查的指标：(指标, 数值越大越好)
+COMPARED = [
+    ("latency_p95_ms", False),
+    ("ttft_p95_ms", False),
+    ("throughput_rps", True),
+]
+
+
+def make_text(index, words):
+    """生成第 index 个请求的原文，开头的序号保证每个请求的原文不同"""
+    body = itertools.islice(itertools.cycle(WORDS), index % len(WORDS), None)
+    return f"Request {index}: " + " ".join(itertools.islice(body, words)) + "."
+
+
+def percentile(values, p):
+    """按最近秩计算百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def wait_until_ready(url, process=None, timeout=60):
+    """等待服务的健康检查通过"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"进程已退出，状态码 {process.returncode}")
+        try:
+            if requests.get(url, timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"等待 {url} 超时")
+
+
+def wait_for_port(port, process, timeout=30):
+    """等待模拟服务开始监听"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"模拟服务已退出，状态码 {process.returncode}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError("等待模拟服务超时")
+
+
+def start_upstream(args):
+    """启动模拟的 DeepSeek 服务，返回 (进程, 接口地址)"""
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(ROOT, "benchmarks", "fake_deepseek.py"),
+            "--port",
+            str(port),
+            "--ttfb",
+            str(args.ttfb),
+            "--tokens-per-second",
+            str(args.tokens_per_second),
+            "--token-size",
+            str(args.token_size),
+            "--error-rate",
+            str(args.error_rate),
+            "--error-status",
+            str(args.error_status),
+            "--terms",
+            str(args.terms),
+        ],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+    )
+    wait_for_port(port, process)
+    return process, f"http://127.0.0.1:{port}/v1/chat/completions"
+
+
+def start_server(upstream_url, workers):
+    """以 gunicorn 启动应用，返回 (进程, 服务地址)"""
+    port = free_port()
+    env = dict(
+        os.environ,
+        DEEPSEEK_API_URL=upstream_url,
+        DEEPSEEK_API_KEY="bench",
+        # 每个请求的原文都不同，关闭共享缓存和翻译记忆，测量的是完整的请求路径
+        TRANSLATION_CACHE_DB="",
+        TRANSLATION_MEMORY_DB="",
+    )
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            "config.py",
+            "-b",
+            f"127.0.0.1:{port}",
+            "-w",
+            str(workers),
+            "run:app",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    wait_until_ready(f"{url}/healthz", process)
+    return process, url
+
+
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+class MemorySampler:
+    """在后台定期采样进程树的 RSS/PSS 合计，记录峰值"""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0.0
+        self.peak_pss = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        rss_total = pss_total = 0.0
+        for pid in [self.pid] + children(self.pid):
+            try:
+                rss, pss = read_memory(pid)
+            except OSError:
+                # worker 因 max_requests 回收
+                continue
+            rss_total += rss
+            pss_total += pss
+        self.peak_rss = max(self.peak_rss, rss_total)
+        self.peak_pss = max(self.peak_pss, pss_total)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def send_v1(session, url, payload, timeout):
+    """发送非流式请求，返回 (是否成功, 首个数据块耗时)"""
+    response = session.post(url, json=payload, timeout=timeout)
+    ok = response.status_code == 200 and response.json().get("success", False)
+    return ok, None
+
+
+def send_v2(session, url, payload, timeout):
+    """发送流式请求，读取到 [DONE] 为止"""
+    start = time.perf_counter()
+    ttft = None
+    ok = False
+    with session.post(url, json=payload, stream=True, timeout=timeout) as response:
+        if response.status_code != 200:
+            return False, None
+        for line in response.iter_lines():
+            if not line.startswith(b"data: "):
+                continue
+            data = line[len(b"data: ") :]
+            if data == b"[DONE]":
+                ok = True
+                break
+            event = json.loads(data)
+            if event.get("type") == "error":
+                return False, ttft
+            if ttft is None and event.get("type") == "chunk":
+                ttft = time.perf_counter() - start
+    return ok, ttft
+
+
+SENDERS = {"v1": send_v1, "v2": send_v2}
+
+
+def run_level(base_url, endpoint, concurrency, total, args, offset):
+    """以固定并发发送 total 个请求，返回每个请求的结果和总耗时"""
+    url = base_url + ENDPOINTS[endpoint]
+    send = SENDERS[endpoint]
+    counter = itertools.count()
+    local = threading.local()
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        while True:
+            index = next(counter)
+            if index >= total:
+                return
+            payload = {
+                "text": make_text(offset + index, args.words),
+                "output_format": args.output_format,
+                "include_vocabulary": args.include_vocabulary,
+            }
+            start = time.perf_counter()
+            try:
+                ok, ttft = send(session, url, payload, args.timeout)
+            except (requests.RequestException, ValueError):
+                ok, ttft = False, None
+            latency = time.perf_counter() - start
+            with lock:
+                results.append({"ok": ok, "latency": latency, "ttft": ttft})
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    return results, time.perf_counter() - start
+
+
+def summarize(endpoint, concurrency, results, elapsed, memory):
+    """汇总一个并发级别的结果"""
+    succeeded = [result for result in results if result["ok"]]
+    latencies = [result["latency"] * 1000 for result in succeeded]
+    ttfts = [result["ttft"] * 1000 for result in succeeded if result["ttft"]]
+
+    def rounded(value):
+        return round(value, 1) if value is not None else None
+
+    summary = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(succeeded),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(succeeded) / elapsed, 2) if elapsed else None,
+        "latency_mean_ms": rounded(statistics.mean(latencies)) if latencies else None,
+    }
+    for p in (50, 95, 99):
+        summary[f"latency_p{p}_ms"] = rounded(percentile(latencies, p))
+    for p in (50, 95, 99):
+        summary[f"ttft_p{p}_ms"] = rounded(percentile(ttfts, p))
+    if memory is not None:
+        summary["peak_rss_mb"] = round(memory.peak_rss, 1)
+        summary["peak_pss_mb"] = round(memory.peak_pss, 1)
+    return summary
+
+
+def git_commit():
+    """当前提交和工作区是否有未提交的修改"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                cwd=ROOT,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def compare(current, baseline, threshold):
+    """
+    与之前的结果对比，打印变化并返回变差超过阈值的指标
+
+    参数:
+    current (dict): 本次结果
+    baseline (dict): 之前的结果
+    threshold (float): 允许变差的百分比
+
+    返回:
+    list: 变差超过阈值的 (接口, 并发数, 指标) 列表
+    """
+    previous = {
+        (result["endpoint"], result["concurrency"]): result
+        for result in baseline["results"]
+    }
+    regressions = []
+    print()
+    print(f"与 {baseline.get('commit')} 对比（阈值 {threshold}%）")
+    if baseline.get("config") != current["config"]:
+        print("  注意：两次压测的参数不同，结果不一定可比")
+    matched = False
+    for result in current["results"]:
+        key = (result["endpoint"], result["concurrency"])
+        old = previous.get(key)
+        if old is None:
+            continue
+        matched = True
+        for metric, higher_is_better in COMPARED:
+            before, after = old.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > threshold:
+                flag = "  <-- 回退"
+                regressions.append((*key, metric))
+            print(
+                f"  {key[0]} c={key[1]:<4} {metric:<16} "
+                f"{before:>10} -> {after:>10} ({change:+.1f}%){flag}"
+            )
+    if not matched:
+        print("  没有相同接口和并发数的结果")
+    return regressions
+
+
+def print_summary(summary):
+    def fmt(value):
+        return f"{value:.0f}" if value is not None else "-"
+
+    print(
+        f"{summary['endpoint']:<4} {summary['concurrency']:>4} {summary['requests']:>6} "
+        f"{summary['errors']:>4} {summary['throughput_rps']:>8.1f} "
+        f"{fmt(summary['latency_p50_ms']):>7} {fmt(summary['latency_p95_ms']):>7} "
+        f"{fmt(summary['latency_p99_ms']):>7} {fmt(summary['ttft_p50_ms']):>7} "
+        f"{fmt(summary['ttft_p95_ms']):>7} "
+        f"{fmt(summary.get('peak_rss_mb')):>7} {fmt(summary.get('peak_pss_mb')):>7}",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端压力测试")
+    parser.add_argument("--url", help="压测已经启动的服务，不启动模拟上游和 gunicorn")
+    parser.add_argument(
+        "--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS)
+    )
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 8, 32], help="并发数"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=200, help="每个接口每个并发数发送的请求数"
+    )
+    parser.add_argument("--words", type=int, default=120, help="每个请求原文的单词数")
+    parser.add_argument("--include-vocabulary", action="store_true", help="请求词汇表")
+    parser.add_argument(
+        "--output-format",
+        choices=["json", "word", "word_inline"],
+        default="json",
+        help="请求的输出格式",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=120, help="单个请求的超时（秒）"
+    )
+    parser.add_argument("--workers", type=int, default=3, help="gunicorn worker 数量")
+    add_upstream_arguments(parser)
+    parser.add_argument("--output", help="结果 JSON 的保存路径")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 对比")
+    parser.add_argument(
+        "--threshold", type=float, default=10, help="对比时允许变差的百分比"
+    )
+    args = parser.parse_args()
+
+    upstream = server = None
+    commit, dirty = git_commit()
+    result = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "compare", "threshold")
+        },
+        "results": [],
+    }
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            upstream, upstream_url = start_upstream(args)
+            server, base_url = start_server(upstream_url, args.workers)
+
+        print(
+            f"{'接口':<4} {'并发':>4} {'请求数':>6} {'错误':>4} {'req/s':>8} "
+            f"{'p50ms':>7} {'p95ms':>7} {'p99ms':>7} {'TTFT50':>7} {'TTFT95':>7} "
+            f"{'RSS MB':>7} {'PSS MB':>7}"
+        )
+        offset = 0
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                # 压测已经启动的服务时无法确定其进程，不采样内存
+                memory = MemorySampler(server.pid) if server is not None else None
+                with memory or contextlib.nullcontext():
+                    results, elapsed = run_level(
+                        base_url, endpoint, concurrency, args.requests, args, offset
+                    )
+                offset += args.requests
+                summary = summarize(endpoint, concurrency, results, elapsed, memory)
+                result["results"].append(summary)
+                print_summary(summary)
+    finally:
+        if server is not None:
+            stop(server)
+        if upstream is not None:
+            stop(upstream)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load-{commit or 'unknown'}{'-dirty' if dirty else ''}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存至 {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(result, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+worker 启动耗时和内存基准测试
+
+1. 导入耗时：在子进程中以 python -X importtime 导入 run.py 的应用（main），取多次运行的中位数，
+   并列出累计耗时最多的顶层包
+2. 内存：导入应用后的 RSS，以及第一次生成Word文档（导入 python-docx/lxml）之后的 RSS
+3. gunicorn（--gunicorn）：分别以 GUNICORN_PRELOAD=true/false 启动 gunicorn -c config.py run:app，
+   记录从启动到所有 worker 就绪的耗时，以及 master 和 worker 的 RSS/PSS 合计
+   （PSS 按共享页面的进程数分摊，更接近 k8s 统计的内存用量；仅 Linux）
+
+用法:
+    python benchmarks/bench_startup.py [--repeat 5] [--top 10] [--gunicorn]
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV = dict(
+    os.environ,
+    DEEPSEEK_API_KEY=os.environ.get("DEEPSEEK_API_KEY", "bench"),
+    DEEPSEEK_API_URL=os.environ.get(
+        "DEEPSEEK_API_URL", "http://127.0.0.1:9/v1/chat/completions"
+    ),
+)
+
+# 在子进程中测量 RSS 的脚本
+RSS_SCRIPT = """
+import json, sys
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+
+result = {"start": rss_mb()}
+import main
+result["app"] = rss_mb()
+result["docx_loaded"] = "docx" in sys.modules
+from app.services.document_generator import render_word_document
+render_word_document("Hello", "你好", [])
+result["document"] = rss_mb()
+print(json.dumps(result))
+"""
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 的输出，返回 [(模块名, 自身耗时微秒, 累计耗时微秒, 层级)]"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:") :].split("|")
+        # 模块名前有一个空格，每深一层多两个空格
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative), depth))
+    return entries
+
+
+def measure_import(repeat, top):
+    """返回 (导入耗时中位数毫秒, 最慢的顶层包列表)"""
+    totals = []
+    runs = []
+    for _ in range(repeat):
+        stderr = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import main"],
+            cwd=ROOT,
+            env=ENV,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stderr
+        entries = parse_importtime(stderr)
+        total = next(entry[2] for entry in entries if entry[0] == "main")
+        totals.append(total)
+        runs.append((total, entries))
+
+    median = statistics.median(totals)
+    # 用最接近中位数的一次运行列出耗时最多的顶层包
+    _, entries = min(runs, key=lambda run: abs(run[0] - median))
+    # 输出按后序排列，main 之前连续的非顶层条目都是导入 main 时导入的模块
+    end = next(i for i, entry in enumerate(entries) if entry[0] == "main")
+    begin = end
+    while begin > 0 and entries[begin - 1][3] > 0:
+        begin -= 1
+    packages = {}
+    for name, _, cumulative, _ in entries[begin:end]:
+        package = name.split(".")[0]
+        if name == package:
+            packages[package] = max(packages.get(package, 0), cumulative)
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return median / 1000, [(name, us / 1000) for name, us in slowest]
+
+
+def measure_rss():
+    output = subprocess.run(
+        [sys.executable, "-c", RSS_SCRIPT],
+        cwd=ROOT,
+        env=ENV,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def read_memory(pid):
+    """返回进程的 (RSS, PSS)，单位 MB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0]] = int(parts[1]) / 1024
+    return values.get("Rss:", 0.0), values.get("Pss:", 0.0)
+
+
+def children(pid):
+    """返回直接子进程的 PID 列表"""
+    result = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            result.append(int(entry))
+    return result
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_gunicorn(preload, workers, timeout=60):
+    """启动 gunicorn，返回 (就绪耗时秒, RSS 合计 MB, PSS 合计 MB)"""
+    port = free_port()
+    env = dict(ENV, GUNICORN_PRELOAD="true" if preload else "false")
+    start = time.monotonic()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            "config.py",
+            "-b",
+            f"127.0.0.1:{port}",
+            "-w",
+            str(workers),
+            "run:app",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = start + timeout
+        while time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(
+                    f"http://127.0.0.1:{port}/healthz", timeout=1
+                ):
+                    pass
+                if len(children(process.pid)) >= workers:
+                    break
+            except OSError:
+                pass
+            time.sleep(0.02)
+        elapsed = time.monotonic() - start
+        # 等待所有 worker 完成初始化
+        time.sleep(1)
+        pids = [process.pid] + children(process.pid)
+        memory = [read_memory(pid) for pid in pids]
+        return (
+            elapsed,
+            sum(rss for rss, _ in memory),
+            sum(pss for _, pss in memory),
+        )
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="worker 启动耗时和内存基准测试")
+    parser.add_argument("--repeat", type=int, default=5, help="导入耗时的测量次数")
+    parser.add_argument("--top", type=int, default=10, help="列出的顶层包数量")
+    parser.add_argument(
+        "--gunicorn", action="store_true", help="对比 gunicorn preload 开启和关闭"
+    )
+    parser.add_argument("--workers", type=int, default=3, help="gunicorn worker 数量")
+    args = parser.parse_args()
+
+    median, slowest = measure_import(args.repeat, args.top)
+    print(f"导入应用耗时（{args.repeat} 次中位数）: {median:.0f} ms")
+    print(f"{'顶层包':<24} {'累计耗时ms':>10}")
+    for name, ms in slowest:
+        print(f"{name:<24} {ms:>10.1f}")
+
+    print()
+    rss = measure_rss()
+    print("内存（RSS）")
+    print(f"  解释器启动: {rss['start']:.1f} MB")
+    print(
+        f"  导入应用:   {rss['app']:.1f} MB"
+        f"（python-docx {'已' if rss['docx_loaded'] else '未'}加载）"
+    )
+    print(f"  生成文档后: {rss['document']:.1f} MB")
+
+    if args.gunicorn:
+        print()
+        print(f"gunicorn（{args.workers} 个 worker）")
+        print(f"{'preload':<8} {'就绪耗时':>8} {'RSS合计MB':>10} {'PSS合计MB':>10}")
+        for preload in (False, True):
+            elapsed, rss_total, pss_total = measure_gunicorn(preload, args.workers)
+            print(
+                f"{str(preload).lower():<8} {elapsed:>7.2f}s "
+                f"{rss_total:>10.1f} {pss_total:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地模拟的 DeepSeek 服务（命令行入口）
+
+在 tests/fake_upstream.py 的基础上按请求内容生成译文：译文长度与原文成比例，
+请求词汇表时在译文之后输出 ==Terms== 和 JSON 格式的词汇表，批量请求按 [[n]] 编号逐段输出。
+可以配置首字节延迟、输出速度和错误注入，供 bench_load.py 或手动压测使用。
+
+用法:
+    python benchmarks/fake_deepseek.py [--port 8900] [--ttfb 0.3] [--tokens-per-second 50]
+        [--token-size 4] [--error-rate 0.01] [--error-status 503] [--terms 3]
+
+    DEEPSEEK_API_URL=http://127.0.0.1:8900/v1/chat/completions gunicorn -c config.py run:app
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from tests.fake_upstream import FakeUpstream
+
+# 与 app.services.translator 中的 SEPARATOR 和句段编号相同；模拟服务不导入应用，不需要应用的环境变量
+SEPARATOR = "==Terms=="
+SEGMENT_MARKER = re.compile(r"\[\[(\d+)\]\]")
+# 原文中每个单词对应的译文字符数
+CHARS_PER_WORD = 2
+# 生成译文使用的字符
+FILLER = "这是一段由本地模拟服务生成的译文内容用于压力测试"
+# 带词汇表的提示词中原文的位置
+SOURCE_TEXT = re.compile(r"English Text:(.*?)\n\s*Example of vocabulary", re.S)
+
+
+def filler(length):
+    """返回指定长度的中文内容"""
+    repeats = length // len(FILLER) + 1
+    return (FILLER * repeats)[:length]
+
+
+def make_vocabulary(count):
+    return [
+        {
+            "english": f"Term {index + 1}",
+            "chinese": f"术语{index + 1}",
+            "explanation": "本地模拟服务生成的术语解释",
+        }
+        for index in range(count)
+    ]
+
+
+def make_content(terms):
+    """
+    返回按请求内容生成模型输出的函数
+
+    参数:
+    terms (int): 请求词汇表时返回的术语数量
+    """
+
+    def content(payload):
+        messages = payload.get("messages", [])
+        prompt = next((m["content"] for m in messages if m.get("role") == "user"), "")
+        if SEPARATOR in prompt:
+            # 带词汇表的提示词，原文在 English Text: 之后
+            match = SOURCE_TEXT.search(prompt)
+            source = match.group(1) if match else prompt
+            translation = filler(len(source.split()) * CHARS_PER_WORD)
+            vocabulary = json.dumps(make_vocabulary(terms), ensure_ascii=False)
+            return f"{translation}{SEPARATOR}{vocabulary}"
+
+        segments = SEGMENT_MARKER.split(prompt)
+        if len(segments) > 1:
+            # 批量翻译：split 的结果依次为 前缀、编号、句段、编号、句段……
+            return "\n".join(
+                f"[[{number}]] {filler(len(text.split()) * CHARS_PER_WORD)}"
+                for number, text in zip(segments[1::2], segments[2::2])
+            )
+        return filler(len(prompt.split()) * CHARS_PER_WORD)
+
+    return content
+
+
+def create_upstream(
+    host="127.0.0.1",
+    port=0,
+    ttfb=0.3,
+    tokens_per_second=50.0,
+    token_size=4,
+    error_rate=0.0,
+    error_status=503,
+    terms=3,
+    seed=None,
+):
+    """
+    创建模拟的 DeepSeek 服务
+
+    参数:
+    host (str): 监听地址
+    port (int): 监听端口，为 0 时随机选择
+    ttfb (float): 返回响应头之前的延迟（秒）
+    tokens_per_second (float): 流式输出的数据块速率，为 0 时不限速
+    token_size (int): 每个数据块的字符数
+    error_rate (float): 返回 error_status 的请求比例
+    error_status (int): 注入的错误状态码
+    terms (int): 请求词汇表时返回的术语数量
+    seed (int): 错误注入的随机数种子
+
+    返回:
+    FakeUpstream: 尚未启动的模拟服务
+    """
+    return FakeUpstream(
+        content=make_content(terms),
+        latency=ttfb,
+        error_rate=error_rate,
+        error_status=error_status,
+        token_delay=1 / tokens_per_second if tokens_per_second > 0 else 0.0,
+        token_size=token_size,
+        seed=seed,
+        host=host,
+        port=port,
+    )
+
+
+def add_upstream_arguments(parser):
+    """添加模拟服务的命令行参数，bench_load.py 共用"""
+    parser.add_argument(
+        "--ttfb", type=float, default=0.3, help="返回响应头之前的延迟（秒）"
+    )
+    parser.add_argument(
+        "--tokens-per-second",
+        type=float,
+        default=50,
+        help="流式输出的数据块速率，0 表示不限速",
+    )
+    parser.add_argument("--token-size", type=int, default=4, help="每个数据块的字符数")
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="返回错误状态码的请求比例"
+    )
+    parser.add_argument(
+        "--error-status", type=int, default=503, help="注入的错误状态码"
+    )
+    parser.add_argument(
+        "--terms", type=int, default=3, help="请求词汇表时返回的术语数量"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的 DeepSeek 服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8900, help="监听端口")
+    add_upstream_arguments(parser)
+    args = parser.parse_args()
+
+    upstream = create_upstream(
+        host=args.host,
+        port=args.port,
+        ttfb=args.ttfb,
+        tokens_per_second=args.tokens_per_second,
+        token_size=args.token_size,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        terms=args.terms,
+    )
+    with upstream:
+        print(f"模拟 DeepSeek 服务已启动: {upstream.url}", flush=True)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 is_dev = os.getenv("FLASK_ENV") == 'development'
 
@@ -11,3 +12,71 @@ max_requests = 100
 max_requests_jitter = 50
 timeout = 240
 worker_class = 'gevent'
+# 在 master 中加载应用并预热后再 fork worker，worker 共享已导入的模块，回收后也能立即处理请求
+# 开发环境的 reload 与 preload 不兼容，默认关闭
+preload_app = os.getenv("GUNICORN_PRELOAD", "false" if is_dev else "true").lower() == "true"
+# 各 worker 写入指标快照的目录，/metrics 汇总所有 worker；按 master 进程区分，需在导入应用前设置
+os.environ.setdefault(
+    "METRICS_DIR", os.path.join(tempfile.gettempdir(), f"translator-metrics-{os.getpid()}")
+)
+
+
+def on_starting(server):
+    # 通过环境变量指定固定的 METRICS_DIR 时，清空上次运行留下的指标快照
+    from app.services.metrics import reset_metrics_dir
+
+    reset_metrics_dir()
+
+
+def on_exit(server):
+    # 删除本次运行的指标快照
+    from app.services.metrics import remove_metrics_dir
+
+    remove_metrics_dir()
+
+
+def worker_exit(server, worker):
+    # worker 因 max_requests 回收或退出时，主动关闭上游连接池
+    from app.services.upstream_client import close_session
+
+    close_session()
+
+    # 写入最后的指标快照，由 master 在 child_exit 中归档
+    from app.services.metrics import write_snapshot
+
+    write_snapshot()
+
+
+def child_exit(server, worker):
+    # 已退出 worker 的计数器合并到归档中，回收 worker 后计数器不会回退
+    from app.services.metrics import archive_process
+
+    archive_process(worker.pid)
+
+
+def when_ready(server):
+    # preload 模式下应用已在 master 中加载，fork worker 之前预热共享状态
+    if preload_app:
+        from app.warmup import warm_up
+
+        warm_up()
+
+
+def post_worker_init(worker):
+    # 应用日志经队列由后台线程写出，级别与 gunicorn 的 loglevel 一致
+    from app.services.tracing import install_queue_logging
+
+    install_queue_logging(worker.cfg.loglevel)
+
+    # 清零从 master 继承的统计，开始定期写入本 worker 的指标快照
+    from app.services.metrics import start_worker_metrics
+
+    start_worker_metrics()
+
+    # 文档清理线程只在 worker 中启动，每个 worker 一个；
+    # ASGI 应用没有 config，在 lifespan 启动事件中自行启动
+    from app.services.document_storage import start_document_janitor
+
+    config = getattr(worker.wsgi, "config", None)
+    if config is not None:
+        start_document_janitor(config["DOWNLOAD_FOLDER"])
@@ -1 +1,8 @@
-MAX_TEXT_LENGTH = 1000
\ No newline at end of file
+import os
+
+# 单次请求允许的最大文本长度，超出分块预算的长文本会被切分后并发翻译
+MAX_TEXT_LENGTH = int(os.getenv("MAX_TEXT_LENGTH", "1000"))
+# Word 文档的 MIME 类型
+DOCX_MIMETYPE = (
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+)
@@ -9,6 +9,13 @@ load_dotenv()
 app = create_app()
 
 if __name__ == '__main__':
+    from app.services.tracing import install_queue_logging
+    from app.services.document_storage import start_document_janitor
+
+    # 应用日志经队列由后台线程写出
+    install_queue_logging()
+    # 后台清理过期和超出容量的文档
+    start_document_janitor(app.config["DOWNLOAD_FOLDER"])
     # 获取端口配置，默认为5000
     port = int(os.environ.get('PORT', 5000))
     # 启动应用
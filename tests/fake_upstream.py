@@ -0,0 +1,200 @@
+"""
+本地模拟的 DeepSeek 上游服务
+
+兼容 OpenAI 风格的 /chat/completions 接口，支持非流式和 SSE 流式响应，
+可以注入延迟和错误，用于测试重试、对冲和熔断，以及基准测试。
+
+用法:
+    with FakeUpstream(content="你好", errors=[503]) as upstream:
+        requests.post(upstream.url, json={...})
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            payload = {}
+        self.server.upstream.handle(self, payload)
+
+    def send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _Server(ThreadingHTTPServer):
+    # 基准测试会同时建立大量连接，默认的监听队列（5）会导致连接被拒绝后重试
+    request_queue_size = 1024
+
+
+class FakeUpstream:
+    """
+    模拟上游服务
+
+    参数:
+    content (str | callable): 返回的内容，或接收请求 payload、返回内容的函数
+    latency (float | callable): 返回响应前的延迟（秒），或接收请求序号（从 0 开始）、返回延迟的函数
+    errors (list): 依次返回的错误状态码，用完后正常响应
+    error_rate (float): 之后每个请求以该概率返回 error_status
+    error_status (int): 随机错误的状态码
+    token_delay (float): 流式响应中每个数据块之间的间隔（秒）
+    token_size (int): 流式响应中每个数据块的字符数
+    seed (int): 随机错误的随机数种子
+    max_output_chars (int): 每次响应最多返回的字符数，超出时 finish_reason 为 length，
+        续写请求（带有助手消息）从已返回的内容之后继续；为 None 时不截断
+    host (str): 监听地址
+    port (int): 监听端口，为 0 时随机选择空闲端口
+    """
+
+    def __init__(
+        self,
+        content="你好，世界！",
+        latency=0.0,
+        errors=None,
+        error_rate=0.0,
+        error_status=500,
+        token_delay=0.0,
+        token_size=4,
+        seed=None,
+        max_output_chars=None,
+        host="127.0.0.1",
+        port=0,
+    ):
+        self.content = content
+        self.latency = latency
+        self.errors = list(errors or [])
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.token_delay = token_delay
+        self.token_size = max(1, token_size)
+        self.max_output_chars = max_output_chars
+        self.address = (host, port)
+        self.requests = 0
+        # 客户端在流式响应结束前断开的次数
+        self.disconnects = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self):
+        self._server = _Server(self.address, _Handler)
+        self._server.daemon_threads = True
+        self._server.upstream = self
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={"poll_interval": 0.01},
+            name="fake-upstream",
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _next_status(self):
+        """返回本次请求的序号和注入的错误状态码（没有错误时为 None）"""
+        with self._lock:
+            number = self.requests
+            self.requests += 1
+            if self.errors:
+                return number, self.errors.pop(0)
+            if self.error_rate and self._random.random() < self.error_rate:
+                return number, self.error_status
+            return number, None
+
+    def handle(self, handler, payload):
+        number, status = self._next_status()
+        latency = self.latency(number) if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+        if status is not None:
+            handler.send_json(status, {"error": {"message": f"injected {status}"}})
+            return
+
+        content = self.content(payload) if callable(self.content) else self.content
+        content, finish_reason = self._truncate(payload, content)
+        if payload.get("stream"):
+            self._stream(handler, content, finish_reason)
+        else:
+            handler.send_json(
+                200,
+                {
+                    "choices": [
+                        {
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": finish_reason,
+                        }
+                    ]
+                },
+            )
+
+    def _truncate(self, payload, content):
+        """模拟输出令牌上限，返回本次输出的内容和 finish_reason"""
+        if self.max_output_chars is None:
+            return content, "stop"
+        # 续写请求中助手消息是已经返回过的内容
+        offset = sum(
+            len(message.get("content", ""))
+            for message in payload.get("messages", [])
+            if message.get("role") == "assistant"
+        )
+        end = offset + self.max_output_chars
+        return content[offset:end], "length" if end < len(content) else "stop"
+
+    def _stream(self, handler, content, finish_reason="stop"):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+        try:
+            for start in range(0, len(content), self.token_size):
+                if self.token_delay:
+                    time.sleep(self.token_delay)
+                delta = {"content": content[start : start + self.token_size]}
+                chunk = {"choices": [{"delta": delta, "finish_reason": None}]}
+                line = f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                handler.wfile.write(line.encode("utf-8"))
+                handler.wfile.flush()
+            chunk = {"choices": [{"delta": {}, "finish_reason": finish_reason}]}
+            line = f"data: {json.dumps(chunk)}\n\n"
+            handler.wfile.write(line.encode("utf-8"))
+            handler.wfile.write(b"data: [DONE]\n\n")
+            handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开
+            with self._lock:
+                self.disconnects += 1
@@ -5,10 +5,11 @@ import sys
 import os
 
 from app.utils.helpers import generate_random_string
-from constants import MAX_TEXT_LENGTH
+from constants import MAX_TEXT_LENGTH, DOCX_MIMETYPE
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app import create_app
+from app.services.document_generator import DocumentTooLarge
 
 
 class TestAPI(unittest.TestCase):
@@ -79,6 +80,42 @@ class TestAPI(unittest.TestCase):
         self.assertFalse(data["success"])
         self.assertIn("text", data["error"])
 
+    @patch("app.api.routes.translate_with_vocabulary")
+    def test_translate_api_word_inline(self, mock_translate_with_vocabulary):
+        """测试word_inline格式直接返回Word文档"""
+        mock_translate_with_vocabulary.return_value = ("你好", [])
+
+        response = self.client.post(
+            "/api/v1/translate",
+            data=json.dumps({"text": "Hello", "output_format": "word_inline"}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, DOCX_MIMETYPE)
+        self.assertIn("attachment", response.headers["Content-Disposition"])
+        self.assertEqual(int(response.headers["X-Document-Size"]), len(response.data))
+        self.assertTrue(response.data.startswith(b"PK"))
+
+    @patch("app.api.routes.render_word_document")
+    @patch("app.api.routes.translate_with_vocabulary")
+    def test_translate_api_word_inline_too_large(
+        self, mock_translate_with_vocabulary, mock_render
+    ):
+        """测试word_inline文档超过大小上限"""
+        mock_translate_with_vocabulary.return_value = ("你好", [])
+        mock_render.side_effect = DocumentTooLarge("文档过大")
+
+        response = self.client.post(
+            "/api/v1/translate",
+            data=json.dumps({"text": "Hello", "output_format": "word_inline"}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 413)
+        data = json.loads(response.data)
+        self.assertFalse(data["success"])
+
     def test_translate_api_invalid_format(self):
         """测试无效的output_format参数"""
         # 发送无效格式请求
@@ -201,7 +238,7 @@ class TestAPI(unittest.TestCase):
         """测试基本的/v2/translate流式API功能"""
 
         # 设置模拟函数返回值，模拟流式响应
-        def mock_stream_response(text, output_format, include_vocabulary):
+        def mock_stream_response(text, output_format, include_vocabulary, **kwargs):
             chunks = ["你", "好", "，", "世", "界", "！"]
             for chunk in chunks:
                 yield {"type": "chunk", "translation": chunk}
@@ -234,7 +271,7 @@ class TestAPI(unittest.TestCase):
         """测试包含词汇表的/v2/translate流式API功能"""
 
         # 设置模拟函数返回值
-        def mock_stream_response(text, output_format, include_vocabulary):
+        def mock_stream_response(text, output_format, include_vocabulary, **kwargs):
             chunks = [
                 "机",
                 "器",
@@ -323,7 +360,7 @@ class TestAPI(unittest.TestCase):
         """测试/v2/translate使用支持的word格式"""
 
         # 设置模拟函数返回值，支持word格式
-        def mock_stream_response(text, output_format, include_vocabulary):
+        def mock_stream_response(text, output_format, include_vocabulary, **kwargs):
             yield {
                 "type": "chunk",
                 "word_document_url": "http://example.com/document.docx",
@@ -345,6 +382,22 @@ class TestAPI(unittest.TestCase):
             self.assertEqual(response.status_code, 200)
             self.assertEqual(response.content_type, "text/event-stream")
 
+    def test_translate_v2_api_word_inline_as_word(self):
+        """测试/v2/translate将word_inline按word处理"""
+        with patch(
+            "app.api.routes.translate_with_vocabulary_stream",
+            return_value=iter([{"type": "complete", "done": True}]),
+        ) as mock_stream:
+            response = self.client.post(
+                "/api/v2/translate",
+                data=json.dumps({"text": "Hello", "output_format": "word_inline"}),
+                content_type="application/json",
+            )
+            response.get_data()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_stream.call_args[0][1], "word")
+
 
 if __name__ == "__main__":
     unittest.main()
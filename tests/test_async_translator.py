@@ -0,0 +1,299 @@
+import unittest
+from unittest.mock import patch
+import asyncio
+import json
+import sys
+import os
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tests.fake_upstream import FakeUpstream
+from app.services.providers import Provider, ProviderRouter
+from app.services.cache import translation_cache
+from app.services.cancellation import get_cancellation_stats
+from app.services.translator import get_cache_key
+from app.services.async_upstream_client import httpx
+from app.services import document_storage
+
+if httpx is not None:
+    from app import create_app
+    from app.asgi import create_asgi_app, read_body, MAX_BODY_BYTES
+    from app.services.async_translator import translate_with_vocabulary_stream
+
+VOCABULARY = '[{"english": "Machine Learning", "chinese": "机器学习", "explanation": "计算机从数据中学习"}]'
+
+
+async def collect(stream, limit=None):
+    """读取异步生成器的数据块，达到 limit 个时关闭生成器"""
+    events = []
+    try:
+        async for event in stream:
+            events.append(event)
+            if limit is not None and len(events) >= limit:
+                break
+    finally:
+        await stream.aclose()
+    return events
+
+
+@unittest.skipIf(httpx is None, "需要安装 httpx")
+class TestAsyncTranslator(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        translation_cache.clear()
+        self.fake = FakeUpstream(content="你好，世界！").start()
+        self.router = ProviderRouter([Provider("fake", self.fake.url, "test")])
+        self.patcher = patch("app.services.translator.provider_router", self.router)
+        self.patcher.start()
+
+    def tearDown(self):
+        """测试后清理"""
+        self.patcher.stop()
+        self.fake.stop()
+
+    def test_stream_and_cache(self):
+        """测试异步流式翻译输出与同步版本相同的数据块，完整结束后写入缓存"""
+        events = asyncio.run(collect(translate_with_vocabulary_stream("Hello")))
+        translation = "".join(event.get("translation", "") for event in events)
+        self.assertEqual(translation, "你好，世界！")
+        self.assertEqual(events[-1], {"type": "complete", "done": True})
+
+        replayed = asyncio.run(collect(translate_with_vocabulary_stream("Hello")))
+        self.assertEqual(self.fake.requests, 1)
+        self.assertEqual(
+            "".join(event.get("translation", "") for event in replayed), translation
+        )
+
+    def test_vocabulary_terms(self):
+        """测试词汇表按术语增量输出"""
+        self.fake.content = f"机器学习。==Terms=={VOCABULARY}"
+        events = asyncio.run(
+            collect(translate_with_vocabulary_stream("ML", include_vocabulary=True))
+        )
+        terms = [event["term"] for event in events if event["type"] == "term"]
+        self.assertEqual(terms[0]["english"], "Machine Learning")
+        translation = "".join(event.get("translation", "") for event in events)
+        self.assertEqual(translation, "机器学习。")
+
+    def test_chunks_in_order(self):
+        """测试长文本的分块并发翻译后按原顺序输出"""
+        self.fake.content = lambda payload: payload["messages"][1]["content"].upper()
+        text = "First paragraph.\n\nSecond paragraph.\n\nThird paragraph."
+        with patch("app.services.async_translator.TRANSLATION_CHUNK_TOKENS", 4):
+            events = asyncio.run(collect(translate_with_vocabulary_stream(text)))
+        translation = "".join(event.get("translation", "") for event in events)
+        self.assertEqual(translation, text.upper().replace("\n", ""))
+        self.assertEqual(self.fake.requests, 3)
+        # 缓存的完整译文保留分块之间的分隔符
+        cached = translation_cache.get(get_cache_key(text, False))
+        self.assertEqual(cached[0], text.upper())
+
+    def test_upstream_error(self):
+        """测试上游错误以 error 数据块返回并计入上游失败"""
+        self.fake.errors = [400]
+        events = asyncio.run(collect(translate_with_vocabulary_stream("Hello")))
+        self.assertEqual(events[-1]["type"], "error")
+        self.assertIn("翻译服务请求失败", events[-1]["error"])
+        self.assertEqual(self.router.get_stats()["fake"]["errors"], 1)
+
+    def test_close_cancels_upstream(self):
+        """测试提前关闭生成器时关闭上游连接"""
+        self.fake.content = "这是一段很长的译文，" * 10
+        self.fake.token_size = 2
+        self.fake.token_delay = 0.02
+        before = get_cancellation_stats()["upstream_cancelled"]
+
+        async def run():
+            await collect(translate_with_vocabulary_stream("Cancel me"), limit=1)
+            for _ in range(100):
+                if self.fake.disconnects:
+                    break
+                await asyncio.sleep(0.01)
+
+        asyncio.run(run())
+        self.assertEqual(self.fake.disconnects, 1)
+        self.assertEqual(get_cancellation_stats()["upstream_cancelled"] - before, 1)
+
+
+@unittest.skipIf(httpx is None, "需要安装 httpx")
+class TestAsgiApp(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        translation_cache.clear()
+        self.fake = FakeUpstream(content="你好，世界！").start()
+        router = ProviderRouter([Provider("fake", self.fake.url, "test")])
+        self.patcher = patch("app.services.translator.provider_router", router)
+        self.patcher.start()
+        self.app = create_asgi_app()
+
+    def tearDown(self):
+        """测试后清理"""
+        self.patcher.stop()
+        self.fake.stop()
+
+    def request(self, method, path, body=None, disconnect=None):
+        """
+        调用 ASGI 应用
+
+        disconnect 为 asyncio.Event 时，在其被设置后向应用发送 http.disconnect
+        """
+        messages = []
+
+        async def run():
+            sent = False
+
+            async def receive():
+                nonlocal sent
+                if not sent:
+                    sent = True
+                    data = json.dumps(body).encode() if body is not None else b""
+                    return {"type": "http.request", "body": data}
+                if disconnect is not None:
+                    await disconnect.wait()
+                else:
+                    await asyncio.Event().wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                messages.append(message)
+                if disconnect is not None and message.get("body"):
+                    disconnect.set()
+
+            scope = {
+                "type": "http",
+                "method": method,
+                "path": path,
+                "http_version": "1.1",
+                "query_string": b"",
+                "headers": [(b"content-type", b"application/json")],
+                "server": ("testserver", 80),
+            }
+            await asyncio.wait_for(self.app(scope, receive, send), 5)
+
+        asyncio.run(run())
+        status = messages[0]["status"]
+        body = b"".join(message.get("body", b"") for message in messages[1:])
+        return status, body.decode("utf-8")
+
+    def test_stream(self):
+        """测试 SSE 输出格式与 Flask 接口相同"""
+        status, body = self.request("POST", "/api/v2/translate", {"text": "Hello"})
+        self.assertEqual(status, 200)
+        events = [line[6:] for line in body.split("\n\n") if line]
+        self.assertEqual(events[-1], "[DONE]")
+        self.assertEqual(json.loads(events[-2]), {"type": "complete", "done": True})
+
+    def test_validation(self):
+        """测试使用与 Flask 接口相同的参数校验"""
+        status, body = self.request(
+            "POST", "/api/v2/translate", {"text": "Hi", "output_format": "pdf"}
+        )
+        self.assertEqual(status, 400)
+        error = json.loads(body)["error"]
+        self.assertIn("output_format", error)
+
+        status, body = self.request("POST", "/api/v2/translate", {})
+        self.assertEqual(status, 400)
+        self.assertEqual(json.loads(body)["error"]["text"], ["缺少必要参数 'text'"])
+
+    def test_body_too_large(self):
+        """测试请求体超过大小上限时返回 413，不请求上游"""
+        status, body = self.request(
+            "POST", "/api/v2/translate", {"text": "a" * MAX_BODY_BYTES}
+        )
+        self.assertEqual(status, 413)
+        self.assertFalse(json.loads(body)["success"])
+        self.assertEqual(self.fake.requests, 0)
+
+    def test_read_body_chunks(self):
+        """测试分块读取请求体"""
+        chunks = iter(
+            [
+                {"type": "http.request", "body": b"ab", "more_body": True},
+                {"type": "http.request", "body": b"cd", "more_body": True},
+                {"type": "http.request", "body": b"e"},
+            ]
+        )
+
+        async def receive():
+            return next(chunks)
+
+        self.assertEqual(asyncio.run(read_body(receive, max_bytes=5)), b"abcde")
+
+    def test_disconnect(self):
+        """测试客户端断开时取消翻译并记录断开次数"""
+        self.fake.content = "这是一段很长的译文，" * 10
+        self.fake.token_size = 2
+        self.fake.token_delay = 0.02
+        before = get_cancellation_stats()["client_disconnects"]
+
+        status, body = self.request(
+            "POST",
+            "/api/v2/translate",
+            {"text": "Disconnect"},
+            disconnect=asyncio.Event(),
+        )
+        self.assertEqual(status, 200)
+        self.assertNotIn("[DONE]", body)
+        self.assertEqual(get_cancellation_stats()["client_disconnects"] - before, 1)
+
+    def test_word_document(self):
+        """测试在没有应用上下文的协程中生成Word文档，保存到 Flask 应用配置的目录"""
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        wsgi_app = create_app()
+        wsgi_app.config["DOWNLOAD_FOLDER"] = folder
+        self.app = create_asgi_app(wsgi_app)
+
+        for output_format in ("word", "word_inline"):
+            status, body = self.request(
+                "POST",
+                "/api/v2/translate",
+                {"text": "Hello", "output_format": output_format},
+            )
+            self.assertEqual(status, 200)
+            events = [json.loads(line[6:]) for line in body.split("\n\n")[:-2]]
+            urls = [e["word_document_url"] for e in events if "word_document_url" in e]
+            self.assertEqual(len(urls), 1, events)
+            filename = urls[0].rsplit("/", 1)[1]
+            self.assertTrue(os.path.exists(os.path.join(folder, filename)))
+
+    def test_lifespan_starts_janitor(self):
+        """测试 lifespan 启动事件在当前进程中启动文档清理线程"""
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        wsgi_app = create_app()
+        wsgi_app.config["DOWNLOAD_FOLDER"] = folder
+        app = create_asgi_app(wsgi_app)
+        sent = []
+
+        async def run():
+            messages = iter(
+                [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+            )
+
+            async def receive():
+                return next(messages)
+
+            async def send(message):
+                sent.append(message["type"])
+
+            await app({"type": "lifespan"}, receive, send)
+
+        asyncio.run(run())
+        self.assertEqual(
+            sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+        )
+        self.assertIn((os.getpid(), folder), document_storage._janitors)
+
+    def test_other_paths_use_flask(self):
+        """测试其余请求转交给 Flask 应用"""
+        status, body = self.request("GET", "/healthz")
+        self.assertEqual(status, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
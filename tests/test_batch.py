@@ -0,0 +1,325 @@
+import unittest
+from unittest.mock import patch
+import io
+import json
+import threading
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tests.fake_upstream import FakeUpstream
+from app import create_app
+from app.services.providers import Provider, ProviderRouter
+from app.services.batch import (
+    plan_batch,
+    translate_batch,
+    iter_ndjson_records,
+    translate_ndjson,
+)
+from app.services.cache import translation_cache
+from app.services.translator import get_cache_key
+
+
+def fake_segments(segments):
+    return [f"译:{segment}" for segment in segments]
+
+
+def fake_translate(text, include_vocabulary=False, check_cache=True):
+    vocabulary = [{"english": text, "chinese": "词", "explanation": ""}]
+    return f"译:{text}", vocabulary if include_vocabulary else []
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        translation_cache.clear()
+
+    def test_plan_packs_small_items_within_budget(self):
+        """测试短条目在令牌预算内合并，需要词汇表的条目单独翻译"""
+        keys = [
+            ("one two three four", False),
+            ("five six seven eight", False),
+            ("nine ten eleven twelve", False),
+            ("with vocabulary", True),
+        ]
+        packs, singles, cached = plan_batch(keys, pack_tokens=10)
+        self.assertEqual(packs, [[0, 1]])
+        self.assertEqual(sorted(singles), [2, 3])
+        self.assertEqual(cached, {})
+
+    def test_plan_skips_cached_items(self):
+        """测试已缓存的条目不参与合并"""
+        translation_cache.set(get_cache_key("Hello", False), ["你好", []])
+        packs, singles, cached = plan_batch([("Hello", False), ("World", False)])
+        self.assertEqual(cached, {0: ("你好", [])})
+        self.assertEqual(packs, [])
+        self.assertEqual(singles, [1])
+
+    @patch("app.services.batch.translate_with_vocabulary", side_effect=fake_translate)
+    @patch("app.services.batch.translate_segments", side_effect=fake_segments)
+    def test_translate_batch_dedupes_and_packs(self, mock_segments, mock_translate):
+        """测试去重、合并请求并按原顺序返回"""
+        items = [
+            {"text": "Hello", "include_vocabulary": False},
+            {"text": "World", "include_vocabulary": False},
+            {"text": "Hello", "include_vocabulary": False},
+            {"text": "Term", "include_vocabulary": True},
+        ]
+        results, stats = translate_batch(items)
+
+        self.assertEqual(
+            [result["translation"] for result in results],
+            ["译:Hello", "译:World", "译:Hello", "译:Term"],
+        )
+        self.assertEqual(results[3]["vocabulary"][0]["english"], "Term")
+        mock_segments.assert_called_once_with(["Hello", "World"])
+        mock_translate.assert_called_once_with("Term", True, check_cache=False)
+        self.assertEqual(stats["unique_items"], 3)
+        self.assertEqual(stats["packed_requests"], 1)
+        for result in results:
+            self.assertIsNone(result["error"])
+            self.assertGreaterEqual(result["latency_ms"], 0)
+
+        # 合并翻译的结果写入缓存
+        self.assertEqual(
+            translation_cache.get(get_cache_key("World", False)), ["译:World", []]
+        )
+
+    @patch("app.services.batch.translate_with_vocabulary", side_effect=fake_translate)
+    @patch("app.services.batch.translate_segments", side_effect=ValueError("无法对齐"))
+    def test_pack_failure_falls_back_to_single(self, mock_segments, mock_translate):
+        """测试合并结果无法对齐时逐个翻译"""
+        items = [{"text": "Hello"}, {"text": "World"}]
+        results, stats = translate_batch(items)
+        self.assertEqual(
+            [result["translation"] for result in results], ["译:Hello", "译:World"]
+        )
+        self.assertEqual(mock_translate.call_count, 2)
+
+    @patch("app.services.batch.translate_with_vocabulary", side_effect=fake_translate)
+    def test_misaligned_pack_is_not_cached(self, mock_translate):
+        """测试合并结果的编号无法对齐时不写入缓存，逐个翻译"""
+        with FakeUpstream(content="[[2]] 你好\n[[3]] 世界") as fake:
+            router = ProviderRouter([Provider("fake", fake.url, "test")])
+            with patch("app.services.translator.provider_router", router):
+                results, stats = translate_batch([{"text": "Hello"}, {"text": "World"}])
+
+        self.assertEqual(fake.requests, 1)
+        self.assertEqual(
+            [result["translation"] for result in results], ["译:Hello", "译:World"]
+        )
+        self.assertIsNone(translation_cache.get(get_cache_key("Hello", False)))
+        self.assertIsNone(translation_cache.get(get_cache_key("World", False)))
+
+    def test_counts_requests_sent_and_single_cache_lookup(self):
+        """测试上游请求数为实际发出的请求数，每个条目只查询一次缓存"""
+        translation_cache.set(get_cache_key("Cached", False), ["已缓存", []])
+        with FakeUpstream(content="[[1]] 你好\n[[2]] 世界") as fake:
+            router = ProviderRouter([Provider("fake", fake.url, "test")])
+            with patch("app.services.translator.provider_router", router):
+                before = translation_cache.get_stats()
+                items = [
+                    {"text": "Hello"},
+                    {"text": "World"},
+                    {"text": "Cached"},
+                    {"text": "Cached"},
+                    {"text": "Term", "include_vocabulary": True},
+                ]
+                results, stats = translate_batch(items)
+                after = translation_cache.get_stats()
+
+        self.assertEqual(results[2]["translation"], "已缓存")
+        self.assertEqual(stats["cached_items"], 1)
+        self.assertEqual(stats["upstream_requests"], fake.requests)
+        self.assertEqual(stats["upstream_requests"], 2)
+        self.assertEqual(stats["upstream_calls_saved"], 3)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+        self.assertEqual(after["misses"] - before["misses"], 3)
+
+    @patch("app.services.batch.translate_with_vocabulary")
+    def test_item_error_does_not_fail_batch(self, mock_translate):
+        """测试单个条目失败不影响其他条目"""
+
+        def translate(text, include_vocabulary=False, check_cache=True):
+            if text == "bad":
+                raise Exception("翻译服务请求失败")
+            return fake_translate(text, include_vocabulary)
+
+        mock_translate.side_effect = translate
+        items = [
+            {"text": "bad", "include_vocabulary": True},
+            {"text": "good", "include_vocabulary": True},
+        ]
+        results, _ = translate_batch(items)
+        self.assertEqual(results[0]["error"], "翻译服务请求失败")
+        self.assertEqual(results[1]["translation"], "译:good")
+
+
+class CountingStream(io.BytesIO):
+    """记录已读取行数的输入流"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.lines_read = 0
+
+    def readline(self, size=-1):
+        line = super().readline(size)
+        if line:
+            self.lines_read += 1
+        return line
+
+
+def ndjson(records):
+    return "".join(
+        json.dumps(record, ensure_ascii=False) + "\n" for record in records
+    ).encode("utf-8")
+
+
+class TestNDJSONBatch(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        translation_cache.clear()
+
+    def test_iter_records_reports_bad_lines(self):
+        """测试无效行、缺少 text 和超长行返回错误，其余行正常读取"""
+        data = (
+            b'{"id": 1, "text": "Hello"}\n'
+            b"\n"
+            b"not json\n"
+            b'{"id": 2}\n' + b'{"id": 3, "text": "' + b"x" * 100 + b'"}\n'
+            b'{"id": 4, "text": "World"}'
+        )
+        results = list(iter_ndjson_records(io.BytesIO(data), max_line_bytes=50))
+
+        self.assertEqual(results[0], (1, {"id": 1, "text": "Hello"}, None))
+        self.assertEqual([result[0] for result in results], [1, 3, 4, 5, 6])
+        self.assertIn("JSON", results[1][2])
+        self.assertIn("text", results[2][2])
+        self.assertIn("50", results[3][2])
+        self.assertEqual(results[4][1], {"id": 4, "text": "World"})
+
+    @patch("app.services.batch.translate_with_vocabulary", side_effect=fake_translate)
+    def test_translate_ndjson_results_tagged_with_id(self, mock_translate):
+        """测试每条结果带上记录的 id"""
+        data = ndjson(
+            [
+                {"id": "a", "text": "Hello"},
+                {"id": "b", "text": "Term", "include_vocabulary": True},
+                {"id": "c", "text": "x" * 20},
+            ]
+        )
+        results = {
+            result["id"]: result
+            for result in translate_ndjson(io.BytesIO(data), max_text_length=10)
+        }
+
+        self.assertEqual(results["a"]["translation"], "译:Hello")
+        self.assertNotIn("vocabulary", results["a"])
+        self.assertEqual(results["b"]["vocabulary"][0]["english"], "Term")
+        self.assertFalse(results["c"]["success"])
+        self.assertEqual(mock_translate.call_count, 2)
+
+    @patch("app.services.batch.translate_with_vocabulary")
+    def test_translate_ndjson_bounded_window(self, mock_translate):
+        """测试同时进行的请求数不超过窗口，窗口已满时暂停读取输入"""
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        def translate(text, include_vocabulary=False):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.01)
+            with lock:
+                state["active"] -= 1
+            return fake_translate(text)
+
+        mock_translate.side_effect = translate
+        stream = CountingStream(
+            ndjson([{"id": i, "text": f"line {i}"} for i in range(30)])
+        )
+        results = translate_ndjson(stream, max_text_length=100, window=3)
+
+        next(results)
+        self.assertLessEqual(stream.lines_read, 4)
+        remaining = list(results)
+
+        self.assertEqual(len(remaining), 29)
+        self.assertLessEqual(state["peak"], 3)
+
+
+class TestBatchAPI(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        translation_cache.clear()
+        self.app = create_app()
+        self.client = self.app.test_client()
+        self.app.testing = True
+
+    @patch("app.services.batch.translate_with_vocabulary", side_effect=fake_translate)
+    @patch("app.services.batch.translate_segments", side_effect=fake_segments)
+    def test_batch_api(self, mock_segments, mock_translate):
+        """测试批量翻译API按顺序返回结果和统计"""
+        response = self.client.post(
+            "/api/v1/translate/batch",
+            data=json.dumps(
+                {
+                    "items": [
+                        {"text": "Hello"},
+                        {"text": "Term", "include_vocabulary": True},
+                        {"text": "Hello"},
+                    ]
+                }
+            ),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertTrue(data["success"])
+        results = data["results"]
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]["translation"], "译:Hello")
+        self.assertNotIn("vocabulary", results[0])
+        self.assertEqual(results[1]["vocabulary"][0]["english"], "Term")
+        self.assertIn("latency_ms", results[2])
+        self.assertEqual(data["stats"]["unique_items"], 2)
+
+    def test_batch_api_validation(self):
+        """测试批量翻译API的参数校验"""
+        response = self.client.post(
+            "/api/v1/translate/batch",
+            data=json.dumps({"items": [{"text": "a", "output_format": "word_inline"}]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        data = json.loads(response.data)
+        self.assertIn("output_format", data["error"]["items"]["0"])
+
+    @patch("app.services.batch.translate_with_vocabulary", side_effect=fake_translate)
+    def test_ndjson_stream_api(self, mock_translate):
+        """测试NDJSON流式批量翻译API"""
+        response = self.client.post(
+            "/api/v1/translate/stream",
+            data=ndjson([{"id": 1, "text": "Hello"}, {"id": 2, "text": "World"}])
+            + b"oops\n",
+            content_type="application/x-ndjson",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = [json.loads(line) for line in response.data.splitlines()]
+        self.assertEqual(len(lines), 3)
+        translations = {line["id"]: line.get("translation") for line in lines}
+        self.assertEqual(translations[1], "译:Hello")
+        self.assertEqual(translations[2], "译:World")
+        errors = [line for line in lines if not line["success"]]
+        self.assertEqual(errors[0]["line"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import shutil
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.cache import (
+    LRUCache,
+    SQLiteCache,
+    TranslationCache,
+    make_cache_key,
+)
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        self.test_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_dir, "cache.db")
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def test_make_cache_key(self):
+        """测试缓存键由全部参数决定"""
+        key = make_cache_key("Hello", True, "deepseek-chat", "1")
+        self.assertEqual(key, make_cache_key("Hello", True, "deepseek-chat", "1"))
+        self.assertNotEqual(key, make_cache_key("Hello", False, "deepseek-chat", "1"))
+        self.assertNotEqual(key, make_cache_key("Hello", True, "deepseek-chat", "2"))
+
+    def test_lru_eviction(self):
+        """测试超出容量时淘汰最久未使用的条目"""
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_lru_ttl(self):
+        """测试条目过期"""
+        cache = LRUCache(max_size=2, ttl=10)
+        with patch("app.services.cache.time.time", return_value=1000):
+            cache.set("a", 1)
+        with patch("app.services.cache.time.time", return_value=1011):
+            self.assertIsNone(cache.get("a"))
+
+    def test_sqlite_cache(self):
+        """测试 SQLite 共享缓存的读写"""
+        cache = SQLiteCache(self.db_path, ttl=60)
+        cache.set("key", ["翻译", [{"english": "a"}]])
+        # 另一个实例（模拟另一个 worker）也能读到
+        other = SQLiteCache(self.db_path, ttl=60)
+        self.assertEqual(other.get("key"), ["翻译", [{"english": "a"}]])
+        self.assertIsNone(other.get("missing"))
+
+    def test_tiered_cache_backfills(self):
+        """测试共享缓存命中后回填进程内缓存"""
+        memory = LRUCache(max_size=10, ttl=60)
+        shared = SQLiteCache(self.db_path, ttl=60)
+        shared.set("key", ["翻译", []])
+        cache = TranslationCache([memory, shared])
+
+        self.assertEqual(cache.get("key"), ["翻译", []])
+        self.assertEqual(memory.get("key"), ["翻译", []])
+        self.assertIsNone(cache.get("missing"))
+        stats = cache.get_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import json
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tests.fake_upstream import FakeUpstream
+from app import create_app
+from app.services.cache import translation_cache
+from app.services.providers import Provider, ProviderRouter
+from app.services.resilience import ResilientUpstream
+from app.services.singleflight import stream_flights
+from app.services.translator import get_cache_key
+from app.services.cancellation import (
+    CancelScope,
+    StreamCancelled,
+    get_cancellation_stats,
+)
+
+CONTENT = "这是一段很长的译文，" * 10
+
+
+class TestCancelScope(unittest.TestCase):
+
+    def test_cancel_closes_registered_responses(self):
+        """测试取消时关闭已登记的响应"""
+        scope = CancelScope()
+        response = MagicMock()
+        scope.register(response)
+        scope.cancel()
+        response.close.assert_called_once()
+        self.assertTrue(scope.cancelled)
+
+    def test_register_after_cancel(self):
+        """测试取消后登记的响应立即关闭并抛出 StreamCancelled"""
+        scope = CancelScope()
+        scope.cancel()
+        response = MagicMock()
+        with self.assertRaises(StreamCancelled):
+            scope.register(response)
+        response.close.assert_called_once()
+
+    def test_unregistered_response_is_not_closed(self):
+        """测试已注销的响应不会被关闭"""
+        scope = CancelScope()
+        response = MagicMock()
+        scope.register(response)
+        scope.unregister(response)
+        scope.cancel()
+        response.close.assert_not_called()
+
+    def test_child_cancelled_with_parent(self):
+        """测试子范围随父范围一起取消，已取消的父范围下新建的子范围立即取消"""
+        parent = CancelScope()
+        child = CancelScope(parent=parent)
+        response = MagicMock()
+        child.register(response)
+        parent.cancel()
+        self.assertTrue(child.cancelled)
+        response.close.assert_called_once()
+        self.assertTrue(CancelScope(parent=parent).cancelled)
+
+
+class TestStreamCancellation(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        translation_cache.clear()
+        self.fake = FakeUpstream(
+            content=CONTENT, token_size=2, token_delay=0.02
+        ).start()
+        router = ProviderRouter([Provider("fake", self.fake.url, "test")])
+        self.patches = [
+            patch("app.services.translator.provider_router", router),
+            patch("app.services.translator.upstream", ResilientUpstream(retries=0)),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+        self.app = create_app()
+        self.app.testing = True
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        """测试后清理"""
+        for patcher in self.patches:
+            patcher.stop()
+        self.fake.stop()
+
+    def open_stream(self, text, output_format="json"):
+        """发起流式请求，读到第一个翻译数据块后返回响应"""
+        response = self.client.post(
+            "/api/v2/translate",
+            data=json.dumps({"text": text, "output_format": output_format}),
+            content_type="application/json",
+            buffered=False,
+        )
+        for data in response.response:
+            if b'"translation"' in data:
+                break
+        return response
+
+    def wait_for_upstream_disconnect(self, timeout=2):
+        deadline = time.monotonic() + timeout
+        while self.fake.disconnects == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.fake.disconnects
+
+    def assert_cancelled(self, before, start):
+        """上游在流结束前被关闭，并记录了断开和节省的令牌"""
+        self.assertEqual(self.wait_for_upstream_disconnect(), 1)
+        # 完整的上游流需要约 1 秒
+        self.assertLess(time.monotonic() - start, 0.8)
+        stats = get_cancellation_stats()
+        self.assertEqual(stats["client_disconnects"] - before["client_disconnects"], 1)
+        deadline = time.monotonic() + 1
+        while (
+            get_cancellation_stats()["upstream_cancelled"]
+            == before["upstream_cancelled"]
+            and time.monotonic() < deadline
+        ):
+            time.sleep(0.01)
+        stats = get_cancellation_stats()
+        self.assertEqual(stats["upstream_cancelled"] - before["upstream_cancelled"], 1)
+        self.assertGreater(stats["tokens_saved"], before["tokens_saved"])
+
+    def test_disconnect_closes_upstream(self):
+        """测试客户端断开时立即关闭上游流"""
+        before = get_cancellation_stats()
+        start = time.monotonic()
+        with patch("app.services.translator.TRANSLATION_COALESCE", False):
+            response = self.open_stream("Cancel me")
+            response.close()
+        self.assert_cancelled(before, start)
+
+    def test_disconnect_abandons_coalesced_stream(self):
+        """测试合并的流在所有订阅者断开后关闭上游"""
+        before = get_cancellation_stats()
+        abandoned = stream_flights.get_stats()["abandoned"]
+        start = time.monotonic()
+        response = self.open_stream("Cancel coalesced")
+        response.close()
+        self.assert_cancelled(before, start)
+        self.assertEqual(stream_flights.get_stats()["abandoned"] - abandoned, 1)
+
+    def test_disconnect_skips_document(self):
+        """测试客户端断开后不再生成Word文档"""
+        before = get_cancellation_stats()
+        with patch(
+            "app.services.translator.word_document_chunk"
+        ) as mock_document, patch(
+            "app.services.translator.TRANSLATION_COALESCE", False
+        ):
+            response = self.open_stream("Cancel document", output_format="word")
+            response.close()
+        mock_document.assert_not_called()
+        stats = get_cancellation_stats()
+        self.assertEqual(stats["documents_skipped"] - before["documents_skipped"], 1)
+
+    def test_cancelled_stream_is_not_cached(self):
+        """测试被取消的流不写入缓存"""
+        with patch("app.services.translator.TRANSLATION_COALESCE", False):
+            self.open_stream("Cancel cache").close()
+        self.wait_for_upstream_disconnect()
+        self.assertIsNone(translation_cache.get(get_cache_key("Cancel cache", False)))
+
+
+if __name__ == "__main__":
+    unittest.main()
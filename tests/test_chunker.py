@@ -0,0 +1,126 @@
+import unittest
+from unittest.mock import patch
+import threading
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.chunker import (
+    estimate_tokens,
+    split_into_chunks,
+    join_chunk_translations,
+    merge_vocabularies,
+    run_bounded,
+)
+from app.services.translator import translate_with_vocabulary
+from app.services.cache import translation_cache
+
+
+class TestChunker(unittest.TestCase):
+
+    def test_short_text_is_single_chunk(self):
+        """测试短文本不切分"""
+        self.assertEqual(
+            split_into_chunks("Hello, world!", 100), [("Hello, world!", "")]
+        )
+
+    def test_split_on_sentence_boundaries(self):
+        """测试在句子边界切分且不超出预算"""
+        text = " ".join(f"Sentence number {i} is here." for i in range(20))
+        chunks = split_into_chunks(text, 20)
+        self.assertGreater(len(chunks), 1)
+        for chunk, _ in chunks:
+            self.assertLessEqual(estimate_tokens(chunk), 20)
+            self.assertTrue(chunk.endswith("."))
+        self.assertEqual(" ".join(chunk for chunk, _ in chunks), text)
+
+    def test_oversized_sentence_split_on_words(self):
+        """测试超长单句按单词切分"""
+        text = " ".join(["word"] * 100)
+        chunks = split_into_chunks(text, 10)
+        self.assertEqual(" ".join(chunk for chunk, _ in chunks), text)
+        for chunk, _ in chunks:
+            self.assertLessEqual(estimate_tokens(chunk), 10)
+
+    def test_join_keeps_paragraphs(self):
+        """测试拼接时保留段落换行"""
+        self.assertEqual(
+            join_chunk_translations(["一。", "二。"], ["\n\n", ""]), "一。\n\n二。"
+        )
+
+    def test_merge_vocabularies(self):
+        """测试合并词汇表并按英文术语去重"""
+        unknown = {
+            "english": "Unknown",
+            "chinese": "未知",
+            "explanation": "词汇提取失败",
+        }
+        merged = merge_vocabularies(
+            [
+                [{"english": "Machine Learning", "chinese": "机器学习"}],
+                [{"english": "machine learning", "chinese": "机器学习"}, unknown],
+                [{"english": "Deep Learning", "chinese": "深度学习"}],
+            ],
+            ignored=[unknown],
+        )
+        self.assertEqual(
+            [term["english"] for term in merged], ["Machine Learning", "Deep Learning"]
+        )
+
+    def test_merge_vocabularies_limit(self):
+        """测试合并后的词汇表不超过术语数上限"""
+        lists = [
+            [{"english": f"Term {chunk}-{i}", "chinese": "术语"} for i in range(3)]
+            for chunk in range(4)
+        ]
+        merged = merge_vocabularies(lists, limit=5)
+        self.assertEqual(len(merged), 5)
+        self.assertEqual(merged[0]["english"], "Term 0-0")
+        self.assertEqual(len(merge_vocabularies(lists, limit=None)), 12)
+
+    def test_zero_budget_disables_chunking(self):
+        """测试令牌预算为 0 时不切分"""
+        text = " ".join(["word"] * 100)
+        self.assertEqual(split_into_chunks(text, 0), [(text, "")])
+
+    def test_run_bounded_keeps_order_and_limit(self):
+        """测试有界并发执行保持顺序且不超过并发上限"""
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def work(item):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.01)
+            with lock:
+                state["running"] -= 1
+            return item * 2
+
+        self.assertEqual(run_bounded(work, range(10), 3), [i * 2 for i in range(10)])
+        self.assertLessEqual(state["peak"], 3)
+
+    @patch("app.services.translator.TRANSLATION_CHUNK_TOKENS", 10)
+    @patch("app.services.translator.translate_chunk")
+    def test_translator_translates_chunks(self, mock_translate_chunk):
+        """测试长文本按分块翻译后按顺序拼接"""
+        translation_cache.clear()
+        mock_translate_chunk.side_effect = lambda text, include_vocabulary: (
+            f"[{text}]",
+            [{"english": "Term", "chinese": "术语", "explanation": ""}],
+        )
+
+        text = "First sentence is long enough. Second sentence is long enough."
+        translation, vocabulary = translate_with_vocabulary(text, True)
+
+        self.assertEqual(
+            translation,
+            "[First sentence is long enough.][Second sentence is long enough.]",
+        )
+        self.assertEqual(len(vocabulary), 1)
+        self.assertEqual(mock_translate_chunk.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,10 +2,16 @@ import unittest
 import os
 import sys
 import shutil
+from unittest.mock import patch
 from docx import Document
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from app.services.document_generator import generate_word_document
+from app.services.document_generator import (
+    generate_word_document,
+    render_word_document,
+    get_inline_document_stats,
+    DocumentTooLarge,
+)
 
 class TestDocumentGenerator(unittest.TestCase):
     
@@ -76,5 +82,60 @@ class TestDocumentGenerator(unittest.TestCase):
         self.assertEqual(table.cell(0, 2).text, "术语解释")
         self.assertEqual(table.cell(1, 0).text, "Machine Learning")
 
+    def test_generate_word_document_large_vocabulary(self):
+        """测试大量词汇行和页脚"""
+        vocabulary = [{
+            "english": f"Term {i}",
+            "chinese": f"术语 {i}",
+            "explanation": f"第 {i} 行\n第二行"
+        } for i in range(500)]
+
+        generate_word_document("Text", "文本", vocabulary, self.test_file)
+
+        doc = Document(self.test_file)
+        table = doc.tables[0]
+        self.assertEqual(len(table.rows), 501)
+        self.assertEqual(table.cell(1, 0).text, "Term 0")
+        self.assertEqual(table.cell(500, 1).text, "术语 499")
+        self.assertEqual(table.cell(500, 2).text, "第 499 行\n第二行")
+        self.assertEqual(doc.sections[0].footer.paragraphs[0].text, "此文档由 xxx 翻译助手自动生成")
+        self.assertEqual(doc.styles["Normal"].font.name, "Microsoft YaHei")
+
+    def test_render_word_document_in_memory(self):
+        """测试在内存中生成文档，不写入磁盘"""
+        vocabulary = [{"english": "API", "chinese": "接口", "explanation": "说明"}]
+        buffer = render_word_document("Hello", "你好", vocabulary)
+
+        self.assertEqual(buffer.tell(), 0)
+        self.assertEqual(os.listdir(self.test_dir), [])
+        doc = Document(buffer)
+        self.assertEqual(doc.tables[0].cell(1, 0).text, "API")
+        stats = get_inline_document_stats()
+        self.assertGreater(stats["documents"], 0)
+        self.assertGreaterEqual(stats["bytes_max"], buffer.getbuffer().nbytes)
+
+    def test_render_word_document_max_bytes(self):
+        """测试文档超过大小上限"""
+        rejected = get_inline_document_stats()["rejected"]
+        with self.assertRaises(DocumentTooLarge):
+            render_word_document("Hello", "你好", [], max_bytes=100)
+        self.assertEqual(get_inline_document_stats()["rejected"], rejected + 1)
+    def test_documents_are_byte_identical(self):
+        """测试相同输入在不同时间生成的文档字节相同"""
+        vocabulary = [{"english": "API", "chinese": "接口", "explanation": "说明"}]
+        first = os.path.join(self.test_dir, "first.docx")
+        second = os.path.join(self.test_dir, "second.docx")
+        with patch("time.time", return_value=1_600_000_000):
+            generate_word_document("Hello", "你好", vocabulary, first)
+        with patch("time.time", return_value=1_700_000_000):
+            generate_word_document("Hello", "你好", vocabulary, second)
+            rendered = render_word_document("Hello", "你好", vocabulary).getvalue()
+
+        with open(first, "rb") as f:
+            content = f.read()
+        with open(second, "rb") as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(rendered, content)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app
+from app.services.document_jobs import (
+    DocumentQueueFull,
+    get_document_job,
+    submit_document_job,
+    JOB_DONE,
+    JOB_FAILED,
+)
+
+
+class TestDocumentJobs(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        self.test_dir = tempfile.mkdtemp()
+        self.job_folder = os.path.join(self.test_dir, "jobs")
+        self.download_folder = os.path.join(self.test_dir, "downloads")
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def wait_for_job(self, job_id, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = get_document_job(self.job_folder, job_id)
+            if job["status"] in (JOB_DONE, JOB_FAILED):
+                return job
+            time.sleep(0.02)
+        self.fail("文档任务超时")
+
+    def test_job_generates_document(self):
+        """测试后台任务生成文档"""
+        job = submit_document_job(
+            self.job_folder, self.download_folder, "Hello", "你好", []
+        )
+        self.assertEqual(job["status"], "pending")
+
+        finished = self.wait_for_job(job["job_id"])
+        self.assertEqual(finished["status"], JOB_DONE)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.download_folder, job["filename"]))
+        )
+
+    def test_unknown_or_invalid_job(self):
+        """测试不存在或非法的任务ID"""
+        self.assertIsNone(get_document_job(self.job_folder, "0" * 32))
+        self.assertIsNone(get_document_job(self.job_folder, "../../etc/passwd"))
+
+    @patch("app.services.document_jobs.DOCUMENT_JOB_QUEUE_SIZE", 0)
+    def test_queue_full(self):
+        """测试队列已满时拒绝提交"""
+        with self.assertRaises(DocumentQueueFull):
+            submit_document_job(self.job_folder, self.download_folder, "a", "b", [])
+
+    @patch("app.api.routes.translate_with_vocabulary")
+    def test_async_document_api(self, mock_translate_with_vocabulary):
+        """测试 v1 接口返回任务句柄并可查询状态"""
+        mock_translate_with_vocabulary.return_value = ("你好", [])
+        app = create_app()
+        app.config["DOCUMENT_JOB_FOLDER"] = self.job_folder
+        app.config["DOWNLOAD_FOLDER"] = self.download_folder
+        client = app.test_client()
+
+        response = client.post(
+            "/api/v1/translate",
+            json={"text": "Hello", "output_format": "word", "async_document": True},
+        )
+        data = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        job = data["word_document_job"]
+        self.assertEqual(data["word_document_url"], job["word_document_url"])
+
+        self.wait_for_job(job["job_id"])
+        status = client.get(job["status_url"]).get_json()
+        self.assertEqual(status["status"], JOB_DONE)
+        self.assertEqual(client.get("/api/v1/documents/" + "0" * 32).status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app
+from app.services import document_generator, document_storage
+from app.services.document_generator import generate_word_document_url
+from app.services.document_storage import (
+    document_filename,
+    sweep_documents,
+    touch_document,
+    get_document_storage_stats,
+)
+
+
+class TestDocumentStorage(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def make_file(self, name, size, age):
+        path = os.path.join(self.test_dir, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_filename_depends_on_content(self):
+        """测试文件名由文档内容决定"""
+        name = document_filename("Hello", "你好", [])
+        self.assertEqual(name, document_filename("Hello", "你好", []))
+        self.assertNotEqual(name, document_filename("Hello", "您好", []))
+        self.assertRegex(name, r"^translation_[0-9a-f]{32}\.docx$")
+
+    def test_identical_request_reuses_file(self):
+        """测试相同内容的文档直接复用，不再重新生成"""
+        with patch(
+            "app.services.document_generator.generate_word_document",
+            wraps=document_generator.generate_word_document,
+        ) as mock_generate:
+            first = generate_word_document_url("Hello", "你好", [], self.test_dir)
+            second = generate_word_document_url("Hello", "你好", [], self.test_dir)
+
+        self.assertEqual(first, second)
+        self.assertEqual(mock_generate.call_count, 1)
+        self.assertEqual(os.listdir(self.test_dir), [first.split("/")[-1]])
+
+    def test_create_app_starts_no_janitor(self):
+        """测试创建应用不启动清理线程，preload 模式下 master 中没有清理线程"""
+        before = dict(document_storage._janitors)
+        create_app()
+        self.assertEqual(document_storage._janitors, before)
+
+    def test_sweep_removes_idle_files(self):
+        """测试删除空闲超过保留时间的文档，复用过的文档重新计时"""
+        old = self.make_file("old.docx", 10, age=100)
+        new = self.make_file("new.docx", 10, age=1)
+        reused = self.make_file("reused.docx", 10, age=100)
+        touch_document(reused)
+        result = sweep_documents(self.test_dir, idle_ttl=50, max_bytes=1000)
+        self.assertEqual(result["files_evicted"], 1)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+        self.assertTrue(os.path.exists(reused))
+
+    def test_sweep_enforces_max_bytes_lru(self):
+        """测试超出容量时按最近使用时间淘汰"""
+        oldest = self.make_file("a.docx", 100, age=30)
+        middle = self.make_file("b.docx", 100, age=20)
+        newest = self.make_file("c.docx", 100, age=10)
+        self.make_file("ignored.tmp", 1000, age=10)
+
+        result = sweep_documents(self.test_dir, idle_ttl=3600, max_bytes=250)
+
+        self.assertEqual(result, {"files_evicted": 1, "bytes_evicted": 100})
+        self.assertFalse(os.path.exists(oldest))
+        self.assertTrue(os.path.exists(middle))
+        self.assertTrue(os.path.exists(newest))
+        stats = get_document_storage_stats()
+        self.assertEqual(stats["bytes_stored"], 200)
+        self.assertEqual(stats["files_stored"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
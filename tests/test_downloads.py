@@ -0,0 +1,128 @@
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app
+from app.services.document_storage import document_etag, document_filename
+
+FILENAME = document_filename("Hello", "你好", [])
+
+
+class TestDownloads(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        self.test_dir = tempfile.mkdtemp()
+        self.app = create_app()
+        self.app.config["DOWNLOAD_FOLDER"] = self.test_dir
+        self.app.testing = True
+        self.client = self.app.test_client()
+        self.content = bytes(range(256)) * 4
+        with open(os.path.join(self.test_dir, FILENAME), "wb") as f:
+            f.write(self.content)
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def test_download_has_strong_etag_and_immutable_cache(self):
+        """测试下载返回强 ETag 和长期缓存头"""
+        response = self.client.get(f"/downloads/{FILENAME}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.content)
+        etag, weak = response.get_etag()
+        self.assertFalse(weak)
+        self.assertEqual(etag, document_etag(FILENAME))
+        self.assertIn(etag, FILENAME)
+        self.assertIn("immutable", response.headers["Cache-Control"])
+        self.assertIn("public", response.headers["Cache-Control"])
+        response.close()
+
+    def test_if_none_match_returns_304(self):
+        """测试 ETag 匹配时返回 304"""
+        etag = self.client.get(f"/downloads/{FILENAME}").headers["ETag"]
+        response = self.client.get(
+            f"/downloads/{FILENAME}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+
+    def test_range_request(self):
+        """测试 Range 请求返回部分内容"""
+        response = self.client.get(
+            f"/downloads/{FILENAME}", headers={"Range": "bytes=10-19"}
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, self.content[10:20])
+        self.assertEqual(
+            response.headers["Content-Range"], f"bytes 10-19/{len(self.content)}"
+        )
+        response.close()
+
+    def test_missing_file_and_traversal_return_404(self):
+        """测试不存在的文件和目录穿越返回 404"""
+        self.assertEqual(self.client.get("/downloads/none.docx").status_code, 404)
+        self.assertEqual(
+            self.client.get("/downloads/../requirements.txt").status_code, 404
+        )
+
+    def test_x_accel_redirect_offload(self):
+        """测试 nginx 卸载模式只返回头部"""
+        self.app.config["DOWNLOAD_OFFLOAD"] = "x-accel-redirect"
+        response = self.client.get(f"/downloads/{FILENAME}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(
+            response.headers["X-Accel-Redirect"], f"/protected-downloads/{FILENAME}"
+        )
+        self.assertEqual(
+            response.headers["Content-Disposition"], f"attachment; filename={FILENAME}"
+        )
+        self.assertIn("immutable", response.headers["Cache-Control"])
+
+        etag = response.headers["ETag"]
+        response = self.client.get(
+            f"/downloads/{FILENAME}", headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_x_sendfile_offload(self):
+        """测试 Apache 卸载模式返回文件路径"""
+        self.app.config["DOWNLOAD_OFFLOAD"] = "x-sendfile"
+        response = self.client.get(f"/downloads/{FILENAME}")
+        self.assertEqual(
+            response.headers["X-Sendfile"], os.path.join(self.test_dir, FILENAME)
+        )
+        self.assertEqual(response.data, b"")
+
+    def test_offload_quotes_filename(self):
+        """测试卸载模式对文件名做 URL 编码，非 ASCII 文件名按 RFC 6266 提供 filename*"""
+        with open(os.path.join(self.test_dir, "译文 1.docx"), "wb") as f:
+            f.write(self.content)
+        self.app.config["DOWNLOAD_OFFLOAD"] = "x-accel-redirect"
+        response = self.client.get("/downloads/译文 1.docx")
+        self.assertEqual(
+            response.headers["X-Accel-Redirect"],
+            "/protected-downloads/%E8%AF%91%E6%96%87%201.docx",
+        )
+        self.assertEqual(
+            response.headers["Content-Disposition"],
+            "attachment; filename=\" 1.docx\"; "
+            "filename*=UTF-8''%E8%AF%91%E6%96%87%201.docx",
+        )
+
+    def test_other_files_are_not_immutable(self):
+        """测试不是按内容命名的文件不返回强 ETag 和长期缓存头"""
+        with open(os.path.join(self.test_dir, "doc.docx"), "wb") as f:
+            f.write(self.content)
+        self.assertIsNone(document_etag("doc.docx"))
+        response = self.client.get("/downloads/doc.docx")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("immutable", response.headers.get("Cache-Control", ""))
+        response.close()
+
+if __name__ == "__main__":
+    unittest.main()
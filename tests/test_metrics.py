@@ -0,0 +1,205 @@
+import unittest
+from unittest.mock import patch
+import os
+import json
+import shutil
+import tempfile
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app
+from app.services import metrics
+from app.services.metrics import (
+    Counter,
+    Histogram,
+    archive_process,
+    collect,
+    start_worker_metrics,
+    render_metrics,
+    write_snapshot,
+)
+from app.services.translator import (
+    SEPARATOR,
+    split_translation_vocabulary,
+    translate_with_vocabulary_stream,
+)
+from app.services.providers import Provider, ProviderRouter
+from app.services.document_generator import render_word_document
+from app.services.cache import translation_cache
+from app.services.scheduler import upstream_scheduler
+from tests.fake_upstream import FakeUpstream
+
+test_counter = Counter("test_metrics_events_total", "测试计数器")
+test_histogram = Histogram("test_metrics_seconds", "测试直方图", (0.1, 1))
+
+
+def sample(name, **labels):
+    """汇总后指定指标和标签的值"""
+    return collect().get((name, tuple(sorted(labels.items()))))
+
+
+class TestMetricsFormat(unittest.TestCase):
+
+    def test_counter_and_histogram(self):
+        """测试计数器和直方图的 Prometheus 文本格式"""
+        test_counter.inc(2, kind='a"b')
+        test_histogram.observe(0.05, stage="x")
+        test_histogram.observe(0.5, stage="x")
+        test_histogram.observe(5, stage="x")
+        text = render_metrics()
+        self.assertIn("# TYPE test_metrics_events_total counter", text)
+        self.assertIn('test_metrics_events_total{kind="a\\"b"} 2', text)
+        self.assertIn('test_metrics_seconds_bucket{stage="x",le="0.1"} 1', text)
+        self.assertIn('test_metrics_seconds_bucket{stage="x",le="1"} 2', text)
+        self.assertIn('test_metrics_seconds_bucket{stage="x",le="+Inf"} 3', text)
+        self.assertIn('test_metrics_seconds_count{stage="x"} 3', text)
+        self.assertIn('test_metrics_seconds_sum{stage="x"} 5.55', text)
+
+
+class TestMultiprocess(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patcher = patch.object(metrics, "METRICS_DIR", self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write_worker(self, pid, samples):
+        with open(os.path.join(self.directory, f"{pid}.json"), "w") as f:
+            json.dump(samples, f)
+
+    def test_sums_worker_snapshots(self):
+        """测试汇总其他 worker 的快照"""
+        before = sample("test_metrics_events_total", kind="worker") or 0
+        self.write_worker(1001, [["test_metrics_events_total", {"kind": "worker"}, 3]])
+        self.write_worker(1002, [["test_metrics_events_total", {"kind": "worker"}, 4]])
+        self.assertEqual(sample("test_metrics_events_total", kind="worker"), before + 7)
+
+    def test_own_snapshot_not_counted_twice(self):
+        """测试当前进程的快照文件不重复计入"""
+        test_counter.inc(kind="self")
+        before = sample("test_metrics_events_total", kind="self")
+        write_snapshot()
+        self.assertEqual(sample("test_metrics_events_total", kind="self"), before)
+
+    def test_archive_keeps_counters_after_exit(self):
+        """测试已退出 worker 的计数器和直方图归档后保留，仪表不保留"""
+        self.write_worker(
+            2001,
+            [
+                ["test_metrics_events_total", {"kind": "exited"}, 5],
+                ["test_metrics_seconds", {"stage": "exited"}, [[1, 0], 0.05, 1]],
+                ["translator_upstream_waiting", {"kind": "exited"}, 9],
+            ],
+        )
+        archive_process(2001)
+        self.write_worker(2002, [["test_metrics_events_total", {"kind": "exited"}, 2]])
+        archive_process(2002)
+
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "2001.json")))
+        self.assertEqual(sample("test_metrics_events_total", kind="exited"), 7)
+        self.assertEqual(
+            sample("test_metrics_seconds", stage="exited"), [[1, 0], 0.05, 1]
+        )
+        self.assertIsNone(sample("translator_upstream_waiting", kind="exited"))
+
+    def test_archived_snapshot_skipped(self):
+        """测试已归档但快照尚未删除的 worker 不重复计入"""
+        self.write_worker(3001, [["test_metrics_events_total", {"kind": "late"}, 1]])
+        archive_process(3001)
+        self.write_worker(3001, [["test_metrics_events_total", {"kind": "late"}, 1]])
+        self.assertEqual(sample("test_metrics_events_total", kind="late"), 1)
+
+    def test_flush_starts_only_in_workers(self):
+        """测试记录指标不启动快照线程，只有 worker 调用 start_worker_metrics 后才写快照"""
+        with patch.object(metrics, "_flushers", {}), patch.object(
+            metrics, "_flush_loop", lambda: None
+        ):
+            test_counter.inc(kind="master")
+            self.assertEqual(metrics._flushers, {})
+            self.assertEqual(os.listdir(self.directory), [])
+
+            start_worker_metrics()
+            self.assertIn(os.getpid(), metrics._flushers)
+
+    def test_worker_resets_inherited_stats(self):
+        """测试 worker 启动时清零从 master 继承的缓存和准入统计"""
+        translation_cache.get("test-metrics-missing-key")
+        with upstream_scheduler.admit():
+            pass
+        with patch.object(metrics, "_flushers", {}), patch.object(
+            metrics, "_flush_loop", lambda: None
+        ):
+            start_worker_metrics()
+        self.assertEqual(translation_cache.get_stats()["misses"], 0)
+        self.assertEqual(upstream_scheduler.get_stats()["admitted"], 0)
+        self.assertEqual(sample("translator_cache_requests_total", result="miss"), 0)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.client = self.app.test_client()
+
+    def test_metrics_endpoint(self):
+        """测试 /metrics 输出请求数和缓存统计"""
+        self.client.get("/healthz").close()
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        text = response.get_data(as_text=True)
+        self.assertIn(
+            'translator_http_requests_total{endpoint="health_check",status="200"}',
+            text,
+        )
+        self.assertIn('translator_cache_requests_total{result="hit"}', text)
+        self.assertIn("translator_upstream_in_flight", text)
+
+    def test_vocabulary_parse_failures(self):
+        """测试词汇表解析失败计数"""
+        before = sample("translator_vocabulary_parse_failures_total", reason="no_json")
+        split_translation_vocabulary(f"译文{SEPARATOR}not json")
+        self.assertEqual(
+            sample("translator_vocabulary_parse_failures_total", reason="no_json"),
+            (before or 0) + 1,
+        )
+
+    def test_stream_vocabulary_parse_failures(self):
+        """测试流式响应中无法解析的词汇对象计入解析失败次数"""
+        translation_cache.clear()
+        content = (
+            f'译文{SEPARATOR}[{{"english": "A", "chinese": "甲"}}, '
+            '{"english": "B" "chinese": "乙"}]'
+        )
+        before = sample(
+            "translator_vocabulary_parse_failures_total", reason="invalid_term"
+        )
+        with FakeUpstream(content=content) as fake:
+            router = ProviderRouter([Provider("fake", fake.url, "test")])
+            with patch("app.services.translator.provider_router", router):
+                chunks = list(
+                    translate_with_vocabulary_stream("Terms", include_vocabulary=True)
+                )
+
+        terms = [chunk["term"] for chunk in chunks if "term" in chunk]
+        self.assertEqual([term["english"] for term in terms], ["A"])
+        self.assertEqual(
+            sample("translator_vocabulary_parse_failures_total", reason="invalid_term"),
+            (before or 0) + 1,
+        )
+
+    def test_document_metrics(self):
+        """测试记录Word文档的生成耗时和大小"""
+        before = sample("translator_document_bytes", mode="inline")
+        buffer = render_word_document("Hello", "你好", [])
+        after = sample("translator_document_bytes", mode="inline")
+        self.assertEqual(after[2] - (before[2] if before else 0), 1)
+        self.assertEqual(
+            after[1] - (before[1] if before else 0), len(buffer.getvalue())
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+import unittest
+from unittest.mock import patch
+import json
+import random
+import sys
+import os
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tests.fake_upstream import FakeUpstream
+from app.services.resilience import CircuitBreaker, CircuitOpenError, ResilientUpstream
+from app.services.providers import (
+    MODE_COMPLETION,
+    MODE_STREAM,
+    Provider,
+    ProviderRouter,
+    load_providers,
+)
+from app.services.translator import (
+    translate_with_vocabulary,
+    translate_with_vocabulary_stream,
+)
+from app.services.cache import translation_cache
+
+
+def make_provider(name, url="http://localhost:1", weight=1.0, threshold=2):
+    return Provider(
+        name,
+        url,
+        "test",
+        weight=weight,
+        breaker=CircuitBreaker(failure_threshold=threshold, reset_timeout=60),
+    )
+
+
+class TestProviderRouter(unittest.TestCase):
+
+    def test_prefers_lowest_latency(self):
+        """测试优先选择延迟最低的上游"""
+        fast, slow = make_provider("fast"), make_provider("slow")
+        fast.record_success(MODE_COMPLETION, 0.1)
+        slow.record_success(MODE_COMPLETION, 0.5)
+        router = ProviderRouter([slow, fast], explore_rate=0)
+        self.assertEqual(router.rank(MODE_COMPLETION), [fast, slow])
+
+    def test_latency_is_tracked_per_mode(self):
+        """测试非流式耗时和流式首字节耗时分别统计"""
+        a, b = make_provider("a"), make_provider("b")
+        a.record_success(MODE_COMPLETION, 0.1)
+        b.record_success(MODE_COMPLETION, 0.5)
+        a.record_success(MODE_STREAM, 0.9)
+        b.record_success(MODE_STREAM, 0.2)
+        router = ProviderRouter([a, b], explore_rate=0)
+        self.assertIs(router.rank(MODE_COMPLETION)[0], a)
+        self.assertIs(router.rank(MODE_STREAM)[0], b)
+
+    def test_errors_penalize_score(self):
+        """测试错误率升高后评分变差"""
+        a, b = make_provider("a", threshold=100), make_provider("b")
+        a.record_success(MODE_COMPLETION, 0.1)
+        b.record_success(MODE_COMPLETION, 0.2)
+        for _ in range(5):
+            a.record_failure(requests.exceptions.ConnectionError())
+        router = ProviderRouter([a, b], explore_rate=0)
+        self.assertIs(router.rank(MODE_COMPLETION)[0], b)
+
+    def test_unmeasured_providers_are_tried_by_weight(self):
+        """测试没有样本的上游按权重随机选择"""
+        heavy = make_provider("heavy", weight=9)
+        light = make_provider("light", weight=1)
+        router = ProviderRouter([heavy, light], rng=random.Random(1))
+        picks = [router.rank(MODE_COMPLETION)[0].name for _ in range(500)]
+        self.assertGreater(picks.count("heavy"), picks.count("light") * 3)
+        self.assertGreater(picks.count("light"), 0)
+
+    def test_exclude_and_fallback(self):
+        """测试排除已尝试的上游，全部排除时重新选择"""
+        a, b = make_provider("a"), make_provider("b")
+        a.record_success(MODE_COMPLETION, 0.1)
+        b.record_success(MODE_COMPLETION, 0.2)
+        router = ProviderRouter([a, b], explore_rate=0)
+        self.assertIs(router.select(MODE_COMPLETION, exclude={"a"}), b)
+        self.assertIs(router.select(MODE_COMPLETION, exclude={"a", "b"}), a)
+
+    def test_open_breaker_is_skipped(self):
+        """测试熔断的上游不参与选择，全部熔断时抛出 CircuitOpenError"""
+        a, b = make_provider("a", threshold=1), make_provider("b", threshold=1)
+        router = ProviderRouter([a, b], explore_rate=0)
+        a.record_failure(requests.exceptions.ConnectionError())
+        self.assertIs(router.select(MODE_COMPLETION), b)
+
+        b.record_failure(requests.exceptions.ConnectionError())
+        with self.assertRaises(CircuitOpenError) as context:
+            router.select(MODE_COMPLETION)
+        self.assertGreater(context.exception.retry_after, 0)
+
+    def test_model_override(self):
+        """测试按上游的模型名改写请求体"""
+        provider = Provider("other", "http://localhost:1", "key", model="other-model")
+        payload = {"model": "deepseek-chat", "messages": []}
+        self.assertEqual(provider.payload(payload)["model"], "other-model")
+        self.assertEqual(payload["model"], "deepseek-chat")
+        self.assertEqual(provider.headers()["Authorization"], "Bearer key")
+
+
+class TestLoadProviders(unittest.TestCase):
+
+    def test_default_provider(self):
+        """测试未配置时使用默认上游"""
+        providers = load_providers("", "http://default", "key", "deepseek-chat")
+        self.assertEqual(len(providers), 1)
+        self.assertEqual(providers[0].url, "http://default")
+        self.assertEqual(providers[0].api_key, "key")
+
+    @patch.dict(os.environ, {"OTHER_API_KEY": "other-key"})
+    def test_json_config(self):
+        """测试从 JSON 加载多个上游，密钥可以从环境变量读取"""
+        config = json.dumps(
+            [
+                {"name": "primary", "url": "http://a", "weight": 3},
+                {"url": "http://b", "api_key_env": "OTHER_API_KEY", "model": "m"},
+            ]
+        )
+        primary, other = load_providers(config, None, "default-key", "deepseek-chat")
+        self.assertEqual(primary.name, "primary")
+        self.assertEqual(primary.api_key, "default-key")
+        self.assertEqual(primary.weight, 3)
+        self.assertEqual(other.name, "provider-1")
+        self.assertEqual(other.api_key, "other-key")
+        self.assertEqual(other.model, "m")
+
+
+class TestTranslatorFailover(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        translation_cache.clear()
+        self.broken = FakeUpstream(error_rate=1.0, error_status=503).start()
+        self.healthy = FakeUpstream(content="你好").start()
+        self.router = ProviderRouter(
+            [
+                make_provider("broken", self.broken.url, weight=1000),
+                make_provider("healthy", self.healthy.url, weight=0.001),
+            ],
+            explore_rate=0,
+        )
+        resilient = ResilientUpstream(retries=1, base_delay=0.001, max_delay=0.01)
+        self.patches = [
+            patch("app.services.translator.provider_router", self.router),
+            patch("app.services.translator.upstream", resilient),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        """测试后清理"""
+        for patcher in self.patches:
+            patcher.stop()
+        self.broken.stop()
+        self.healthy.stop()
+
+    def test_retry_goes_to_other_provider(self):
+        """测试非流式请求失败后重试发往另一个上游"""
+        self.assertEqual(translate_with_vocabulary("Hello"), ("你好", []))
+        self.assertEqual(self.broken.requests, 1)
+        self.assertEqual(self.healthy.requests, 1)
+        stats = self.router.get_stats()
+        self.assertEqual(stats["broken"]["errors"], 1)
+        self.assertIsNotNone(stats["healthy"]["completion_latency_ms"])
+
+    def test_stream_connect_falls_back(self):
+        """测试流式请求建立连接失败时换用另一个上游"""
+        self.healthy.content = "Hello, world!"
+        events = list(translate_with_vocabulary_stream("Hello stream"))
+        translation = "".join(event.get("translation", "") for event in events)
+        self.assertEqual(translation, "Hello, world!")
+        self.assertEqual(self.broken.requests, 1)
+        self.assertIsNotNone(self.router.get_stats()["healthy"]["stream_latency_ms"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,308 @@
+import unittest
+from unittest.mock import patch
+import json
+import time
+import threading
+import contextvars
+import sys
+import os
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tests.fake_upstream import FakeUpstream
+from app import create_app
+from app.services import upstream_client
+from app.services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientUpstream,
+    BREAKER_CLOSED,
+    BREAKER_OPEN,
+    BREAKER_HALF_OPEN,
+)
+from app.services.cancellation import StreamCancelled, current_scope
+from app.services.providers import Provider, ProviderRouter
+from app.services.translator import translate_with_vocabulary
+from app.services.cache import translation_cache
+
+request_tag = contextvars.ContextVar("request_tag", default=None)
+
+
+class FakeResponse:
+    """可以从其他线程关闭的响应"""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+def upstream_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status}", response=response)
+
+
+def post_and_parse(url):
+    """发送一次非流式请求并返回内容"""
+
+    def call():
+        response = upstream_client.post(url, json={"messages": []})
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    return call
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_after_consecutive_failures(self):
+        """测试连续失败达到阈值后熔断"""
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+        for _ in range(2):
+            breaker.before_call()
+            breaker.record_failure(upstream_error(503))
+        self.assertEqual(breaker.state, BREAKER_CLOSED)
+
+        breaker.before_call()
+        breaker.record_failure(upstream_error(503))
+        self.assertEqual(breaker.state, BREAKER_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        self.assertEqual(breaker.get_stats()["rejected"], 1)
+
+    def test_client_errors_do_not_count(self):
+        """测试 4xx 错误不计入熔断"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        breaker.record_failure(upstream_error(400))
+        self.assertEqual(breaker.state, BREAKER_CLOSED)
+
+    def test_half_open_allows_single_probe(self):
+        """测试恢复时间后只放行一个试探请求，成功后关闭"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure(requests.exceptions.ConnectionError())
+        time.sleep(0.06)
+
+        breaker.before_call()
+        self.assertEqual(breaker.state, BREAKER_HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, BREAKER_CLOSED)
+
+    def test_failed_probe_reopens(self):
+        """测试试探请求失败后重新熔断"""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure(requests.exceptions.Timeout())
+        time.sleep(0.06)
+        breaker.before_call()
+        breaker.record_failure(requests.exceptions.Timeout())
+        self.assertEqual(breaker.state, BREAKER_OPEN)
+
+
+class TestResilientUpstream(unittest.TestCase):
+
+    def make_upstream(self, **kwargs):
+        options = {
+            "breaker": CircuitBreaker(failure_threshold=5, reset_timeout=60),
+            "retries": 2,
+            "base_delay": 0.001,
+            "max_delay": 0.01,
+        }
+        options.update(kwargs)
+        return ResilientUpstream(**options)
+
+    def test_backoff_is_bounded_and_jittered(self):
+        """测试退避时间在指数上限内随机"""
+        resilient = self.make_upstream(base_delay=0.1, max_delay=1)
+        delays = [resilient.backoff(3) for _ in range(50)]
+        self.assertTrue(all(0 <= delay <= 0.8 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+        self.assertLessEqual(resilient.backoff(10), 1)
+
+    def test_retries_server_errors(self):
+        """测试 5xx 错误重试后成功"""
+        resilient = self.make_upstream()
+        with FakeUpstream(content="你好", errors=[503, 500]) as fake:
+            self.assertEqual(resilient.call(post_and_parse(fake.url)), "你好")
+            self.assertEqual(fake.requests, 3)
+        self.assertEqual(resilient.get_stats()["retries"], 2)
+
+    def test_gives_up_after_retries(self):
+        """测试重试次数用完后抛出异常"""
+        resilient = self.make_upstream(retries=1)
+        with FakeUpstream(errors=[502, 502, 502]) as fake:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                resilient.call(post_and_parse(fake.url))
+            self.assertEqual(fake.requests, 2)
+
+    def test_does_not_retry_client_errors(self):
+        """测试 4xx 错误不重试"""
+        resilient = self.make_upstream()
+        with FakeUpstream(errors=[400]) as fake:
+            with self.assertRaises(requests.exceptions.HTTPError):
+                resilient.call(post_and_parse(fake.url))
+            self.assertEqual(fake.requests, 1)
+
+    def test_breaker_fails_fast(self):
+        """测试熔断后不再请求上游"""
+        resilient = self.make_upstream(
+            retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        )
+        with FakeUpstream(error_rate=1.0, error_status=503) as fake:
+            for _ in range(2):
+                with self.assertRaises(requests.exceptions.HTTPError):
+                    resilient.call(post_and_parse(fake.url))
+            with self.assertRaises(CircuitOpenError):
+                resilient.call(post_and_parse(fake.url))
+            self.assertEqual(fake.requests, 2)
+
+    def test_hedged_request_wins_when_first_is_slow(self):
+        """测试首个请求超过延迟百分位时发出对冲请求，返回先完成的结果"""
+        resilient = self.make_upstream(hedge_percentile=95, hedge_min_samples=5)
+        for _ in range(10):
+            resilient.latency.record(0.02)
+
+        with FakeUpstream(
+            content="你好", latency=lambda number: 1.0 if number == 0 else 0.0
+        ) as fake:
+            start = time.monotonic()
+            self.assertEqual(resilient.call(post_and_parse(fake.url)), "你好")
+            self.assertLess(time.monotonic() - start, 0.5)
+            self.assertEqual(fake.requests, 2)
+
+        stats = resilient.get_stats()
+        self.assertEqual(stats["hedged"], 1)
+        self.assertEqual(stats["hedge_wins"], 1)
+
+    def test_hedge_copies_context_and_cancels_loser(self):
+        """测试对冲请求继承调用方的上下文，先成功的请求返回后关闭落后请求的响应"""
+        resilient = self.make_upstream(hedge_percentile=95, hedge_min_samples=5)
+        for _ in range(10):
+            resilient.latency.record(0.02)
+        slow_response = FakeResponse()
+        tags = []
+        calls = []
+
+        def call():
+            tags.append(request_tag.get())
+            calls.append(None)
+            if len(calls) == 1:
+                current_scope().register(slow_response)
+                if slow_response.closed.wait(2):
+                    raise StreamCancelled("上游请求已取消")
+                return "慢"
+            return "快"
+
+        token = request_tag.set("req-1")
+        try:
+            self.assertEqual(resilient.call(call), "快")
+        finally:
+            request_tag.reset(token)
+
+        self.assertTrue(slow_response.closed.wait(1))
+        self.assertEqual(tags, ["req-1", "req-1"])
+        self.assertEqual(resilient.get_stats()["hedge_wins"], 1)
+
+    def test_no_hedge_without_samples(self):
+        """测试样本不足时不对冲"""
+        resilient = self.make_upstream(hedge_percentile=95, hedge_min_samples=5)
+        with FakeUpstream(content="你好", latency=0.05) as fake:
+            resilient.call(post_and_parse(fake.url))
+            self.assertEqual(fake.requests, 1)
+
+
+class TestTranslatorResilience(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        translation_cache.clear()
+        self.fake = FakeUpstream(content="你好").start()
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        self.resilient = ResilientUpstream(retries=1, base_delay=0.001, max_delay=0.01)
+        router = ProviderRouter(
+            [Provider("fake", self.fake.url, "test", breaker=self.breaker)]
+        )
+        self.patches = [
+            patch("app.services.translator.provider_router", router),
+            patch("app.services.translator.upstream", self.resilient),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+        self.app = create_app()
+        self.app.testing = True
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        """测试后清理"""
+        for patcher in self.patches:
+            patcher.stop()
+        self.fake.stop()
+
+    def translate(self, text, path="/api/v1/translate"):
+        return self.client.post(
+            path, data=json.dumps({"text": text}), content_type="application/json"
+        )
+
+    def test_transient_error_is_retried(self):
+        """测试上游短暂故障时重试后成功"""
+        self.fake.errors = [503]
+        self.assertEqual(translate_with_vocabulary("Hello"), ("你好", []))
+        self.assertEqual(self.fake.requests, 2)
+
+    def test_open_breaker_serves_cache_and_returns_503(self):
+        """测试熔断时缓存命中的请求正常返回，其余请求快速返回 503"""
+        self.assertEqual(self.translate("Cached").status_code, 200)
+
+        self.fake.error_rate = 1.0
+        self.fake.error_status = 503
+        self.assertEqual(self.translate("Broken").status_code, 500)
+        requests_before = self.fake.requests
+
+        response = self.translate("Another")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response.headers)
+        self.assertFalse(json.loads(response.data)["success"])
+
+        response = self.translate("Cached")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)["translation"], "你好")
+        self.assertEqual(self.fake.requests, requests_before)
+
+    def test_stream_error_event_when_breaker_open(self):
+        """测试熔断时流式请求返回带 retry_after 的错误数据块"""
+        for _ in range(2):
+            self.breaker.record_failure(requests.exceptions.ConnectionError())
+        response = self.translate("Stream", path="/api/v2/translate")
+        events = [
+            json.loads(line[len("data: ") :])
+            for line in response.data.decode("utf-8").split("\n\n")
+            if line.startswith("data: {")
+        ]
+        self.assertEqual(events[0]["type"], "error")
+        self.assertIn("retry_after", events[0])
+        self.assertEqual(self.fake.requests, 0)
+
+    def test_stream_through_fake_upstream(self):
+        """测试流式翻译经过模拟上游"""
+        self.fake.content = "Hello, streaming world!"
+        self.fake.token_delay = 0.001
+        response = self.translate("Stream ok", path="/api/v2/translate")
+        body = response.data.decode("utf-8")
+        events = [
+            json.loads(line[len("data: ") :])
+            for line in body.split("\n\n")
+            if line.startswith("data: {")
+        ]
+        self.assertEqual(
+            "".join(event.get("translation", "") for event in events),
+            "Hello, streaming world!",
+        )
+        self.assertIn("[DONE]", body)
+        self.assertEqual(self.breaker.state, BREAKER_CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,320 @@
+import unittest
+from unittest.mock import patch
+import multiprocessing
+import asyncio
+import tempfile
+import threading
+import shutil
+import json
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tests.fake_upstream import FakeUpstream
+from app import create_app
+from app.services.chunker import run_bounded
+from app.services.providers import Provider, ProviderRouter
+from app.services.resilience import ResilientUpstream, UpstreamRejected
+from app.services.cache import translation_cache
+from app.services.tokens import OUTPUT_TOKENS_MIN
+from app.services.scheduler import (
+    AdmissionScheduler,
+    QueueTimeout,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_STANDARD,
+    PRIORITY_BATCH,
+    request_priority,
+    current_priority,
+)
+
+
+def hold_global_slot(lock_dir, ready, release):
+    """在子进程中占用全局名额，模拟另一个 worker"""
+    scheduler = AdmissionScheduler(
+        max_concurrency=0, global_concurrency=1, lock_dir=lock_dir, timeout=1
+    )
+    with scheduler.admit():
+        ready.set()
+        release.wait(5)
+
+
+class TestAdmissionScheduler(unittest.TestCase):
+
+    def run_waiters(self, scheduler, priorities, order):
+        """依次启动排队的请求，每个请求获得名额后记录自己的优先级"""
+
+        def worker(priority):
+            with scheduler.admit(priority=priority):
+                order.append(priority)
+
+        threads = []
+        for priority in priorities:
+            thread = threading.Thread(target=worker, args=(priority,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.02)
+        return threads
+
+    def test_concurrency_cap(self):
+        """测试同时进行的请求数不超过上限"""
+        scheduler = AdmissionScheduler(max_concurrency=2, tokens_per_minute=0)
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        def work(_):
+            with scheduler.admit():
+                with lock:
+                    state["active"] += 1
+                    state["peak"] = max(state["peak"], state["active"])
+                time.sleep(0.02)
+                with lock:
+                    state["active"] -= 1
+
+        run_bounded(work, range(8), concurrency=8)
+        self.assertEqual(state["peak"], 2)
+        stats = scheduler.get_stats()
+        self.assertEqual(stats["admitted"], 8)
+        self.assertGreater(stats["queued"], 0)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_interactive_before_batch(self):
+        """测试名额释放后交互式请求先于更早排队的批量请求"""
+        scheduler = AdmissionScheduler(max_concurrency=1, aging=0)
+        order = []
+        with scheduler.admit():
+            threads = self.run_waiters(
+                scheduler,
+                [PRIORITY_BATCH, PRIORITY_STANDARD, PRIORITY_INTERACTIVE],
+                order,
+            )
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            order, [PRIORITY_INTERACTIVE, PRIORITY_STANDARD, PRIORITY_BATCH]
+        )
+
+    def test_same_priority_is_fifo(self):
+        """测试同一优先级先到先得"""
+        scheduler = AdmissionScheduler(max_concurrency=1, aging=0)
+        order = []
+        with scheduler.admit():
+            threads = []
+            for name in ["a", "b", "c"]:
+
+                def worker(name=name):
+                    with scheduler.admit(priority=PRIORITY_BATCH):
+                        order.append(name)
+
+                thread = threading.Thread(target=worker)
+                thread.start()
+                threads.append(thread)
+                time.sleep(0.02)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ["a", "b", "c"])
+
+    def test_aging_prevents_starvation(self):
+        """测试排队足够久的批量请求优先级提升"""
+        scheduler = AdmissionScheduler(max_concurrency=1, aging=0.01)
+        order = []
+        with scheduler.admit():
+            threads = self.run_waiters(
+                scheduler, [PRIORITY_BATCH, PRIORITY_INTERACTIVE], order
+            )
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [PRIORITY_BATCH, PRIORITY_INTERACTIVE])
+
+    def test_token_budget(self):
+        """测试令牌预算用完后等待补充"""
+        scheduler = AdmissionScheduler(max_concurrency=0, tokens_per_minute=6000)
+        with scheduler.admit(tokens=6000):
+            pass
+        start = time.monotonic()
+        with scheduler.admit(tokens=20):
+            pass
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        self.assertEqual(scheduler.get_stats()["tokens"], 6020)
+
+    def test_oversized_request_is_capped(self):
+        """测试超过一分钟预算的请求最多消耗一整桶令牌"""
+        scheduler = AdmissionScheduler(max_concurrency=0, tokens_per_minute=100)
+        with scheduler.admit(tokens=10000):
+            pass
+        self.assertEqual(scheduler.get_stats()["tokens_available"], 0)
+
+    def test_queue_timeout(self):
+        """测试排队超时抛出 QueueTimeout"""
+        scheduler = AdmissionScheduler(max_concurrency=1, timeout=0.05)
+        with scheduler.admit():
+            with self.assertRaises(QueueTimeout) as context:
+                with scheduler.admit():
+                    pass
+        self.assertIsInstance(context.exception, UpstreamRejected)
+        self.assertGreater(context.exception.retry_after, 0)
+        stats = scheduler.get_stats()
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["waiting"], 0)
+        self.assertIsNotNone(stats["queue_wait"]["standard"]["p50_ms"])
+
+    def test_async_waiters_share_queue(self):
+        """测试协程在事件循环中排队，与线程共用名额，线程释放名额后被唤醒"""
+        scheduler = AdmissionScheduler(max_concurrency=1, aging=0)
+        order = []
+
+        async def waiter(name, priority):
+            async with scheduler.admit_async(priority=priority):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            held = threading.Event()
+            release = threading.Event()
+
+            def hold():
+                with scheduler.admit():
+                    held.set()
+                    release.wait(5)
+
+            thread = threading.Thread(target=hold)
+            thread.start()
+            held.wait(5)
+            tasks = [
+                asyncio.create_task(waiter("batch", PRIORITY_BATCH)),
+                asyncio.create_task(waiter("interactive", PRIORITY_INTERACTIVE)),
+            ]
+            await asyncio.sleep(0.02)
+            self.assertEqual(scheduler.get_stats()["waiting"], 2)
+            release.set()
+            await asyncio.gather(*tasks)
+            thread.join()
+
+        asyncio.run(run())
+        self.assertEqual(order, ["interactive", "batch"])
+        self.assertEqual(scheduler.get_stats()["in_flight"], 0)
+
+    def test_async_cancel_and_timeout(self):
+        """测试排队中的协程被取消时离开队列，排队超时抛出 QueueTimeout"""
+        scheduler = AdmissionScheduler(max_concurrency=1, timeout=0.05)
+
+        async def admit():
+            async with scheduler.admit_async():
+                pass
+
+        async def run():
+            async with scheduler.admit_async():
+                task = asyncio.create_task(admit())
+                await asyncio.sleep(0.01)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                self.assertEqual(scheduler.get_stats()["waiting"], 0)
+                with self.assertRaises(QueueTimeout):
+                    await admit()
+            await admit()
+
+        asyncio.run(run())
+        stats = scheduler.get_stats()
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertEqual(stats["timeouts"], 1)
+
+    def test_global_cap_across_processes(self):
+        """测试另一个进程占用全部全局名额时排队超时"""
+        lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_dir, True)
+        context = multiprocessing.get_context("fork")
+        ready, release = context.Event(), context.Event()
+        process = context.Process(
+            target=hold_global_slot, args=(lock_dir, ready, release)
+        )
+        process.start()
+        try:
+            self.assertTrue(ready.wait(5))
+            scheduler = AdmissionScheduler(
+                max_concurrency=0,
+                global_concurrency=1,
+                lock_dir=lock_dir,
+                timeout=0.05,
+            )
+            with self.assertRaises(QueueTimeout):
+                with scheduler.admit():
+                    pass
+            release.set()
+            process.join(5)
+            scheduler.timeout = 1
+            with scheduler.admit():
+                pass
+        finally:
+            release.set()
+            process.join(5)
+
+    def test_priority_propagates_to_chunk_threads(self):
+        """测试分块并发翻译的线程继承调用方的优先级"""
+        with request_priority(PRIORITY_BATCH):
+            priorities = run_bounded(lambda _: current_priority(), range(3), 3)
+        self.assertEqual(priorities, [PRIORITY_BATCH] * 3)
+        self.assertEqual(current_priority(), PRIORITY_STANDARD)
+
+
+class TestTranslatorAdmission(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        translation_cache.clear()
+        self.fake = FakeUpstream(content="你好").start()
+        self.scheduler = AdmissionScheduler(max_concurrency=1, timeout=0.05)
+        router = ProviderRouter([Provider("fake", self.fake.url, "test")])
+        self.patches = [
+            patch("app.services.translator.provider_router", router),
+            patch("app.services.translator.upstream", ResilientUpstream(retries=0)),
+            patch("app.services.translator.upstream_scheduler", self.scheduler),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+        self.app = create_app()
+        self.app.testing = True
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        """测试后清理"""
+        for patcher in self.patches:
+            patcher.stop()
+        self.fake.stop()
+
+    def translate(self, text, path="/api/v1/translate"):
+        return self.client.post(
+            path, data=json.dumps({"text": text}), content_type="application/json"
+        )
+
+    def test_requests_are_admitted(self):
+        """测试上游请求经过准入调度并统计令牌"""
+        self.assertEqual(self.translate("Hello").status_code, 200)
+        stats = self.scheduler.get_stats()
+        self.assertEqual(stats["admitted"], 1)
+        self.assertGreaterEqual(stats["tokens"], OUTPUT_TOKENS_MIN)
+        self.assertLess(stats["tokens"], 3000)
+
+    def test_queue_timeout_returns_503(self):
+        """测试排队超时时返回 503 和 Retry-After"""
+        with self.scheduler.admit():
+            response = self.translate("Hello")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response.headers)
+        self.assertEqual(self.fake.requests, 0)
+
+    def test_stream_queue_timeout_emits_error(self):
+        """测试流式请求排队超时时返回带 retry_after 的错误数据块"""
+        with self.scheduler.admit():
+            response = self.translate("Hello", path="/api/v2/translate")
+            body = response.data.decode("utf-8")
+        events = [
+            json.loads(line[len("data: ") :])
+            for line in body.split("\n\n")
+            if line.startswith("data: {")
+        ]
+        self.assertEqual(events[0]["type"], "error")
+        self.assertIn("retry_after", events[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
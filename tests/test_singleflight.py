@@ -0,0 +1,259 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import multiprocessing
+import tempfile
+import shutil
+import threading
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.singleflight import (
+    SingleFlight,
+    StreamBroadcaster,
+    worker_lock,
+    get_coalescing_stats,
+)
+from app.services.translator import (
+    translate_with_vocabulary,
+    translate_with_vocabulary_stream,
+)
+from app.services.cache import translation_cache
+
+KEY = "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"
+
+
+def hold_lock(lock_dir, ready, release):
+    """在子进程中持有锁，直到父进程通知释放"""
+    with worker_lock(KEY, lock_dir, timeout=5):
+        ready.set()
+        release.wait(5)
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_calls_share_result(self):
+        """测试相同键的并发调用只执行一次"""
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def work():
+            calls.append(1)
+            started.set()
+            time.sleep(0.05)
+            return "result"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("k", work)))
+        leader.start()
+        started.wait(1)
+        followers = [
+            threading.Thread(target=lambda: results.append(flight.do("k", work)))
+            for _ in range(3)
+        ]
+        for thread in followers:
+            thread.start()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(results, ["result"] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.get_stats()["coalesced"], 3)
+        self.assertEqual(flight.get_stats()["in_flight"], 0)
+
+    def test_error_shared_and_next_call_retries(self):
+        """测试异常传给所有等待者，之后的调用重新执行"""
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError("失败")
+
+        with self.assertRaises(ValueError):
+            flight.do("k", fail)
+        self.assertEqual(flight.do("k", lambda: "ok"), "ok")
+
+
+class TestStreamBroadcaster(unittest.TestCase):
+
+    def test_late_joiner_replays_buffered_events(self):
+        """测试后到的订阅者先回放已缓冲的数据块，再接收后续数据块"""
+        broadcaster = StreamBroadcaster()
+        gate = threading.Event()
+        calls = []
+
+        def factory():
+            calls.append(1)
+            yield 1
+            yield 2
+            gate.wait(1)
+            yield 3
+            return "done"
+
+        def consume(generator, output):
+            output["result"] = yield from generator
+
+        first = {}
+        first_events = consume(broadcaster.subscribe("k", factory), first)
+        self.assertEqual(next(first_events), 1)
+        self.assertEqual(next(first_events), 2)
+
+        second = {}
+        second_events = consume(broadcaster.subscribe("k", factory), second)
+        self.assertEqual(next(second_events), 1)
+        self.assertEqual(next(second_events), 2)
+
+        gate.set()
+        self.assertEqual(list(first_events), [3])
+        self.assertEqual(list(second_events), [3])
+        self.assertEqual(first["result"], "done")
+        self.assertEqual(second["result"], "done")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(broadcaster.get_stats()["coalesced"], 1)
+
+    def test_upstream_abandoned_when_all_subscribers_leave(self):
+        """测试所有订阅者断开后停止读取上游"""
+        broadcaster = StreamBroadcaster()
+        closed = threading.Event()
+
+        def factory():
+            try:
+                while True:
+                    yield "token"
+                    time.sleep(0.01)
+            finally:
+                closed.set()
+
+        events = broadcaster.subscribe("k", factory)
+        next(events)
+        events.close()
+
+        self.assertTrue(closed.wait(1))
+        self.assertEqual(broadcaster.get_stats()["abandoned"], 1)
+        self.assertEqual(broadcaster.get_stats()["in_flight"], 0)
+
+    def test_error_raised_to_subscribers(self):
+        """测试上游异常传给订阅者"""
+        broadcaster = StreamBroadcaster()
+
+        def factory():
+            yield 1
+            raise RuntimeError("上游失败")
+
+        events = broadcaster.subscribe("k", factory)
+        with self.assertRaises(RuntimeError):
+            list(events)
+
+
+class TestWorkerLock(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        self.lock_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.lock_dir)
+
+    def test_disabled_without_lock_dir(self):
+        """测试未配置目录时不加锁"""
+        with worker_lock(KEY, "") as waited:
+            self.assertFalse(waited)
+
+    def test_waits_for_other_process(self):
+        """测试其他进程持有相同键的锁时等待"""
+        context = multiprocessing.get_context("fork")
+        ready = context.Event()
+        release = context.Event()
+        process = context.Process(
+            target=hold_lock, args=(self.lock_dir, ready, release)
+        )
+        process.start()
+        try:
+            self.assertTrue(ready.wait(5))
+            threading.Timer(0.1, release.set).start()
+            start = time.monotonic()
+            with worker_lock(KEY, self.lock_dir, timeout=5) as waited:
+                self.assertTrue(waited)
+            self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+            # 其他键不受影响
+            with worker_lock("0" * 64, self.lock_dir, timeout=5) as waited:
+                self.assertFalse(waited)
+        finally:
+            release.set()
+            process.join(5)
+
+
+class TestTranslatorCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        translation_cache.clear()
+
+    @patch("app.services.upstream_client.post")
+    def test_identical_requests_call_upstream_once(self, mock_post):
+        """测试相同的并发翻译请求只调用一次上游"""
+        started = threading.Event()
+
+        def post(*args, **kwargs):
+            started.set()
+            time.sleep(0.1)
+            response = MagicMock()
+            response.json.return_value = {"choices": [{"message": {"content": "你好"}}]}
+            return response
+
+        mock_post.side_effect = post
+        coalesced = get_coalescing_stats()["translations"]["coalesced"]
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(translate_with_vocabulary("Hi there"))
+            )
+            for _ in range(3)
+        ]
+        threads[0].start()
+        started.wait(1)
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [("你好", [])] * 3)
+        mock_post.assert_called_once()
+        self.assertEqual(
+            get_coalescing_stats()["translations"]["coalesced"], coalesced + 2
+        )
+
+    @patch("app.services.upstream_client.post")
+    def test_identical_streams_share_upstream(self, mock_post):
+        """测试相同的并发流式请求共享一个上游流"""
+        gate = threading.Event()
+
+        def iter_lines():
+            yield b'data: {"choices": [{"delta": {"content": "Hello"}}]}'
+            gate.wait(1)
+            yield b'data: {"choices": [{"delta": {"content": " world"}}]}'
+            yield b"data: [DONE]"
+
+        mock_response = MagicMock()
+        mock_response.__enter__.return_value = mock_response
+        mock_response.iter_lines.side_effect = iter_lines
+        mock_post.return_value = mock_response
+
+        first = translate_with_vocabulary_stream("Hello world")
+        self.assertEqual(next(first)["translation"], "Hello")
+        second = translate_with_vocabulary_stream("Hello world")
+        self.assertEqual(next(second)["translation"], "Hello")
+        gate.set()
+
+        for events in (list(first), list(second)):
+            self.assertEqual(events[0]["translation"], " world")
+            self.assertEqual(events[-1]["type"], "complete")
+        mock_post.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+from unittest.mock import patch
+import threading
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.stream_mux import OrderedStreamMux
+from app.services.translator import translate_with_vocabulary_stream
+from app.services.cache import translation_cache
+
+
+def make_stream(pieces, delay=0.0, error_after=None):
+    def run():
+        for index, piece in enumerate(pieces):
+            if error_after is not None and index == error_after:
+                raise RuntimeError("upstream failed")
+            time.sleep(delay)
+            yield {"type": "chunk", "translation": piece}
+
+    return run
+
+
+class TestStreamMux(unittest.TestCase):
+
+    def test_output_in_order(self):
+        """测试后面的分块先完成时仍按顺序输出"""
+        mux = OrderedStreamMux(
+            [
+                make_stream(["a1", "a2"], delay=0.03),
+                make_stream(["b1", "b2"]),
+                make_stream(["c1"]),
+            ]
+        )
+        events = [event["translation"] for event in mux]
+        self.assertEqual(events, ["a1", "a2", "b1", "b2", "c1"])
+
+    def test_total_latency_close_to_slowest_chunk(self):
+        """测试总耗时接近最慢的分块而不是之和"""
+        streams = [make_stream(["x"] * 5, delay=0.02) for _ in range(4)]
+        start = time.monotonic()
+        list(OrderedStreamMux(streams, concurrency=4))
+        self.assertLess(time.monotonic() - start, 0.3)
+
+    def test_buffer_is_bounded(self):
+        """测试非当前分块的缓冲区有上限"""
+        release = threading.Event()
+
+        def slow_head():
+            release.wait(1)
+            yield {"type": "chunk", "translation": "head"}
+
+        mux = OrderedStreamMux(
+            [slow_head, make_stream([str(i) for i in range(50)])],
+            max_buffered_events=5,
+        )
+        iterator = iter(mux)
+        time.sleep(0.05)
+        self.assertLessEqual(len(mux._buffers[1]), 5)
+        release.set()
+        self.assertEqual(len(list(iterator)), 51)
+
+    def test_fallback_replaces_undelivered_chunk(self):
+        """测试未输出的分块出错时使用 fallback 替换"""
+        mux = OrderedStreamMux(
+            [make_stream(["a"], delay=0.03), make_stream(["b1", "b2"], error_after=1)],
+            fallback=lambda index: [{"type": "chunk", "translation": "B"}],
+        )
+        events = [event["translation"] for event in mux]
+        self.assertEqual(events, ["a", "B"])
+        self.assertEqual(mux.failed, set())
+
+    def test_error_after_delivery(self):
+        """测试已输出的分块出错时输出 error 数据块并继续"""
+        release = threading.Event()
+
+        def head():
+            yield {"type": "chunk", "translation": "a1"}
+            release.wait(1)
+            raise RuntimeError("upstream failed")
+
+        mux = OrderedStreamMux(
+            [head, make_stream(["b"])],
+            fallback=lambda index: [{"type": "chunk", "translation": "A"}],
+        )
+        iterator = iter(mux)
+        self.assertEqual(next(iterator)["translation"], "a1")
+        release.set()
+        rest = list(iterator)
+        self.assertEqual(rest[0]["type"], "error")
+        self.assertEqual(rest[0]["chunk"], 0)
+        self.assertEqual(rest[1]["translation"], "b")
+        self.assertEqual(mux.failed, {0})
+
+    @patch("app.services.translator.TRANSLATION_CHUNK_TOKENS", 10)
+    @patch("app.services.translator.stream_chunk")
+    def test_translator_streams_chunks_in_order(self, mock_stream_chunk):
+        """测试长文本流式翻译按分块顺序输出并合并词汇表"""
+        translation_cache.clear()
+
+        def fake_stream_chunk(text, include_vocabulary):
+            yield {"type": "chunk", "translation": f"[{text}]"}
+            yield {"type": "chunk", "vocabulary": "[...]"}
+            return f"[{text}]", [{"english": "Term", "chinese": "术语"}], True
+
+        mock_stream_chunk.side_effect = fake_stream_chunk
+
+        text = "First sentence is long enough. Second sentence is long enough."
+        chunks = list(translate_with_vocabulary_stream(text, "json", True))
+
+        self.assertEqual(chunks[0]["translation"], "[First sentence is long enough.]")
+        self.assertEqual(chunks[1]["translation"], "[Second sentence is long enough.]")
+        self.assertIn("Term", chunks[2]["vocabulary"])
+        self.assertEqual(chunks[-1]["type"], "complete")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import random
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.stream_parser import SeparatorStreamParser, VocabularyStreamParser
+from app.services.translator import SEPARATOR
+
+
+def run_parser(pieces, detect_separator=True):
+    """依次输入所有片段，返回 (翻译片段拼接, 词汇片段拼接, 数据块列表, 解析器)"""
+    parser = SeparatorStreamParser(SEPARATOR, detect_separator)
+    events = []
+    for piece in pieces:
+        events.extend(parser.feed(piece))
+    events.extend(parser.finish())
+    translation = "".join(event.get("translation", "") for event in events)
+    vocabulary = "".join(event.get("vocabulary", "") for event in events)
+    return translation, vocabulary, events, parser
+
+
+def random_split(text, rng):
+    """把文本随机切分为若干片段"""
+    pieces = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 6)
+        pieces.append(text[position : position + size])
+        position += size
+    return pieces
+
+
+class TestSeparatorStreamParser(unittest.TestCase):
+
+    TRANSLATION = "机器学习是人工智能的一个分支 == 不是分隔符 ="
+    VOCABULARY = '[{"english": "Machine Learning", "chinese": "机器学习"}]'
+
+    def test_separator_split_at_every_position(self):
+        """测试分隔符在每个位置被拆分到两个片段时都能正确识别"""
+        content = self.TRANSLATION + SEPARATOR + self.VOCABULARY
+        separator_start = len(self.TRANSLATION)
+        for offset in range(len(SEPARATOR) + 1):
+            cut = separator_start + offset
+            translation, vocabulary, _, parser = run_parser(
+                [content[:cut], content[cut:]]
+            )
+            self.assertEqual(translation, self.TRANSLATION, offset)
+            self.assertEqual(vocabulary, self.VOCABULARY, offset)
+            self.assertTrue(parser.found_separator)
+
+    def test_separator_split_into_single_characters(self):
+        """测试逐字符输入"""
+        content = self.TRANSLATION + SEPARATOR + self.VOCABULARY
+        translation, vocabulary, events, _ = run_parser(list(content))
+        self.assertEqual(translation, self.TRANSLATION)
+        self.assertEqual(vocabulary, self.VOCABULARY)
+        for event in events:
+            self.assertNotIn("==Terms", event.get("translation", ""))
+
+    def test_random_tokenizations(self):
+        """测试随机切分的片段（属性测试）"""
+        rng = random.Random(20240101)
+        alphabet = "ab=T=erms中文 "
+        for _ in range(500):
+            before = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+            # 分隔符必须第一次出现在 before 之后
+            if (before + SEPARATOR).find(SEPARATOR) != len(before):
+                continue
+            after = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+            content = before + SEPARATOR + after
+            translation, vocabulary, _, parser = run_parser(random_split(content, rng))
+            self.assertEqual(translation, before)
+            self.assertEqual(vocabulary, after)
+            self.assertEqual(parser.content, content)
+
+    def test_no_separator_flushes_pending(self):
+        """测试没有分隔符时结束后输出剩余内容"""
+        translation, vocabulary, _, parser = run_parser(["结果 =", "=Ter"])
+        self.assertEqual(translation, "结果 ==Ter")
+        self.assertEqual(vocabulary, "")
+        self.assertFalse(parser.found_separator)
+
+    def test_pass_through_without_detection(self):
+        """测试不检测分隔符时直接透传"""
+        _, _, events, _ = run_parser(["Hello", ", ", "world"], detect_separator=False)
+        self.assertEqual(
+            [event["translation"] for event in events], ["Hello", ", ", "world"]
+        )
+
+    def test_text_is_released_early(self):
+        """测试不可能构成分隔符的内容立即输出"""
+        parser = SeparatorStreamParser(SEPARATOR)
+        self.assertEqual(
+            parser.feed("你好"), [{"type": "chunk", "translation": "你好"}]
+        )
+        self.assertEqual(parser.feed("，=="), [{"type": "chunk", "translation": "，"}])
+
+
+class TestVocabularyStreamParser(unittest.TestCase):
+
+    def test_terms_emitted_when_object_closes(self):
+        """测试每个对象的右花括号到达时立即输出词汇"""
+        parser = VocabularyStreamParser()
+        self.assertEqual(parser.feed('[{"english": "A", "chinese": "甲", '), [])
+        terms = parser.feed('"explanation": "说明"}, {"english": "B"')
+        self.assertEqual(
+            terms, [{"english": "A", "chinese": "甲", "explanation": "说明"}]
+        )
+        terms = parser.feed(', "chinese": "乙", "explanation": ""}]')
+        self.assertEqual(terms[0]["english"], "B")
+        self.assertEqual(len(parser.terms), 2)
+
+    def test_character_by_character(self):
+        """测试逐字符输入，字符串中的花括号和转义引号不影响解析"""
+        content = '```json\n[{"english": "a {b}", "chinese": "\\"引号\\"", "explanation": "x"}]\n```'
+        parser = VocabularyStreamParser()
+        terms = []
+        for char in content:
+            terms.extend(parser.feed(char))
+        self.assertEqual(len(terms), 1)
+        self.assertEqual(terms[0]["english"], "a {b}")
+        self.assertEqual(terms[0]["chinese"], '"引号"')
+
+    def test_common_glitches(self):
+        """测试尾随逗号、缺失右方括号等常见问题"""
+        parser = VocabularyStreamParser()
+        parser.feed('[{"english": "A", "chinese": "甲",},, {"english": "B"}')
+        self.assertEqual([term["english"] for term in parser.terms], ["A", "B"])
+        self.assertEqual(parser.terms[1]["explanation"], "")
+
+    def test_invalid_object_counted(self):
+        """测试无法解析的对象计入失败数"""
+        parser = VocabularyStreamParser()
+        self.assertEqual(parser.feed("[{english: A}]"), [])
+        self.assertEqual(parser.failures, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
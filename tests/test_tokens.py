@@ -0,0 +1,136 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tests.fake_upstream import FakeUpstream
+from app.services.providers import Provider, ProviderRouter
+from app.services.resilience import ResilientUpstream
+from app.services.cache import translation_cache
+from app.services.tokens import (
+    OUTPUT_TOKENS_MIN,
+    OUTPUT_TOKENS_MAX,
+    VOCABULARY_OUTPUT_TOKENS,
+    estimate_tokens,
+    output_token_budget,
+    get_token_stats,
+)
+from app.services.translator import (
+    translate_with_vocabulary,
+    translate_with_vocabulary_stream,
+)
+
+
+class TestEstimateTokens(unittest.TestCase):
+
+    def test_english_words(self):
+        """测试英文按单词计数，标点单独计数"""
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("one two three four"), 4)
+        self.assertEqual(estimate_tokens("Hello, world!"), 4)
+
+    def test_long_words_and_numbers(self):
+        """测试长单词和多位数字按多个令牌计数"""
+        self.assertEqual(estimate_tokens("internationalization"), 2)
+        self.assertEqual(estimate_tokens("1234567"), 3)
+
+    def test_cjk(self):
+        """测试中文字符按 0.6 个令牌计数"""
+        self.assertEqual(estimate_tokens("机器学习"), 3)
+        self.assertEqual(estimate_tokens("机器学习 machine learning"), 5)
+
+    def test_other_characters(self):
+        """测试其他非 ASCII 字符按一个字符一个令牌计数"""
+        self.assertEqual(estimate_tokens("é"), 1)
+
+
+class TestOutputTokenBudget(unittest.TestCase):
+
+    def test_short_text_uses_minimum(self):
+        """测试短文本使用最小输出预算"""
+        self.assertEqual(output_token_budget("Hello"), OUTPUT_TOKENS_MIN)
+
+    def test_budget_grows_with_input(self):
+        """测试输出预算随输入长度增长"""
+        short = output_token_budget("word " * 200)
+        longer = output_token_budget("word " * 400)
+        self.assertGreater(short, OUTPUT_TOKENS_MIN)
+        self.assertGreater(longer, short)
+
+    def test_vocabulary_reserve(self):
+        """测试需要词汇表时预留额外的输出令牌"""
+        text = "word " * 400
+        self.assertEqual(
+            output_token_budget(text, include_vocabulary=True),
+            output_token_budget(text) + VOCABULARY_OUTPUT_TOKENS,
+        )
+
+    def test_budget_is_capped(self):
+        """测试输出预算不超过上限"""
+        self.assertEqual(output_token_budget("word " * 100000), OUTPUT_TOKENS_MAX)
+
+
+class TestContinuation(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        translation_cache.clear()
+        self.max_tokens = []
+
+        def content(payload):
+            self.max_tokens.append(payload["max_tokens"])
+            return "这是一段需要多次续写才能完整返回的译文。"
+
+        self.fake = FakeUpstream(content=content, max_output_chars=8).start()
+        router = ProviderRouter([Provider("fake", self.fake.url, "test")])
+        self.patches = [
+            patch("app.services.translator.provider_router", router),
+            patch("app.services.translator.upstream", ResilientUpstream(retries=0)),
+            patch("app.services.translator.TRANSLATION_MAX_CONTINUATIONS", 3),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        """测试后清理"""
+        for patcher in self.patches:
+            patcher.stop()
+        self.fake.stop()
+
+    def test_truncated_response_is_continued(self):
+        """测试输出被截断时续写并拼接完整译文"""
+        before = get_token_stats()["continuations"]
+        translation, _ = translate_with_vocabulary("Hello")
+        self.assertEqual(translation, "这是一段需要多次续写才能完整返回的译文。")
+        self.assertEqual(self.fake.requests, 3)
+        self.assertEqual(get_token_stats()["continuations"] - before, 2)
+        self.assertEqual(self.max_tokens[0], OUTPUT_TOKENS_MIN)
+
+    def test_gives_up_after_max_continuations(self):
+        """测试续写次数用完后返回不完整的结果"""
+        self.fake.max_output_chars = 4
+        before = get_token_stats()["incomplete"]
+        translation, _ = translate_with_vocabulary("Hello")
+        self.assertEqual(translation, "这是一段需要多次续写才能完整返回")
+        self.assertEqual(self.fake.requests, 4)
+        self.assertEqual(get_token_stats()["incomplete"] - before, 1)
+
+    def test_stream_is_continued(self):
+        """测试流式输出被截断时续写，新内容接着输出"""
+        events = list(translate_with_vocabulary_stream("Hello stream"))
+        translation = "".join(event.get("translation", "") for event in events)
+        self.assertEqual(translation, "这是一段需要多次续写才能完整返回的译文。")
+        self.assertEqual(self.fake.requests, 3)
+        self.assertEqual(events[-1]["type"], "complete")
+
+    def test_incomplete_stream_is_not_cached(self):
+        """测试续写次数用完的流式结果不写入缓存"""
+        self.fake.max_output_chars = 4
+        list(translate_with_vocabulary_stream("Hello incomplete"))
+        list(translate_with_vocabulary_stream("Hello incomplete"))
+        self.assertEqual(self.fake.requests, 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import unittest
+import io
+import json
+import time
+import queue
+import logging
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app
+from app.services import tracing
+from app.services.stream_mux import OrderedStreamMux
+from app.services.translator import parse_stream_line
+from app.services.tracing import (
+    BoundedQueueHandler,
+    JsonFormatter,
+    RequestIdFilter,
+    current_request_id,
+    get_tracing_stats,
+    request_context,
+    span,
+)
+
+
+class TestRequestId(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.client = self.app.test_client()
+
+    def test_request_id_generated(self):
+        """测试未传入请求 ID 时生成新的 ID 并在响应头中返回"""
+        response = self.client.get("/healthz")
+        self.assertRegex(response.headers["X-Request-ID"], r"^[0-9a-f]{16}$")
+
+    def test_request_id_echoed(self):
+        """测试沿用客户端传入的合法请求 ID"""
+        response = self.client.get("/healthz", headers={"X-Request-ID": "abc-123"})
+        self.assertEqual(response.headers["X-Request-ID"], "abc-123")
+
+    def test_invalid_request_id_replaced(self):
+        """测试不合法的请求 ID 被替换"""
+        response = self.client.get(
+            "/healthz", headers={"X-Request-ID": "bad id;" + "x" * 100}
+        )
+        self.assertRegex(response.headers["X-Request-ID"], r"^[0-9a-f]{16}$")
+
+    def test_stats_include_tracing(self):
+        """测试 /stats 包含追踪统计"""
+        stats = self.client.get("/stats").get_json()
+        self.assertIn("spans", stats["tracing"])
+
+    def test_request_id_propagates_to_stream_threads(self):
+        """测试流合并的读取线程继承请求 ID"""
+        seen = []
+
+        def stream():
+            seen.append(current_request_id())
+            yield {"type": "translation", "content": "x"}
+
+        with request_context("req-1"):
+            list(OrderedStreamMux([stream, stream], concurrency=2))
+        self.assertEqual(seen, ["req-1", "req-1"])
+
+
+class TestSpan(unittest.TestCase):
+
+    def test_span_recorded_when_sampled(self):
+        """测试采样的请求记录耗时分段并输出结构化日志"""
+        with request_context("req-span", sample_rate=1):
+            with self.assertLogs("app.trace", level="INFO") as logs:
+                with span("test_sampled", chars=3):
+                    pass
+        record = logs.records[0]
+        self.assertEqual(record.trace["span"], "test_sampled")
+        self.assertEqual(record.trace["chars"], 3)
+        self.assertEqual(get_tracing_stats()["spans"]["test_sampled"]["count"], 1)
+
+    def test_span_noop_when_not_sampled(self):
+        """测试未采样的请求不记录耗时分段"""
+        with request_context("req-skip", sample_rate=0):
+            with span("test_unsampled"):
+                pass
+        self.assertNotIn("test_unsampled", get_tracing_stats()["spans"])
+
+    def test_span_records_error(self):
+        """测试分段内抛出异常时记录异常类型"""
+        with request_context(sample_rate=1):
+            with self.assertLogs("app.trace", level="INFO") as logs:
+                with self.assertRaises(ValueError):
+                    with span("test_error"):
+                        raise ValueError("boom")
+        self.assertEqual(logs.records[0].trace["error"], "ValueError")
+
+
+class TestQueueLogging(unittest.TestCase):
+
+    def make_record(self, message="hello"):
+        return logging.LogRecord(
+            "test", logging.WARNING, __file__, 1, message, (), None
+        )
+
+    def test_filter_adds_request_id(self):
+        """测试过滤器在产生日志的上下文中写入请求 ID"""
+        record = self.make_record()
+        with request_context("req-log"):
+            RequestIdFilter().filter(record)
+        self.assertEqual(record.request_id, "req-log")
+
+    def test_json_formatter(self):
+        """测试 JSON 格式输出请求 ID 和追踪字段"""
+        record = self.make_record("文本长度: %s")
+        record.args = (5,)
+        record.request_id = "req-json"
+        record.trace = {"span": "prompt_build"}
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["message"], "文本长度: 5")
+        self.assertEqual(entry["request_id"], "req-json")
+        self.assertEqual(entry["trace"]["span"], "prompt_build")
+
+    def test_queue_handler_drops_when_full(self):
+        """测试队列已满时丢弃日志而不阻塞"""
+        handler = BoundedQueueHandler(queue.SimpleQueue(), maxsize=2)
+        dropped = get_tracing_stats()["log_dropped"]
+        for _ in range(5):
+            handler.handle(self.make_record())
+        self.assertEqual(handler.queue.qsize(), 2)
+        self.assertEqual(get_tracing_stats()["log_dropped"] - dropped, 3)
+
+    def test_listener_writes_records(self):
+        """测试后台线程写出队列中的日志"""
+        stream = io.StringIO()
+        listener = tracing._Listener([tracing.create_log_handler(stream, "json")])
+        listener.start()
+        handler = BoundedQueueHandler(listener.queue)
+        handler.handle(self.make_record("queued"))
+        listener.stop()
+        for _ in range(100):
+            if stream.getvalue():
+                break
+            time.sleep(0.01)
+        self.assertEqual(json.loads(stream.getvalue())["message"], "queued")
+
+    def test_unparsable_line_not_logged(self):
+        """测试无法解析的响应行不输出原始内容"""
+        with self.assertLogs("app.services.translator", level="DEBUG") as logs:
+            self.assertIsNone(parse_stream_line(b"data: {secret"))
+        self.assertNotIn("secret", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import tempfile
+import shutil
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.translation_memory import (
+    TranslationMemory,
+    split_segments,
+    join_segments,
+)
+from app.services.translator import (
+    translate_with_vocabulary,
+    split_batch_translation,
+)
+from app.services.cache import translation_cache
+
+
+class TestTranslationMemory(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        self.test_dir = tempfile.mkdtemp()
+        self.memory = TranslationMemory(os.path.join(self.test_dir, "tm.db"))
+        translation_cache.clear()
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.test_dir)
+
+    def test_split_and_join_segments(self):
+        """测试句段切分和按原顺序拼接"""
+        text = "First sentence. Second one!\n\nNew paragraph?"
+        segments = split_segments(text)
+        self.assertEqual(
+            [segment for segment, _ in segments],
+            ["First sentence.", "Second one!", "New paragraph?"],
+        )
+        joined = join_segments(
+            ["第一句。", "第二句！", "新段落？"], [s for _, s in segments]
+        )
+        self.assertEqual(joined, "第一句。第二句！\n\n新段落？")
+
+    def test_only_missing_segments_are_translated(self):
+        """测试只翻译未命中的句段"""
+        translate = MagicMock(
+            side_effect=lambda segments: [f"译:{s}" for s in segments]
+        )
+
+        self.memory.translate("One. Two.", translate, "model", "1")
+        translation = self.memory.translate("One. Three.", translate, "model", "1")
+
+        self.assertEqual(translation, "译:One.译:Three.")
+        self.assertEqual(translate.call_args_list[-1][0][0], ["Three."])
+        stats = self.memory.get_stats()
+        self.assertEqual(stats["segment_hits"], 1)
+        self.assertEqual(stats["segment_misses"], 3)
+
+    def test_eviction(self):
+        """测试超出容量时淘汰最久未使用的句段"""
+        memory = TranslationMemory(os.path.join(self.test_dir, "small.db"), 2)
+        translate = lambda segments: [f"译:{s}" for s in segments]
+        memory.translate("One. Two. Three.", translate)
+        self.assertEqual(memory.get_stats()["evicted"], 1)
+
+    def test_misaligned_batch_returns_none(self):
+        """测试批量译文无法对齐时返回 None"""
+
+        def translate(segments):
+            return split_batch_translation("[[1]] 一", len(segments))
+
+        self.assertIsNone(self.memory.translate("One. Two.", translate))
+
+    @patch("app.services.upstream_client.post")
+    def test_translator_uses_memory(self, mock_post):
+        """测试翻译服务通过翻译记忆发送批量请求"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = {
+            "choices": [{"message": {"content": "[[1]] 一。\n[[2]] 二。"}}]
+        }
+        mock_post.return_value = mock_response
+
+        with patch("app.services.translator.translation_memory", self.memory):
+            translation, vocabulary = translate_with_vocabulary("One. Two.")
+
+        self.assertEqual(translation, "一。二。")
+        self.assertEqual(vocabulary, [])
+        _, kwargs = mock_post.call_args
+        self.assertIn("[[2]] Two.", kwargs["json"]["messages"][1]["content"])
+
+
+if __name__ == "__main__":
+    unittest.main()
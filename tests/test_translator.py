@@ -12,11 +12,16 @@ from app.services.translator import (
     translate_with_vocabulary_stream,
     split_translation_vocabulary,
 )
+from app.services.cache import translation_cache
 
 
 class TestTranslator(unittest.TestCase):
 
-    @patch("app.services.translator.requests.post")
+    def setUp(self):
+        """测试前设置"""
+        translation_cache.clear()
+
+    @patch("app.services.upstream_client.post")
     def test_translate_text_success(self, mock_post):
         """测试翻译功能成功的情况"""
         # 设置模拟响应
@@ -35,7 +40,7 @@ class TestTranslator(unittest.TestCase):
         self.assertEqual(vocabulary, [])
         mock_post.assert_called_once()
 
-    @patch("app.services.translator.requests.post")
+    @patch("app.services.upstream_client.post")
     def test_translate_text_api_error(self, mock_post):
         """测试API返回错误的情况"""
         # 设置模拟响应
@@ -66,7 +71,7 @@ class TestTranslator(unittest.TestCase):
         self.assertEqual(translation, "")
         self.assertEqual(vocabulary, [])
 
-    @patch("app.services.translator.requests.post")
+    @patch("app.services.upstream_client.post")
     def test_translate_with_vocabulary(self, mock_post):
         """测试翻译并包含词汇表的情况"""
         # 设置模拟响应（包含词汇表部分）
@@ -97,7 +102,7 @@ class TestTranslator(unittest.TestCase):
         self.assertIn("自动学习", vocabulary[0]["explanation"])
         mock_post.assert_called_once()
 
-    @patch("app.services.translator.requests.post")
+    @patch("app.services.upstream_client.post")
     def test_translate_with_vocabulary_stream(self, mock_post):
         """测试流式翻译功能"""
         # 设置模拟流式响应
@@ -120,11 +125,78 @@ class TestTranslator(unittest.TestCase):
         chunks = list(translate_with_vocabulary_stream("Hello, world!"))
 
         # 验证结果
-        self.assertEqual(len(chunks), 2)  # 6个文本块 + 1个完成信号
+        self.assertEqual(len(chunks), 5)  # 4个文本块 + 1个完成信号
+        self.assertEqual(
+            "".join(chunk.get("translation", "") for chunk in chunks), "Hello, world!"
+        )
         self.assertEqual(chunks[-1]["type"], "complete")
         self.assertTrue(chunks[-1]["done"])
         mock_post.assert_called_once()
 
+    @patch("app.services.upstream_client.post")
+    def test_translate_uses_cache(self, mock_post):
+        """测试相同请求命中缓存，不再请求上游"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = {
+            "choices": [{"message": {"content": "你好，世界！"}}]
+        }
+        mock_post.return_value = mock_response
+
+        first = translate_with_vocabulary("Hello, world!")
+        second = translate_with_vocabulary("Hello, world!")
+
+        self.assertEqual(first, second)
+        mock_post.assert_called_once()
+
+    @patch("app.services.upstream_client.post")
+    def test_translate_stream_replays_cache(self, mock_post):
+        """测试流式翻译命中缓存时回放合成数据块"""
+        mock_response = MagicMock()
+        mock_response.json.return_value = {
+            "choices": [
+                {
+                    "message": {
+                        "content": '机器学习。==Terms==[{"english": "Machine Learning", "chinese": "机器学习", "explanation": "人工智能的一个分支"}]'
+                    }
+                }
+            ]
+        }
+        mock_post.return_value = mock_response
+        translate_with_vocabulary("Machine Learning.", include_vocabulary=True)
+
+        chunks = list(
+            translate_with_vocabulary_stream(
+                "Machine Learning.", include_vocabulary=True
+            )
+        )
+
+        mock_post.assert_called_once()
+        self.assertEqual(chunks[0], {"type": "chunk", "translation": "机器学习。"})
+        self.assertIn("Machine Learning", chunks[1]["vocabulary"])
+        self.assertEqual(chunks[-1]["type"], "complete")
+
+    @patch("app.services.upstream_client.post")
+    def test_translate_stream_emits_terms(self, mock_post):
+        """测试流式翻译在词汇对象完整到达时输出 term 数据块"""
+        mock_response = MagicMock()
+        mock_response.__enter__.return_value = mock_response
+        mock_response.iter_lines.return_value = [
+            b'data: {"choices": [{"delta": {"content": "Translation"}}]}',
+            b'data: {"choices": [{"delta": {"content": "==Ter"}}]}',
+            b'data: {"choices": [{"delta": {"content": "ms==[{\\"english\\": \\"A\\","}}]}',
+            b'data: {"choices": [{"delta": {"content": " \\"chinese\\": \\"B\\"}]"}}]}',
+            b"data: [DONE]",
+        ]
+        mock_post.return_value = mock_response
+
+        chunks = list(translate_with_vocabulary_stream("Text", include_vocabulary=True))
+
+        translation = "".join(chunk.get("translation", "") for chunk in chunks)
+        self.assertEqual(translation, "Translation")
+        terms = [chunk["term"] for chunk in chunks if chunk["type"] == "term"]
+        self.assertEqual(terms, [{"english": "A", "chinese": "B", "explanation": ""}])
+        self.assertEqual(chunks[-1]["type"], "complete")
+
     def test_split_translation_vocabulary(self):
         """测试分离翻译和词汇表功能的各种情况"""
         # 测试正常情况：包含有效词汇表
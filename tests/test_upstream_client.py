@@ -0,0 +1,78 @@
+import unittest
+from unittest.mock import patch
+import threading
+import sys
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services import upstream_client
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestUpstreamClient(unittest.TestCase):
+
+    def setUp(self):
+        """测试前设置"""
+        upstream_client.close_session()
+        upstream_client.reset_pool_stats()
+
+    def tearDown(self):
+        """测试后清理"""
+        upstream_client.close_session()
+
+    def test_session_reused_within_process(self):
+        """测试同一进程内复用会话"""
+        self.assertIs(upstream_client.get_session(), upstream_client.get_session())
+
+    def test_session_recreated_after_fork(self):
+        """测试进程ID变化（fork）后重建会话"""
+        session = upstream_client.get_session()
+        with patch("app.services.upstream_client.os.getpid", return_value=-1):
+            self.assertIsNot(upstream_client.get_session(), session)
+
+    def test_post_uses_default_timeout(self):
+        """测试未指定超时时使用默认超时"""
+        with patch.object(upstream_client.get_session(), "post") as mock_post:
+            upstream_client.post("http://example.com", json={})
+            _, kwargs = mock_post.call_args
+            self.assertEqual(kwargs["timeout"], upstream_client.get_timeout())
+
+    def test_connections_are_reused(self):
+        """测试 keep-alive 连接复用并统计命中"""
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/"
+            for _ in range(3):
+                response = upstream_client.post(url, json={"text": "hi"})
+                self.assertEqual(response.json(), {"ok": True})
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        stats = upstream_client.get_pool_stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()